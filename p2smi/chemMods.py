@@ -7,16 +7,45 @@ Speedups:
 - Bernoulli per-line decisions (no preselected index sets).
 - Precompiled regex patterns reused across lines.
 - O(L + #inserts) builders for string edits.
-- Single RDKit validation per final sequence.
+- At most one RDKit parse per record, after a cheap syntactic pre-check
+  (charset, bracket atoms, balanced branches, paired ring closures); with
+  --trust_input, records left unmodified are passed through unparsed.
+- --engine mol: sites found by SMARTS on the parsed molecule and edited through
+  RWMol (p2smi.utilities.molmods), for canonical or third-party SMILES.
+- --mod name[:rate=R,fraction=F] (repeatable): chain of registered
+  modification plugins (molmods.MODIFICATIONS) applied to one parse per record.
+- --enumerate: every N-methylation pattern (or k-subset) x PEG length per
+  input, from one site search, deduplicated and optionally capped.
+- Reproducible with --seed: every record draws from its own SeedSequence child
+  stream keyed by its record index, independent of how input is split.
+- Multiprocess mode (--procs N): chunks of input lines are modified in worker
+  processes and written back in input order; output matches --procs 1.
+- Threaded parsing (--threads N): input SMILES are parsed by RDKit's
+  MultithreadedSmilesMolSupplier in native threads and the molecules handed
+  to the editors, with no worker processes; output matches the serial run.
 """
 
 import argparse
 import math
 import random
 import re
+from functools import partial
+from multiprocessing import Pool
+
 from rdkit import Chem
 from rdkit import RDLogger
 
+from p2smi.utilities.molmods import (
+    MODIFICATIONS,
+    apply_modifications,
+    enumerate_variants,
+    modify_smiles,
+    parse_mod_spec,
+)
+from p2smi.utilities.parallel import iter_chunks, ordered_imap
+from p2smi.utilities.seeding import child_sequence, python_rng, root_sequence
+from p2smi.utilities.suppliers import iter_threaded_mols, require_threaded_supplier
+
 RDLogger.DisableLog("rdApp.*")  # quiet RDKit in batch
 
 # --- Precompiled patterns ---
@@ -24,12 +53,43 @@ RDLogger.DisableLog("rdApp.*")  # quiet RDKit in batch
 _AMIDE_N_PATTERN = re.compile(r"C\(=O\)N\[C@")
 # PEG insertion anchor: ... "CN)"  (insert PEG after 'CN')
 _PEG_ANCHOR_PATTERN = re.compile(r"CN\)")
+# SMILES pre-check: organic-subset/bracket atoms, bonds, branches, ring labels
+_SMILES_CHARSET = re.compile(
+    r"(?:Cl|Br|[BCNOPSFI]|[bcnops]|\*|\[[^\[\]]+\]|%\d\d|\d|[-=#$:/\\.~()])+"
+)
+_BRACKET_ATOM = re.compile(r"\[[^\[\]]*\]")
+_RING_LABEL = re.compile(r"%\d\d|\d")
 
 
 def is_valid_smiles(smiles: str) -> bool:
     return Chem.MolFromSmiles(smiles) is not None
 
 
+def smiles_syntax_ok(smiles: str) -> bool:
+    """
+    Cheap syntactic pre-check run before RDKit: allowed tokens only, no
+    whitespace, balanced branches and every ring-closure label paired.
+    Passing it does not mean the SMILES is chemically valid.
+    """
+    if not _SMILES_CHARSET.fullmatch(smiles):
+        return False
+    bare = _BRACKET_ATOM.sub("", smiles)
+    depth = 0
+    for ch in bare:
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+            if depth < 0:
+                return False
+    if depth:
+        return False
+    labels = {}
+    for label in _RING_LABEL.findall(bare):
+        labels[label] = labels.get(label, 0) ^ 1
+    return not any(labels.values())
+
+
 def _insert_many(base: str, inserts):
     """
     Insert multiple (idx, text) into base in a single pass.
@@ -47,7 +107,7 @@ def _insert_many(base: str, inserts):
     return "".join(out)
 
 
-def add_n_methylation(sequence: str, methylation_residue_fraction: float):
+def add_n_methylation(sequence: str, methylation_residue_fraction: float, rng=random):
     """
     Insert '(C)' after the amide N for a random subset of matches.
     We compute insertion indices once and build result in one pass.
@@ -62,14 +122,14 @@ def add_n_methylation(sequence: str, methylation_residue_fraction: float):
         return sequence, 0
 
     k = math.ceil(len(match_starts) * methylation_residue_fraction)
-    chosen = random.sample(match_starts, min(k, len(match_starts)))
+    chosen = rng.sample(match_starts, min(k, len(match_starts)))
     # Build list of (absolute) insertion points
     inserts = sorted(((pos + 6, "(C)") for pos in chosen), key=lambda x: x[0])
 
     return _insert_many(sequence, inserts), len(chosen)
 
 
-def add_pegylation(sequence: str):
+def add_pegylation(sequence: str, rng=random):
     """
     Insert a random-length PEG chain after a random 'CN)' anchor.
     PEG = O(CCO){1..4}C  (length picked uniformly)
@@ -78,8 +138,8 @@ def add_pegylation(sequence: str):
     if not anchors:
         return sequence, None
 
-    pos = random.choice(anchors)
-    peg = "O" + "CCO" * random.randint(1, 4) + "C"
+    pos = rng.choice(anchors)
+    peg = "O" + "CCO" * rng.randint(1, 4) + "C"
     # Insert right after 'CN' (i.e., after pos+2)
     insert_idx = pos + 2
     return _insert_many(sequence, [(insert_idx, peg)]), peg
@@ -100,26 +160,26 @@ def parse_input_lines(fp):
             # don’t validate here; do it once after modification
             yield (header, smi)
         else:
-            # bare SMILES or malformed
-            yield (
-                ("", line)
-                if Chem.MolFromSmiles(line) is not None
-                else ("[Malformed line]", None)
-            )
+            # bare SMILES or malformed; syntax only, RDKit runs once later
+            yield ("", line) if smiles_syntax_ok(line) else ("[Malformed line]", None)
 
 
 def modify_sequence(
-    sequence: str, do_methylate: bool, do_pegylate: bool, nmeth_residues: float
+    sequence: str,
+    do_methylate: bool,
+    do_pegylate: bool,
+    nmeth_residues: float,
+    rng=random,
 ):
     mods = []
     seq = sequence
 
     if do_methylate:
-        seq, methyl_count = add_n_methylation(seq, nmeth_residues)
+        seq, methyl_count = add_n_methylation(seq, nmeth_residues, rng)
         mods.append(f"N-methylation({methyl_count})")
 
     if do_pegylate:
-        seq, peg = add_pegylation(seq)
+        seq, peg = add_pegylation(seq, rng)
         if peg:
             mods.append(f"PEGylation({peg.count('CCO')})")
         else:
@@ -128,33 +188,165 @@ def modify_sequence(
     return seq, mods
 
 
-def process_sequences(fp, nmeth_rate: float, peg_rate: float, nmeth_residues: float):
+CHUNK_RECORDS = 2000  # input lines per worker task in --procs mode
+
+
+def process_sequences(
+    fp,
+    nmeth_rate: float,
+    peg_rate: float,
+    nmeth_residues: float,
+    seed=None,
+    procs: int = 1,
+    chunk_records: int = CHUNK_RECORDS,
+    trust_input: bool = False,
+    engine: str = "regex",
+    enumerate_all: bool = False,
+    enumerate_k=None,
+    max_variants=None,
+    plan=None,
+    threads: int = 0,
+):
     """
     Stream through file-like fp; decide per line via Bernoulli(p),
     apply edits, validate once, and yield output strings.
+    Record i draws only from child stream i of the run's root seed, so with
+    procs > 1 the output is identical to the single-process run.
+    trust_input skips the RDKit parse for records that come out unmodified.
+    engine "regex" edits the SMILES text; "mol" edits the parsed molecule.
+    enumerate_all replaces the random edits with enumerate_variants() output
+    (rates and seed are then ignored). plan, a list of (name, rate, fraction)
+    plugin steps, replaces the N-methylation/PEGylation rates.
+    threads > 0 parses the input in that many RDKit threads (instead of procs).
     """
-    for header, seq in parse_input_lines(fp):
+    if enumerate_all:
+        handle = partial(_enumerate_records, k=enumerate_k, max_variants=max_variants)
+    else:
+        handle = partial(
+            _modify_records,
+            root=root_sequence(seed),
+            nmeth_rate=nmeth_rate,
+            peg_rate=peg_rate,
+            nmeth_residues=nmeth_residues,
+            trust_input=trust_input,
+            engine=engine,
+            plan=plan,
+        )
+    if threads:
+        records = iter_threaded_mols(
+            parse_input_lines(fp), threads, threads * chunk_records
+        )
+        yield from handle(records, 0)
+        return
+    if procs <= 1:
+        yield from handle(parse_input_lines(fp), 0)
+        return
+
+    work = partial(_modify_chunk, handle=handle)
+    with Pool(processes=procs) as pool:
+        for lines in ordered_imap(
+            pool, work, _iter_line_chunks(fp, chunk_records), window=2 * procs
+        ):
+            yield from lines
+
+
+def _iter_line_chunks(fp, chunk_records):
+    # (start record index, non-empty input lines) chunks; record numbering
+    # matches parse_input_lines, which also skips blank lines
+    return iter_chunks((raw for raw in fp if raw.strip()), chunk_records)
+
+
+def _modify_chunk(chunk, handle):
+    # Worker task: parse and modify one chunk, returning its output lines
+    start, lines = chunk
+    return list(handle(parse_input_lines(lines), start))
+
+
+def _enumerate_records(records, start, k=None, max_variants=None):
+    # Expand each parsed record into its enumerated variants; records are
+    # (header, smiles) or, from the threaded reader, (header, smiles, mol)
+    for header, seq, *parsed in records:
+        if seq is None:
+            yield f"{header} [Skipped malformed line]"
+            continue
+        if not smiles_syntax_ok(seq):
+            yield f"{header} [Invalid SMILES skipped]"
+            continue
+        found = False
+        variants = enumerate_variants(
+            seq, k, max_variants=max_variants, mol=parsed[0] if parsed else None
+        )
+        for mods, variant in variants:
+            found = True
+            yield f"{header}[{' - '.join(mods)}]: {variant}"
+        if not found:
+            yield f"{header} [No variants]"
+
+
+def _modify_records(
+    records,
+    start,
+    root,
+    nmeth_rate,
+    peg_rate,
+    nmeth_residues,
+    trust_input=False,
+    engine="regex",
+    plan=None,
+):
+    # Modify parsed records numbered from `start`, yielding output strings;
+    # records from the threaded reader also carry the parsed input mol
+    for index, (header, seq, *parsed) in enumerate(records, start):
+        mol = parsed[0] if parsed else None
         if seq is None:
             yield f"{header} [Skipped malformed line]"
             continue
+        if not smiles_syntax_ok(seq):
+            yield f"{header} [Invalid SMILES skipped]"
+            continue
+        rng = python_rng(child_sequence(root, index))
+
+        if plan:
+            mod_seq, mods = apply_modifications(seq, plan, rng, trust_input, mol)
+            if mod_seq is None:
+                yield f"{header} [Invalid SMILES skipped]"
+                continue
+            yield _format_record(header, mod_seq, mods)
+            continue
 
         # Bernoulli per line (fast; no preselect sets)
-        do_methylate = (random.random() < nmeth_rate) if nmeth_rate > 0 else False
-        do_pegylate = (random.random() < peg_rate) if peg_rate > 0 else False
+        do_methylate = (rng.random() < nmeth_rate) if nmeth_rate > 0 else False
+        do_pegylate = (rng.random() < peg_rate) if peg_rate > 0 else False
 
-        mod_seq, mods = modify_sequence(seq, do_methylate, do_pegylate, nmeth_residues)
+        if engine == "mol":
+            # parses (and so validates) inside; None if RDKit rejects it
+            mod_seq, mods = modify_smiles(
+                seq, do_methylate, do_pegylate, nmeth_residues, rng, trust_input, mol
+            )
+            if mod_seq is None:
+                yield f"{header} [Invalid SMILES skipped]"
+                continue
+        else:
+            mod_seq, mods = modify_sequence(
+                seq, do_methylate, do_pegylate, nmeth_residues, rng
+            )
+            # the one RDKit parse; input that came out unchanged skips it when
+            # trusted or already parsed by the threaded reader
+            checked = mod_seq == seq and (trust_input or mol is not None)
+            if not checked and not is_valid_smiles(mod_seq):
+                yield f"{header} [Invalid SMILES skipped]"
+                continue
 
-        if not is_valid_smiles(mod_seq):
-            yield f"{header} [Invalid SMILES skipped]"
-            continue
+        yield _format_record(header, mod_seq, mods)
 
-        mod_str = f"[{' - '.join(mods)}]" if mods else ""
-        prefix = f"{header}{mod_str}".strip()
-        # Preserve your original "Header: SMILES" shape; allow empty header
-        if header:
-            yield f"{prefix}: {mod_seq}"
-        else:
-            yield f"{mod_seq}" if not mods else f"{mod_str}: {mod_seq}"
+
+def _format_record(header, mod_seq, mods):
+    mod_str = f"[{' - '.join(mods)}]" if mods else ""
+    prefix = f"{header}{mod_str}".strip()
+    # Preserve your original "Header: SMILES" shape; allow empty header
+    if header:
+        return f"{prefix}: {mod_seq}"
+    return f"{mod_seq}" if not mods else f"{mod_str}: {mod_seq}"
 
 
 def process_file(
@@ -163,11 +355,35 @@ def process_file(
     peg_rate: float,
     nmeth_rate: float,
     nmeth_residues: float,
+    seed=None,
+    procs: int = 1,
+    trust_input: bool = False,
+    engine: str = "regex",
+    enumerate_all: bool = False,
+    enumerate_k=None,
+    max_variants=None,
+    plan=None,
+    threads: int = 0,
 ):
+    sequences = partial(
+        process_sequences,
+        nmeth_rate=nmeth_rate,
+        peg_rate=peg_rate,
+        nmeth_residues=nmeth_residues,
+        seed=seed,
+        procs=procs,
+        trust_input=trust_input,
+        engine=engine,
+        enumerate_all=enumerate_all,
+        enumerate_k=enumerate_k,
+        max_variants=max_variants,
+        plan=plan,
+        threads=threads,
+    )
     if output_file:
         with open(input_file, "r") as infile, open(output_file, "w") as outfile:
             first = True
-            for line in process_sequences(infile, nmeth_rate, peg_rate, nmeth_residues):
+            for line in sequences(infile):
                 if not first:
                     outfile.write("\n")
                 outfile.write(line)
@@ -176,7 +392,7 @@ def process_file(
                 outfile.write("")  # no lines
     else:
         with open(input_file, "r") as infile:
-            for line in process_sequences(infile, nmeth_rate, peg_rate, nmeth_residues):
+            for line in sequences(infile):
                 print(line)
 
 
@@ -208,7 +424,81 @@ def main():
         default=0.2,
         help="Fraction of amide sites per sequence to N-methylate (0-1).",
     )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Seed for reproducible modifications (per-record random streams).",
+    )
+    parser.add_argument(
+        "--procs",
+        type=int,
+        default=1,
+        help="Worker processes; output order and content do not depend on it.",
+    )
+    parser.add_argument(
+        "--trust_input",
+        action="store_true",
+        help="Pass records that are not modified through without RDKit "
+        "validation (they still get the syntactic pre-check).",
+    )
+    # --enumerate and --mod plugins find their own sites, so each of them
+    # excludes the other and any --engine choice
+    modes = parser.add_mutually_exclusive_group()
+    modes.add_argument(
+        "--engine",
+        choices=["regex", "mol"],
+        default=None,
+        help="'regex' (default) edits p2smi's SMILES text directly (fast); "
+        "'mol' finds sites by SMARTS on the parsed molecule, for any SMILES "
+        "spelling.",
+    )
+    modes.add_argument(
+        "--enumerate",
+        action="store_true",
+        help="Write every N-methylation pattern x PEG length (1-4) variant of "
+        "each input instead of one random variant.",
+    )
+    parser.add_argument(
+        "--enumerate_k",
+        type=int,
+        default=None,
+        help="With --enumerate, methylate exactly K amide N instead of every "
+        "subset.",
+    )
+    parser.add_argument(
+        "--max_variants",
+        type=int,
+        default=None,
+        help="With --enumerate, cap the number of variants written per input.",
+    )
+    modes.add_argument(
+        "--mod",
+        action="append",
+        default=None,
+        metavar="NAME[:rate=R,fraction=F]",
+        help="Apply a modification plugin (repeatable, applied in order; "
+        f"replaces --peg_rate/--nmeth_rate). Available: {', '.join(MODIFICATIONS)}.",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=0,
+        help="Parse input with RDKit's multithreaded supplier in N native "
+        "threads (0=disable); an alternative to --procs.",
+    )
     args = parser.parse_args()
+    try:
+        plan = [parse_mod_spec(spec) for spec in args.mod] if args.mod else None
+    except ValueError as err:
+        parser.error(str(err))
+    if args.threads:
+        if args.procs > 1:
+            parser.error("use either --threads or --procs, not both")
+        try:
+            require_threaded_supplier()
+        except ImportError as err:
+            parser.error(str(err))
 
     process_file(
         args.input_file,
@@ -216,6 +506,15 @@ def main():
         args.peg_rate,
         args.nmeth_rate,
         args.nmeth_residues,
+        args.seed,
+        args.procs,
+        args.trust_input,
+        args.engine or "regex",
+        args.enumerate,
+        args.enumerate_k,
+        args.max_variants,
+        plan,
+        args.threads,
     )
 
 
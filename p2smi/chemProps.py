@@ -5,14 +5,52 @@ Chemical data extraction for a molecule (fast path).
 Improvements:
 - Parse SMILES once per record; reuse a single RDKit Mol.
 - No recursive calls that re-parse (e.g., Lipinski pass computed from the same Mol).
+- Selectable descriptors (--fields): the requested fields are compiled once
+  into a minimal call list; shared inputs (MW, logP, donors, acceptors) are
+  computed once, and Lipinski strings are only built for "lipinski_details".
+- Columnar output (--format csv/tsv/npy/npz/parquet): workers fill typed
+  column batches per chunk instead of serialising one JSON object per record.
+- Optional persistent cache (--cache): results are looked up by canonical
+  SMILES or InChIKey before any descriptor work (p2smi.utilities.propcache).
+- Optional threaded parsing (--threads): RDKit's MultithreadedSmilesMolSupplier
+  parses in native threads (p2smi.utilities.suppliers); descriptors and
+  output stay in this process, so there are no worker copies or pickling.
+- Shared-memory transport (--transport shm, columnar formats with --procs):
+  workers write numeric columns into a ring of shared_memory blocks and
+  return only text columns; the parent rebuilds ID/SMILES from its own input.
+- Summary mode (--summary): workers fold their chunks into mergeable
+  statistics (p2smi.utilities.summary) and only those are sent back; no
+  per-molecule output. --merge_summaries combines summaries of shards.
+- Streaming selection (--where, --top_k): filters over field names run in
+  the workers (p2smi.utilities.selection), so rejected records are never
+  serialised; top-k keeps a bounded heap per chunk, merged in the parent.
+- Peptide descriptors (net_charge, pi, gravy, hmoment, aliphatic): read
+  from the sequence in p2smi record IDs ("SEQUENCE-bond_def") and computed
+  per chunk as NumPy batches over residue tables (p2smi.utilities.peptideprops).
+- Optional 3D descriptors (--fields 3d): multi-conformer ETKDG embeddings
+  relaxed with MMFF give shape and 3D polar surface descriptors under a
+  per-molecule time limit, enforced by a separate worker process that is
+  restarted after a timeout (p2smi.utilities.conformers).
+- Sanitisation profiles: runs whose fields only need atom properties
+  (formula, mw, heavy, charge, peptide fields) parse with one
+  reusable SmilesParserParams and a partial SanitizeMol, skipping ring
+  sets, aromaticity and conjugation perception (parse_profile).
 - Streamed batch I/O with minimal per-iteration overhead.
-- Optional multiprocessing (--procs) for large inputs.
+- Optional multiprocessing (--procs) for large inputs: chunks of lines go to
+  workers and come back through a bounded reorder buffer, so output stays in
+  input order; every record carries its "ID" (from "id: SMILES") and "Index".
 """
 
 import argparse
 import json
+import sys
+from collections import deque
+from functools import lru_cache, partial
+from itertools import chain
+from multiprocessing import Pool
 from typing import Tuple, Optional
 
+import numpy as np
 from rdkit import Chem
 from rdkit import RDLogger
 from rdkit.Chem import (
@@ -23,6 +61,38 @@ from rdkit.Chem import (
     rdmolops,  # formal charge
 )
 
+from p2smi.utilities.conformers import ConformerSettings, conformer_properties
+from p2smi.utilities.parallel import iter_chunks, ordered_imap
+from p2smi.utilities.peptideprops import parse_peptide_id, peptide_batch
+from p2smi.utilities.propcache import (
+    CACHE_KEYS,
+    PropertyCache,
+    lookup,
+    molecule_key,
+)
+from p2smi.utilities.selection import (
+    SelectionError,
+    record_filter,
+    top_records,
+    where_fields,
+)
+from p2smi.utilities.sharedcols import (
+    allocate_blocks,
+    attach_blocks,
+    fill_columns,
+    read_columns,
+    release_blocks,
+)
+from p2smi.utilities.summary import PropertySummary
+from p2smi.utilities.suppliers import iter_threaded_mols, require_threaded_supplier
+from p2smi.utilities.writers import (
+    COLUMNAR_FORMATS,
+    VALID_COLUMN,
+    records_to_columns,
+    require_pyarrow,
+    write_columns,
+)
+
 RDLogger.DisableLog("rdApp.*")  # quieter batch runs
 
 
@@ -33,10 +103,35 @@ class SmilesError(Exception):
 # ---------- Core helpers (Mol-first; no re-parsing) ----------
 
 
-def make_mol(smiles: str) -> Chem.Mol:
-    mol = Chem.MolFromSmiles(smiles)
+def smiles_error(smiles: str) -> SmilesError:
+    return SmilesError(f"{smiles} is not a valid SMILES string")
+
+
+SANITIZE_ALL = Chem.SanitizeFlags.SANITIZE_ALL
+
+# Parse without sanitising; parse_mol runs the SanitizeMol steps it is given
+_UNSANITIZED = Chem.SmilesParserParams()
+_UNSANITIZED.sanitize = False
+
+
+def parse_mol(
+    smiles: str, sanitize: Chem.SanitizeFlags = SANITIZE_ALL
+) -> Optional[Chem.Mol]:
+    # Mol or None; with partial `sanitize` flags (see parse_profile) only
+    # syntax errors and failures of those steps make the SMILES invalid
+    if sanitize == SANITIZE_ALL:
+        return Chem.MolFromSmiles(smiles)
+    mol = Chem.MolFromSmiles(smiles, _UNSANITIZED)
     if mol is None:
-        raise SmilesError(f"{smiles} is not a valid SMILES string")
+        return None
+    failed = Chem.SanitizeMol(mol, sanitize, catchErrors=True)
+    return mol if failed == Chem.SanitizeFlags.SANITIZE_NONE else None
+
+
+def make_mol(smiles: str, sanitize: Chem.SanitizeFlags = SANITIZE_ALL) -> Chem.Mol:
+    mol = parse_mol(smiles, sanitize)
+    if mol is None:
+        raise smiles_error(smiles)
     return mol
 
 
@@ -65,42 +160,254 @@ def lipinski_trial_mol(mol: Chem.Mol) -> Tuple[list, list]:
     return passed, failed
 
 
-def molecule_summary_from_mol(smiles: str, mol: Chem.Mol) -> dict:
-    # Bind locals (tiny speedup in tight loops)
-    _MolWt = Descriptors.MolWt
-    _TPSA = Descriptors.TPSA
-    _MolLogP = Crippen.MolLogP
-    _HDon = Lipinski.NumHDonors
-    _HAcc = Lipinski.NumHAcceptors
-    _RotB = Lipinski.NumRotatableBonds
-    _Rings = mol.GetRingInfo().NumRings
-    _FracC = rdMolDescriptors.CalcFractionCSP3
-    _Heavy = mol.GetNumHeavyAtoms
-    _Charge = rdmolops.GetFormalCharge
-    _Formula = rdMolDescriptors.CalcMolFormula
+# ---------- Descriptor registry ----------
+
+# Descriptors shared between fields; each is computed at most once per Mol.
+_SHARED = {
+    "mw": Descriptors.MolWt,
+    "logp": Crippen.MolLogP,
+    "tpsa": Descriptors.TPSA,
+    "hbd": Lipinski.NumHDonors,
+    "hba": Lipinski.NumHAcceptors,
+    "conf3d": conformer_properties,  # bound to the run's ConformerSettings
+}
+
 
+def _lipinski_pass(shared: dict) -> bool:
+    # Same thresholds as lipinski_trial_mol, without building its strings
+    return (
+        shared["hbd"] <= 5
+        and shared["hba"] <= 10
+        and shared["mw"] < 500
+        and shared["logp"] < 5
+    )
+
+
+def _lipinski_details(mol: Chem.Mol) -> dict:
     passed, failed = lipinski_trial_mol(mol)
+    return {"passed": passed, "failed": failed}
+
+
+def _conformer_value(key: str, digits: int):
+    # Field value read from the shared conformer descriptors (None if the
+    # molecule had no conformer)
+    def value(mol, shared):
+        v = shared["conf3d"][key]
+        return None if v is None else round(v, digits)
+
+    return value
+
+
+# alias -> (output key, shared descriptors used, value(mol, shared), column dtype);
+# value None marks a peptide descriptor, filled per chunk by add_peptide_fields
+FIELDS = {
+    "formula": (
+        "Formula",
+        (),
+        lambda mol, sh: rdMolDescriptors.CalcMolFormula(mol),
+        "U",
+    ),
+    "mw": ("Molecular weight", ("mw",), lambda mol, sh: round(sh["mw"], 2), "f8"),
+    "logp": ("logP", ("logp",), lambda mol, sh: round(sh["logp"], 2), "f8"),
+    "tpsa": ("TPSA", ("tpsa",), lambda mol, sh: round(sh["tpsa"], 2), "f8"),
+    "hbd": ("H-bond donors", ("hbd",), lambda mol, sh: sh["hbd"], "i4"),
+    "hba": ("H-bond acceptors", ("hba",), lambda mol, sh: sh["hba"], "i4"),
+    "rotb": (
+        "Rotatable bonds",
+        (),
+        lambda mol, sh: Lipinski.NumRotatableBonds(mol),
+        "i4",
+    ),
+    "rings": ("Rings", (), lambda mol, sh: mol.GetRingInfo().NumRings(), "i4"),
+    "fsp3": (
+        "Fraction Csp3",
+        (),
+        lambda mol, sh: round(rdMolDescriptors.CalcFractionCSP3(mol), 3),
+        "f8",
+    ),
+    "heavy": ("Heavy atoms", (), lambda mol, sh: mol.GetNumHeavyAtoms(), "i4"),
+    "charge": (
+        "Formal charge",
+        (),
+        lambda mol, sh: rdmolops.GetFormalCharge(mol),
+        "i4",
+    ),
+    "lipinski": (
+        "Lipinski pass",
+        ("mw", "logp", "hbd", "hba"),
+        lambda mol, sh: _lipinski_pass(sh),
+        "?",
+    ),
+    "lipinski_details": (
+        "Lipinski details",
+        (),
+        lambda mol, sh: _lipinski_details(mol),
+        "U",
+    ),
+    "net_charge": ("Net charge", (), None, "f8"),
+    "pi": ("Isoelectric point", (), None, "f8"),
+    "gravy": ("GRAVY", (), None, "f8"),
+    "hmoment": ("Hydrophobic moment", (), None, "f8"),
+    "aliphatic": ("Aliphatic index", (), None, "f8"),
+    "conformers": (
+        "Conformers",
+        ("conf3d",),
+        lambda mol, sh: sh["conf3d"]["conformers"],
+        "i4",
+    ),
+    "conf_timeout": (
+        "Conformer timeout",
+        ("conf3d",),
+        lambda mol, sh: sh["conf3d"]["timed_out"],
+        "?",
+    ),
+    "rg": ("Radius of gyration", ("conf3d",), _conformer_value("rg", 2), "f8"),
+    "pmi1": ("PMI1", ("conf3d",), _conformer_value("pmi1", 2), "f8"),
+    "pmi2": ("PMI2", ("conf3d",), _conformer_value("pmi2", 2), "f8"),
+    "pmi3": ("PMI3", ("conf3d",), _conformer_value("pmi3", 2), "f8"),
+    "npr1": ("NPR1", ("conf3d",), _conformer_value("npr1", 3), "f8"),
+    "npr2": ("NPR2", ("conf3d",), _conformer_value("npr2", 3), "f8"),
+    "psa3d": ("3D PSA", ("conf3d",), _conformer_value("psa3d", 2), "f8"),
+    "energy_range": (
+        "Conformer energy range",
+        ("conf3d",),
+        _conformer_value("energy_range", 2),
+        "f8",
+    ),
+}
+
+# 3D fields: only computed when asked for, by name or with "3d"
+CONFORMER_FIELDS = tuple(f for f in FIELDS if FIELDS[f][1] == ("conf3d",))
+
+# Fields that only need atom properties: valence checks and implicit
+# hydrogens (the SanitizeMol cleanup and properties steps). Kekulisation is
+# kept too, so a SMILES is valid or not whatever fields are requested. Any
+# other field needs full sanitisation. ("rings" would only add
+# SANITIZE_SYMMRINGS, but run as a separate step that is slower than
+# MolFromSmiles' own full pass.)
+LIGHT_SANITIZE = (
+    Chem.SanitizeFlags.SANITIZE_CLEANUP
+    | Chem.SanitizeFlags.SANITIZE_PROPERTIES
+    | Chem.SanitizeFlags.SANITIZE_KEKULIZE
+)
+LIGHT_FIELDS = frozenset(
+    (
+        "formula",
+        "mw",
+        "heavy",
+        "charge",
+        "net_charge",
+        "pi",
+        "gravy",
+        "hmoment",
+        "aliphatic",
+    )
+)
+
+# Fields of the classic summary, in output order
+DEFAULT_FIELDS = (
+    "formula",
+    "mw",
+    "logp",
+    "tpsa",
+    "hbd",
+    "hba",
+    "rotb",
+    "rings",
+    "fsp3",
+    "heavy",
+    "charge",
+    "lipinski",
+)
+
+
+def parse_fields(spec: Optional[str]) -> Tuple[str, ...]:
+    # "mw,tpsa" -> ("mw", "tpsa"); None/"" -> defaults, "all" -> every field
+    # but the (slow) 3D ones, "3d" -> the 3D fields
+    if not spec:
+        return DEFAULT_FIELDS
+    if spec == "all":
+        return tuple(f for f in FIELDS if f not in CONFORMER_FIELDS)
+    names = (f.strip().lower() for f in spec.split(","))
+    names = (CONFORMER_FIELDS if f == "3d" else (f,) for f in names)
+    fields = tuple(dict.fromkeys(chain.from_iterable(names)))
+    unknown = [f for f in fields if f not in FIELDS]
+    if unknown:
+        raise ValueError(
+            f"unknown field(s) {', '.join(unknown)}; choose from {', '.join(FIELDS)}"
+        )
+    return fields
+
+
+@lru_cache(maxsize=None)
+def parse_profile(fields: Tuple[str, ...] = DEFAULT_FIELDS) -> Chem.SanitizeFlags:
+    # The SanitizeMol flags `fields` need: LIGHT_SANITIZE if they are all
+    # LIGHT_FIELDS, else everything
+    if all(f in LIGHT_FIELDS for f in fields):
+        return LIGHT_SANITIZE
+    return SANITIZE_ALL
+
+
+@lru_cache(maxsize=None)
+def compile_fields(
+    fields: Tuple[str, ...] = DEFAULT_FIELDS,
+    conformers: ConformerSettings = ConformerSettings(),
+):
+    """
+    Compile field aliases into (shared calls, output calls): the shared
+    descriptors the fields need, each listed once, and (key, value) pairs in
+    field order. 3D fields embed with the `conformers` settings.
+    """
+    shared = dict.fromkeys(name for f in fields for name in FIELDS[f][1])
+    calls = dict(_SHARED, conf3d=partial(conformer_properties, settings=conformers))
+    shared_calls = tuple((name, calls[name]) for name in shared)
+    outputs = tuple(
+        (FIELDS[f][0], FIELDS[f][2] or _peptide_placeholder) for f in fields
+    )
+    return shared_calls, outputs
+
+
+def _peptide_placeholder(mol, shared):
+    # Keeps the field's place in the record until add_peptide_fields runs
+    return None
+
 
-    return {
-        "SMILES": smiles,
-        "Formula": _Formula(mol),
-        "Molecular weight": round(_MolWt(mol), 2),
-        "logP": round(_MolLogP(mol), 2),
-        "TPSA": round(_TPSA(mol), 2),
-        "H-bond donors": _HDon(mol),
-        "H-bond acceptors": _HAcc(mol),
-        "Rotatable bonds": _RotB(mol),
-        "Rings": _Rings(),
-        "Fraction Csp3": round(_FracC(mol), 3),
-        "Heavy atoms": _Heavy(),
-        "Formal charge": _Charge(mol),
-        "Lipinski pass": not failed,
-    }
+def column_schema(fields: Tuple[str, ...] = DEFAULT_FIELDS) -> list:
+    # [(column, numpy dtype)] of batch records for columnar output
+    return (
+        [("ID", "U"), ("Index", "i8"), ("SMILES", "U")]
+        + [(FIELDS[f][0], FIELDS[f][3]) for f in fields]
+        + [("error", "U"), (VALID_COLUMN, "?")]
+    )
+
+
+def descriptor_columns(fields: Tuple[str, ...] = DEFAULT_FIELDS) -> list:
+    # Columns of column_schema written as nulls on failed rows (see writers)
+    return [FIELDS[f][0] for f in fields]
+
+
+def molecule_summary_from_mol(
+    smiles: str,
+    mol: Chem.Mol,
+    fields: Tuple[str, ...] = DEFAULT_FIELDS,
+    conformers: ConformerSettings = ConformerSettings(),
+) -> dict:
+    shared_calls, outputs = compile_fields(fields, conformers)
+    shared = {name: func(mol) for name, func in shared_calls}
+    res = {"SMILES": smiles}
+    for key, value in outputs:
+        res[key] = value(mol, shared)
+    return res
 
 
 # Backward-compatible single-call helper
-def molecule_summary(smiles: str) -> dict:
-    return molecule_summary_from_mol(smiles, make_mol(smiles))
+def molecule_summary(
+    smiles: str,
+    fields: Tuple[str, ...] = DEFAULT_FIELDS,
+    conformers: ConformerSettings = ConformerSettings(),
+) -> dict:
+    mol = make_mol(smiles, parse_profile(fields))
+    return molecule_summary_from_mol(smiles, mol, fields, conformers)
 
 
 # ---------- Batch processing ----------
@@ -114,6 +421,17 @@ def parse_smiles_line(line: str) -> Optional[str]:
     return s.split(": ", 1)[-1] if ": " in s else s
 
 
+def parse_smiles_record(line: str) -> Optional[Tuple[str, str]]:
+    # (id, SMILES) for "id: SMILES" lines, ("", SMILES) for bare ones
+    s = line.strip()
+    if not s:
+        return None
+    if ": " in s:
+        rec_id, smi = s.split(": ", 1)
+        return rec_id.strip(), smi.strip()
+    return "", s
+
+
 def process_line(line: str) -> str:
     s = parse_smiles_line(line)
     if s is None:
@@ -126,6 +444,556 @@ def process_line(line: str) -> str:
         return json.dumps({"error": f"{e}", "SMILES": s})
 
 
+def iter_parsed(start: int, lines, sanitize: Chem.SanitizeFlags = SANITIZE_ALL):
+    # (index, id, SMILES, Mol or None) per non-empty line, parsed lazily
+    for index, (rec_id, smiles) in enumerate(map(parse_smiles_record, lines), start):
+        yield index, rec_id, smiles, parse_mol(smiles, sanitize)
+
+
+def summarise_parsed(
+    index: int,
+    rec_id: str,
+    smiles: str,
+    mol: Optional[Chem.Mol],
+    fields: Tuple[str, ...] = DEFAULT_FIELDS,
+    conformers: ConformerSettings = ConformerSettings(),
+) -> dict:
+    # Summary of one parsed record, tagged with its input ID and record index
+    res = {"ID": rec_id, "Index": index}
+    if mol is None:
+        res.update({"error": f"{smiles_error(smiles)}", "SMILES": smiles})
+    else:
+        res.update(molecule_summary_from_mol(smiles, mol, fields, conformers))
+    return res
+
+
+def add_peptide_fields(records, fields: Tuple[str, ...], ph: float = 7.0) -> list:
+    """
+    Fill the peptide descriptors among `fields` for a batch of records in
+    one NumPy pass over their sequences (parse_peptide_id on each "ID").
+    Records whose ID is not a p2smi peptide ID keep None; failed records
+    are left alone.
+    """
+    wanted = [f for f in fields if FIELDS[f][2] is None]
+    if not wanted:
+        return records
+    peptides = [
+        (rec, parse_peptide_id(rec["ID"])) for rec in records if "error" not in rec
+    ]
+    peptides = [(rec, peptide) for rec, peptide in peptides if peptide]
+    if peptides:
+        batch = peptide_batch([peptide for _, peptide in peptides], ph)
+        for f in wanted:
+            key = FIELDS[f][0]
+            for (rec, _), value in zip(peptides, batch[f].tolist()):
+                rec[key] = None if np.isnan(value) else round(value, 2)
+    return records
+
+
+def process_record(
+    index: int,
+    rec_id: str,
+    smiles: str,
+    fields: Tuple[str, ...] = DEFAULT_FIELDS,
+    conformers: ConformerSettings = ConformerSettings(),
+) -> dict:
+    mol = parse_mol(smiles, parse_profile(fields))
+    return summarise_parsed(index, rec_id, smiles, mol, fields, conformers)
+
+
+def process_cached_records(
+    start: int,
+    lines: list,
+    fields: Tuple[str, ...],
+    cache_path: str,
+    cache_key: str = "canonical",
+    conformers: ConformerSettings = ConformerSettings(),
+):
+    """
+    Like process_record over a chunk, but serving records from the cache.
+    Returns (records, hit_keys, new_entries, misses); the caller (the cache
+    writer) stores new_entries, a list of (key, JSON fields) pairs.
+    """
+    return _cached_records(
+        iter_parsed(start, lines), fields, cache_path, cache_key, conformers
+    )
+
+
+def cache_signature(
+    fields: Tuple[str, ...], conformers: ConformerSettings = ConformerSettings()
+) -> str:
+    # Cache entries are per field list; 3D values also depend on how many
+    # conformers were embedded, from which seed and within what time
+    sig = ",".join(fields)
+    if any(f in CONFORMER_FIELDS for f in fields):
+        sig += f";3d={conformers.count},{conformers.seed},{conformers.time_limit}"
+    return sig
+
+
+def _cached_records(parsed, fields, cache_path, cache_key, conformers):
+    sig = cache_signature(fields, conformers)
+    parsed = list(parsed)  # keys are looked up for the whole chunk at once
+    keys = [molecule_key(mol, cache_key) if mol else None for *_, mol in parsed]
+    cached = lookup(cache_path, [key for key in keys if key], sig)
+
+    records, hit_keys, fresh = [], [], {}
+    misses = 0
+    for (index, rec_id, smiles, mol), key in zip(parsed, keys):
+        res = {"ID": rec_id, "Index": index}
+        if mol is None:
+            res.update({"error": f"{smiles_error(smiles)}", "SMILES": smiles})
+        elif key in cached:
+            hit_keys.append(key)
+            res["SMILES"] = smiles
+            res.update(json.loads(cached[key]))
+        else:
+            misses += 1
+            if key not in fresh:
+                summary = molecule_summary_from_mol(smiles, mol, fields, conformers)
+                del summary["SMILES"]
+                fresh[key] = summary
+            res["SMILES"] = smiles
+            res.update(fresh[key])
+        records.append(res)
+    new_entries = [(k, json.dumps(v)) for k, v in fresh.items() if k]
+    return records, hit_keys, new_entries, misses
+
+
+def process_chunk(
+    chunk,
+    fields: Tuple[str, ...] = DEFAULT_FIELDS,
+    output: str = "jsonl",
+    cache_path: Optional[str] = None,
+    cache_key: str = "canonical",
+    parsed: bool = False,
+    where: Optional[str] = None,
+    top: Optional[Tuple[str, int, bool]] = None,
+    ph: float = 7.0,
+    conformers: ConformerSettings = ConformerSettings(),
+):
+    # Worker task: (start index, non-empty lines) -> JSON lines in order,
+    # with output="columns" one typed column batch, with output="summary" a
+    # PropertySummary of the chunk. With a cache, returns (output, cache
+    # report) so the parent can write the cache. With parsed=True the chunk
+    # holds (id, SMILES, Mol) records instead of lines. Records failing
+    # `where` are dropped first; with `top`, the chunk's best records are
+    # returned as dicts for the parent to merge (see select_records). `ph`
+    # is the pH of the "net_charge" field, `conformers` configures 3D fields.
+    records, report = _chunk_records(
+        chunk, fields, cache_path, cache_key, parsed, ph, conformers
+    )
+    records = select_records(records, where, top)
+    out = records if top else _format_records(records, fields, output)
+    return (out, report) if cache_path else out
+
+
+def process_chunk_shared(
+    task,
+    fields: Tuple[str, ...] = DEFAULT_FIELDS,
+    cache_path: Optional[str] = None,
+    cache_key: str = "canonical",
+    capacity: int = 0,
+    where: Optional[str] = None,
+    ph: float = 7.0,
+    conformers: ConformerSettings = ConformerSettings(),
+):
+    # Worker task for --transport shm: (start, lines, block name) -> the
+    # numeric columns go into the parent's shared block, only the text
+    # columns (see shared_schemas) are returned; with `where`, also the
+    # Index of every record kept
+    start, lines, block = task
+    records, report = _chunk_records(
+        (start, lines), fields, cache_path, cache_key, ph=ph, conformers=conformers
+    )
+    records = select_records(records, where)
+    numeric, text = shared_schemas(fields)
+    fill_columns(block, records_to_columns(records, numeric), numeric, capacity)
+    out = records_to_columns(records, text)
+    if where:
+        out["Index"] = np.array([rec["Index"] for rec in records], dtype="i8")
+    return (out, report) if cache_path else out
+
+
+def _chunk_records(
+    chunk,
+    fields,
+    cache_path,
+    cache_key,
+    parsed=False,
+    ph=7.0,
+    conformers=ConformerSettings(),
+):
+    # (record dicts, cache report or None) for one chunk; peptide fields
+    # depend on the ID, not the molecule, so they are filled after the cache.
+    # Cache keys are canonical SMILES/InChIKeys of fully sanitised Mols.
+    start, items = chunk
+    if parsed:
+        items = ((index, *item) for index, item in enumerate(items, start))
+    elif cache_path:
+        items = iter_parsed(start, items)
+    else:
+        items = iter_parsed(start, items, parse_profile(fields))
+    if cache_path:
+        records, *report = _cached_records(
+            items, fields, cache_path, cache_key, conformers
+        )
+    else:
+        records = [summarise_parsed(*item, fields, conformers) for item in items]
+        report = None
+    return add_peptide_fields(records, fields, ph), report
+
+
+def _format_records(records, fields, output):
+    # One chunk's output: JSON lines, a typed column batch or a summary
+    if output == "columns":
+        return records_to_columns(records, column_schema(fields))
+    if output == "summary":
+        return new_summary(fields).add_records(records)
+    return [json.dumps(rec) for rec in records]
+
+
+def select_records(
+    records, where: Optional[str] = None, top: Optional[Tuple[str, int, bool]] = None
+) -> list:
+    # Keep the records matching `where` (a --where expression over FIELDS
+    # names); with top = (field, n, ascending), only the best n of those
+    if where:
+        keys = tuple((name, FIELDS[name][0]) for name in where_fields(where, FIELDS))
+        records = list(filter(record_filter(where, keys), records))
+    if top:
+        field, n, ascending = top
+        records = top_records(records, FIELDS[field][0], n, ascending)
+    return records
+
+
+# Histogram bin widths of real-valued fields in summaries (integers use 1)
+SUMMARY_BIN_WIDTHS = {
+    "mw": 50.0,
+    "logp": 0.5,
+    "tpsa": 10.0,
+    "fsp3": 0.05,
+    "pi": 0.5,
+    "gravy": 0.25,
+    "hmoment": 0.1,
+    "aliphatic": 10.0,
+}
+
+
+def summary_fields(fields: Tuple[str, ...] = DEFAULT_FIELDS) -> Tuple[str, ...]:
+    # The fields a summary can describe: numbers and flags, not strings
+    return tuple(f for f in fields if np.dtype(FIELDS[f][3]).kind in "bif")
+
+
+def new_summary(fields: Tuple[str, ...] = DEFAULT_FIELDS) -> PropertySummary:
+    numeric, flags = [], []
+    for f in summary_fields(fields):
+        key, _, _, dtype = FIELDS[f]
+        kind = np.dtype(dtype).kind
+        if kind == "b":
+            flags.append(key)
+        else:
+            numeric.append((key, SUMMARY_BIN_WIDTHS.get(f, 1.0), kind == "i"))
+    return PropertySummary(numeric, flags)
+
+
+def shared_schemas(fields: Tuple[str, ...] = DEFAULT_FIELDS):
+    # (numeric, text) columns a --transport shm worker fills; ID, Index and
+    # SMILES are rebuilt by the parent from its own copy of the input
+    numeric, text = [], []
+    for name, dtype in column_schema(fields):
+        if name not in ("ID", "Index", "SMILES"):
+            (text if np.dtype(dtype).kind == "U" else numeric).append((name, dtype))
+    return numeric, text
+
+
+CHUNK_RECORDS = 1024  # lines per worker task
+
+
+def iter_results(
+    lines,
+    procs: int = 0,
+    chunk_records: int = CHUNK_RECORDS,
+    fields: Tuple[str, ...] = DEFAULT_FIELDS,
+    cache: Optional[PropertyCache] = None,
+    cache_key: str = "canonical",
+    threads: int = 0,
+    where: Optional[str] = None,
+    top: Optional[Tuple[str, int, bool]] = None,
+    ph: float = 7.0,
+    conformers: ConformerSettings = ConformerSettings(),
+):
+    """
+    Yield one JSON line per non-empty input line, in input order.
+    With procs > 1, chunks are processed in a pool and reordered through a
+    bounded window of in-flight chunks. With threads > 0, RDKit parses in
+    that many native threads instead and everything else runs here. With a
+    PropertyCache, workers read it and this (parent) side writes each
+    chunk's new results back. `where` and `top` select records as in
+    select_records; with `top`, the best records come once the whole input
+    has been read, best first. `ph` applies to the "net_charge" field and
+    `conformers` (embedding count, threads, time limit) to the 3D fields.
+    """
+    for out in _iter_chunk_outputs(
+        lines,
+        procs,
+        chunk_records,
+        fields,
+        "jsonl",
+        cache,
+        cache_key,
+        threads,
+        where,
+        top,
+        ph=ph,
+        conformers=conformers,
+    ):
+        yield from out
+
+
+def iter_column_batches(
+    lines,
+    procs: int = 0,
+    chunk_records: int = CHUNK_RECORDS,
+    fields: Tuple[str, ...] = DEFAULT_FIELDS,
+    cache: Optional[PropertyCache] = None,
+    cache_key: str = "canonical",
+    threads: int = 0,
+    transport: str = "pipe",
+    where: Optional[str] = None,
+    top: Optional[Tuple[str, int, bool]] = None,
+    ph: float = 7.0,
+    conformers: ConformerSettings = ConformerSettings(),
+):
+    # Like iter_results, but yields one column batch (see column_schema) per
+    # chunk of input lines. transport="shm" (with procs > 1) returns numeric
+    # columns from the workers through shared memory instead of the pipe;
+    # top-k runs only move each chunk's few winners, so they use the pipe.
+    if transport == "shm" and procs and procs > 1 and not threads and not top:
+        lines = (line for line in lines if line.strip())
+        return _iter_shared_batches(
+            lines,
+            procs,
+            chunk_records,
+            fields,
+            cache,
+            cache_key,
+            where,
+            ph,
+            conformers,
+        )
+    return _iter_chunk_outputs(
+        lines,
+        procs,
+        chunk_records,
+        fields,
+        "columns",
+        cache,
+        cache_key,
+        threads,
+        where,
+        top,
+        ph=ph,
+        conformers=conformers,
+    )
+
+
+def summarise_lines(
+    lines,
+    procs: int = 0,
+    chunk_records: int = CHUNK_RECORDS,
+    fields: Tuple[str, ...] = DEFAULT_FIELDS,
+    cache: Optional[PropertyCache] = None,
+    cache_key: str = "canonical",
+    threads: int = 0,
+    where: Optional[str] = None,
+    top: Optional[Tuple[str, int, bool]] = None,
+    ph: float = 7.0,
+    conformers: ConformerSettings = ConformerSettings(),
+) -> PropertySummary:
+    # Merged statistics of every (selected) record (see new_summary); each
+    # chunk is summarised where it is computed and only the partial
+    # summaries move
+    summary = new_summary(fields)
+    for part in _iter_chunk_outputs(
+        lines,
+        procs,
+        chunk_records,
+        fields,
+        "summary",
+        cache,
+        cache_key,
+        threads,
+        where,
+        top,
+        ph=ph,
+        conformers=conformers,
+    ):
+        summary.merge(part)
+    return summary
+
+
+def _iter_chunk_outputs(
+    lines,
+    procs,
+    chunk_records,
+    fields,
+    output,
+    cache=None,
+    cache_key="canonical",
+    threads=0,
+    where=None,
+    top=None,
+    ph=7.0,
+    conformers=ConformerSettings(),
+):
+    results = _iter_chunk_results(
+        lines,
+        procs,
+        chunk_records,
+        fields,
+        output,
+        cache,
+        cache_key,
+        threads,
+        where,
+        top,
+        ph,
+        conformers,
+    )
+    if not top:
+        yield from results
+        return
+    # each chunk sent its best records; one more bounded heap picks the rest
+    field, n, ascending = top
+    best = top_records(chain.from_iterable(results), FIELDS[field][0], n, ascending)
+    yield _format_records(best, fields, output)
+
+
+def _iter_chunk_results(
+    lines,
+    procs,
+    chunk_records,
+    fields,
+    output,
+    cache,
+    cache_key,
+    threads,
+    where,
+    top,
+    ph,
+    conformers,
+):
+    lines = (line for line in lines if line.strip())
+    sig = cache_signature(fields, conformers)
+    work = partial(
+        process_chunk,
+        fields=fields,
+        output=output,
+        cache_path=cache.path if cache is not None else None,
+        cache_key=cache_key,
+        parsed=bool(threads),
+        where=where,
+        top=top,
+        ph=ph,
+        conformers=conformers,
+    )
+    if threads:
+        records = iter_threaded_mols(
+            map(parse_smiles_record, lines), threads, threads * chunk_records
+        )
+        if cache is not None:
+            chunks = iter_chunks(records, chunk_records)
+            yield from _apply_cache_reports(map(work, chunks), cache, sig)
+            return
+        # summarise molecules as they arrive; only summaries are batched
+        summaries = (
+            summarise_parsed(index, *record, fields, conformers)
+            for index, record in enumerate(records)
+        )
+        for _, batch in iter_chunks(summaries, chunk_records):
+            batch = select_records(add_peptide_fields(batch, fields, ph), where, top)
+            yield batch if top else _format_records(batch, fields, output)
+        return
+    chunks = iter_chunks(lines, chunk_records)
+    if procs and procs > 1:
+        with Pool(processes=procs) as pool:
+            results = ordered_imap(pool, work, chunks, window=2 * procs)
+            yield from _apply_cache_reports(results, cache, sig)
+    else:
+        yield from _apply_cache_reports(map(work, chunks), cache, sig)
+
+
+def _iter_shared_batches(
+    lines,
+    procs,
+    chunk_records,
+    fields,
+    cache,
+    cache_key,
+    where=None,
+    ph=7.0,
+    conformers=ConformerSettings(),
+):
+    # Pool run over a ring of shared blocks: ordered_imap keeps at most
+    # `window` chunks in flight and a block is copied out before the next
+    # chunk is submitted, so window + 1 blocks are never reused too early.
+    # The chunk's lines stay here to rebuild ID/SMILES, matched in order
+    # (or by the returned Index when `where` dropped records).
+    schema = column_schema(fields)
+    numeric, _ = shared_schemas(fields)
+    window = 2 * procs
+    blocks = allocate_blocks(numeric, chunk_records, window + 1)
+    in_flight = deque()
+
+    def tasks():
+        for n, (start, chunk) in enumerate(iter_chunks(lines, chunk_records)):
+            block = blocks[n % len(blocks)]
+            in_flight.append((start, chunk, block))
+            yield start, chunk, block.name
+
+    work = partial(
+        process_chunk_shared,
+        fields=fields,
+        cache_path=cache.path if cache is not None else None,
+        cache_key=cache_key,
+        capacity=chunk_records,
+        where=where,
+        ph=ph,
+        conformers=conformers,
+    )
+    names = [block.name for block in blocks]
+    sig = cache_signature(fields, conformers)
+    try:
+        with Pool(procs, initializer=attach_blocks, initargs=(names,)) as pool:
+            results = ordered_imap(pool, work, tasks(), window=window)
+            for out in _apply_cache_reports(results, cache, sig):
+                start, chunk, block = in_flight.popleft()
+                ids, smiles = zip(*map(parse_smiles_record, chunk))
+                index = np.arange(start, start + len(chunk), dtype="i8")
+                kept = out.pop("Index", index) - start
+                batch = {
+                    "ID": np.array(ids, dtype="U")[kept],
+                    "Index": index[kept],
+                    "SMILES": np.array(smiles, dtype="U")[kept],
+                    **read_columns(block, numeric, chunk_records, len(kept)),
+                    **out,
+                }
+                yield {name: batch[name] for name, _ in schema}
+    finally:
+        release_blocks(blocks)
+
+
+def _apply_cache_reports(results, cache, sig):
+    # Write each chunk's cache report (parent side) and pass its output on;
+    # `sig` is the run's cache_signature
+    if cache is None:
+        yield from results
+        return
+    for out, (hit_keys, new_entries, misses) in results:
+        cache.update(sig, hit_keys, new_entries, misses)
+        yield out
+
+
 # ---------- CLI ----------
 
 
@@ -138,66 +1006,243 @@ def main():
         "-i", "--input_file", help="Text file: one SMILES (or 'id: SMILES') per line."
     )
     ap.add_argument(
-        "-o", "--output_file", help="If given with -i, writes JSONL here; else prints."
+        "-o",
+        "--output_file",
+        help="If given with -i, writes results here; else prints.",
     )
     ap.add_argument(
         "--procs",
         type=int,
         default=0,
-        help="Use N processes for batch mode (0=disable).",
+        help="Use N processes for batch mode (0=disable); output keeps input order.",
+    )
+    ap.add_argument(
+        "--fields",
+        default=None,
+        help="Comma-separated descriptors to compute (default: the classic "
+        f"summary; 'all' for every one). Available: {', '.join(FIELDS)}.",
+    )
+    ap.add_argument(
+        "--format",
+        choices=("jsonl",) + COLUMNAR_FORMATS,
+        default="jsonl",
+        help="Batch output format: JSON lines (default), csv/tsv, NumPy "
+        "structured .npy or per-column .npz, or parquet (needs pyarrow). "
+        "Binary formats need -o.",
+    )
+    ap.add_argument(
+        "--cache",
+        default=None,
+        metavar="PATH",
+        help="SQLite property cache; known molecules skip descriptor work.",
+    )
+    ap.add_argument(
+        "--cache_key",
+        choices=CACHE_KEYS,
+        default="canonical",
+        help="Cache identity: canonical SMILES (default) or InChIKey.",
+    )
+    ap.add_argument(
+        "--cache_max_entries",
+        type=int,
+        default=None,
+        help="Evict least recently used cache entries beyond this many.",
+    )
+    ap.add_argument(
+        "--threads",
+        type=int,
+        default=0,
+        help="Parse with RDKit's multithreaded supplier in N native threads "
+        "(0=disable); an alternative to --procs with no worker processes.",
+    )
+    ap.add_argument(
+        "--summary",
+        action="store_true",
+        help="Write only aggregate statistics of the numeric descriptors "
+        "(moments, quantiles, histograms, pass rates) as one JSON document.",
+    )
+    ap.add_argument(
+        "--merge_summaries",
+        nargs="+",
+        metavar="SUMMARY",
+        help="Merge --summary outputs of separate runs (e.g. shards) into one.",
+    )
+    ap.add_argument(
+        "--ph",
+        type=float,
+        default=7.0,
+        help="pH for the net_charge field (default 7.0).",
+    )
+    ap.add_argument(
+        "--conformers",
+        type=int,
+        default=10,
+        help="Conformers embedded per molecule for the 3D fields (default 10).",
+    )
+    ap.add_argument(
+        "--conf_threads",
+        type=int,
+        default=1,
+        help="Conformers embedded at a time per molecule, in RDKit threads "
+        "(default 1; 0 = all cores). Multiplies with --procs.",
+    )
+    ap.add_argument(
+        "--conf_time_limit",
+        type=float,
+        default=10.0,
+        help="Seconds per molecule for the 3D fields (default 10); molecules "
+        "that do not embed in time get 0 conformers and empty values, and "
+        "conf_timeout marks every result the limit cut short.",
+    )
+    ap.add_argument(
+        "--where",
+        metavar="EXPR",
+        help="Keep only records matching a condition on field names, e.g. "
+        "'mw < 1500 and tpsa < 250 and lipinski' (evaluated in the workers).",
+    )
+    ap.add_argument(
+        "--top_k",
+        metavar="FIELD",
+        help="Keep only the --top_n records with the highest FIELD "
+        "(lowest with --ascending), best first.",
+    )
+    ap.add_argument(
+        "--top_n", type=int, default=10, help="Records kept by --top_k (default 10)."
+    )
+    ap.add_argument(
+        "--ascending", action="store_true", help="Make --top_k keep the lowest values."
+    )
+    ap.add_argument(
+        "--transport",
+        choices=("pipe", "shm"),
+        default="pipe",
+        help="How --procs workers return columnar results: pickled through "
+        "the pipe (default) or numeric columns in shared memory.",
     )
     args = ap.parse_args()
+    try:
+        fields = parse_fields(args.fields)
+    except ValueError as err:
+        ap.error(str(err))
+    if args.format in ("npy", "npz", "parquet") and not args.output_file:
+        ap.error(f"--format {args.format} needs --output_file")
+    if args.format == "parquet":
+        try:
+            require_pyarrow()
+        except ImportError as err:
+            ap.error(str(err))
+    if args.merge_summaries:
+        merged = PropertySummary()
+        for path in args.merge_summaries:
+            with open(path) as handle:
+                merged.merge(PropertySummary.from_dict(json.load(handle)))
+        _write_summary(merged, args.output_file)
+        return
+    if args.summary:
+        if args.format != "jsonl":
+            ap.error("--summary writes one JSON document; drop --format")
+        fields = summary_fields(fields)
+    top = None
+    if args.where or args.top_k:
+        if args.smiles:
+            ap.error("--where and --top_k apply to --input_file runs")
+        try:
+            used = where_fields(args.where, FIELDS) if args.where else ()
+        except SelectionError as err:
+            ap.error(str(err))
+        if args.top_k:
+            if args.top_k not in summary_fields(tuple(FIELDS)):
+                ap.error(f"--top_k needs a numeric field, not {args.top_k!r}")
+            if args.top_n < 1:
+                ap.error("--top_n must be at least 1")
+            used += (args.top_k,)
+            top = (args.top_k, args.top_n, args.ascending)
+        # selection fields are computed (and output) even if not requested
+        fields += tuple(f for f in dict.fromkeys(used) if f not in fields)
+    if args.conformers < 1 or args.conf_threads < 0 or args.conf_time_limit <= 0:
+        ap.error(
+            "--conformers must be at least 1, --conf_threads at least 0 and "
+            "--conf_time_limit positive"
+        )
+    conformers = ConformerSettings(
+        args.conformers, args.conf_threads, args.conf_time_limit
+    )
+    if args.transport == "shm" and args.format == "jsonl":
+        ap.error("--transport shm needs a columnar --format")
+    if args.threads:
+        if args.procs > 1:
+            ap.error("use either --threads or --procs, not both")
+        try:
+            require_threaded_supplier()
+        except ImportError as err:
+            ap.error(str(err))
 
     if not args.smiles and not args.input_file:
         ap.error("At least one of --smiles or --input_file must be provided.")
 
     # Single SMILES path
     if args.smiles:
-        res = molecule_summary(args.smiles)
+        res = molecule_summary(args.smiles, fields, conformers)
         print(json.dumps(res, indent=2))
         return
 
-    # Batch path
-    if args.input_file:
-        if args.procs and args.procs > 1:
-            # Multiprocessing for large files
-            from multiprocessing import Pool
+    cache = (
+        PropertyCache(args.cache, args.cache_max_entries)
+        if args.cache and args.input_file
+        else None
+    )
+    options = dict(
+        fields=fields,
+        cache=cache,
+        cache_key=args.cache_key,
+        threads=args.threads,
+        where=args.where,
+        top=top,
+        ph=args.ph,
+        conformers=conformers,
+    )
 
-            with open(args.input_file, "r") as inf:
+    # Batch path (ordered; --procs > 1 processes chunks in parallel)
+    if args.input_file and args.summary:
+        with open(args.input_file, "r") as inf:
+            summary = summarise_lines(inf, args.procs, **options)
+        _write_summary(summary, args.output_file)
+    elif args.input_file and args.format != "jsonl":
+        with open(args.input_file, "r") as inf:
+            batches = iter_column_batches(
+                inf, args.procs, transport=args.transport, **options
+            )
+            schema = column_schema(fields)
+            masked = descriptor_columns(fields)
+            if args.format in ("csv", "tsv"):
                 if args.output_file:
-                    with (
-                        open(args.output_file, "w") as outf,
-                        Pool(processes=args.procs) as pool,
-                    ):
-                        for out in pool.imap_unordered(
-                            process_line, inf, chunksize=1024
-                        ):
-                            if out:
-                                outf.write(out + "\n")
+                    with open(args.output_file, "w", newline="") as outf:
+                        write_columns(batches, args.format, outf, schema, masked)
                 else:
-                    with Pool(processes=args.procs) as pool:
-                        for out in pool.imap_unordered(
-                            process_line, inf, chunksize=1024
-                        ):
-                            if out:
-                                print(out)
-        else:
-            # Single-process fast stream
+                    write_columns(batches, args.format, sys.stdout, schema, masked)
+            else:
+                write_columns(batches, args.format, args.output_file, schema, masked)
+    elif args.input_file:
+        with open(args.input_file, "r") as inf:
             if args.output_file:
-                with (
-                    open(args.input_file, "r") as inf,
-                    open(args.output_file, "w") as outf,
-                ):
-                    for line in inf:
-                        out = process_line(line)
-                        if out:
-                            outf.write(out + "\n")
+                with open(args.output_file, "w") as outf:
+                    for out in iter_results(inf, args.procs, **options):
+                        outf.write(out + "\n")
             else:
-                with open(args.input_file, "r") as inf:
-                    for line in inf:
-                        out = process_line(line)
-                        if out:
-                            print(out)
+                for out in iter_results(inf, args.procs, **options):
+                    print(out)
+    if cache is not None:
+        print(cache.describe(), file=sys.stderr)
+        cache.close()
+
+
+def _write_summary(summary, output_file):
+    text = json.dumps(summary.to_dict(), indent=2)
+    if output_file:
+        with open(output_file, "w") as outf:
+            outf.write(text + "\n")
+    else:
+        print(text)
 
 
 if __name__ == "__main__":
@@ -72,14 +72,17 @@ def process_constraints(fasta_file):
     return (constraint_resolver(seq, constr) for seq, constr in parse_fasta(fasta_file))
 
 
+def records_to_smiles(records):
+    # Resolve constraints and assemble SMILES for any iterable of
+    # (sequence, constraint) pairs; yields (seq, bond_def, smiles)
+    for seq, constr in records:
+        yield smilesgen.constrained_peptide_smiles(*constraint_resolver(seq, constr))
+
+
 def generate_smiles_strings(input_fasta, out_file):
     # Generate SMILES and write peptide structures from FASTA input to output file
-    resolved_sequences = process_constraints(input_fasta)
     smilesgen.write_library(
-        (
-            smilesgen.constrained_peptide_smiles(seq, constr)
-            for seq, constr in resolved_sequences
-        ),
+        records_to_smiles(parse_fasta(input_fasta)),
         out_file,
         write="text",
         write_to_file=True,
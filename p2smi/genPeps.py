@@ -11,6 +11,25 @@ Key features:
 - Builds sequences using canonical and noncanonical amino acid sets from p2smi.
 - Supports randomized constraint assignment or user-specified constraints.
 - Outputs sequences in FASTA format to stdout or to a specified output file.
+- Streams records in buffered chunks, so memory stays flat for any --num.
+- Optional NumPy batch engine (--engine numpy) that draws whole residue index
+  matrices per batch and decodes them through a code-point lookup table.
+- Reproducible with --seed: work is cut into fixed-size shards, each drawing
+  from its own SeedSequence child stream, so output is bit-identical for any
+  --workers count.
+- Optional constraint-guaranteed mode (--guarantee_constraints): the residues a
+  cyclisation needs are placed while sampling, so every tagged record cyclises.
+- Optional composition profile (--profile JSON): per-residue weights within
+  each pool and/or a position-specific frequency matrix, sampled through
+  precomputed alias tables (O(1) per residue) on both engines.
+- Optional duplicate-free output (--unique): an exact hash set for small runs,
+  a scalable Bloom filter (bounded memory, reported false-positive rate) for
+  large ones.
+- Optional property windows (--mw_range, --logp_range, --charge_range)
+  enforced while sampling from residue-additive estimates, with an optional
+  exact RDKit confirmation (--exact_check).
+- Direct SMILES output (--output_format smiles): records go straight through
+  constraint resolution and the smilesgen assembler, no intermediate FASTA.
 
 Example usage:
 python generate_random_peptides.py \
@@ -24,9 +43,32 @@ python generate_random_peptides.py \
 """
 
 import argparse
+import itertools
+import json
 import random
+import sys
+from functools import partial
+from multiprocessing import Pool
 
+import numpy as np
+
+from p2smi.fasta2smi import records_to_smiles
 from p2smi.utilities.aminoacids import all_aminos
+from p2smi.utilities.membership import make_unique_filter
+from p2smi.utilities.parallel import ordered_imap
+from p2smi.utilities.residueprops import (
+    contribution_arrays,
+    estimate_batch,
+    estimate_properties,
+    exact_properties,
+)
+from p2smi.utilities.sampling import AliasTable
+from p2smi.utilities.seeding import (
+    child_sequence,
+    numpy_rng,
+    python_rng,
+    root_sequence,
+)
 
 
 def get_amino_acid_lists():
@@ -74,6 +116,184 @@ def get_amino_acid_lists():
 
 CONSTRAINTS = ["SS", "HT", "SCNT", "SCCT", "SCSC"]  # Supported constraint types
 
+# Residue properties (from all_aminos) that can act as each bonding site
+SITE_PROPERTIES = {
+    "disulphide": ("disulphide",),
+    "cterm": ("cterm",),
+    "partner": ("nterm", "ester"),  # amine or hydroxyl partner of an acid
+}
+# Sites each constraint needs, mirroring the smilesgen.can_* checks
+CONSTRAINT_SITES = {
+    "SS": ("disulphide", "disulphide"),
+    "HT": (),
+    "SCNT": ("cterm",),
+    "SCCT": ("partner",),
+    "SCSC": ("cterm", "partner"),
+}
+
+
+def constraint_feasible(constraint, seq_len):
+    # Whether a sequence of this length can carry the constraint at all
+    if constraint == "HT":
+        return seq_len >= 5 or seq_len == 2
+    if constraint == "SCSC":
+        return seq_len >= 3
+    return seq_len >= 4
+
+
+def feasible_constraints(seq_len, constraints):
+    return [c for c in constraints if constraint_feasible(c, seq_len)]
+
+
+def get_site_pools(amino_lists):
+    # For each site class, the letters of each of the four pools that can form
+    # the bond. A pool without any falls back to every compatible letter, so
+    # placement keeps the D-/L- and canonical mix wherever the pool allows it.
+    by_letter = {props["Letter"]: props for props in all_aminos.values()}
+    pools = {}
+    for site, props in SITE_PROPERTIES.items():
+        per_pool = [
+            [aa for aa in pool if any(by_letter[aa][prop] for prop in props)]
+            for pool in amino_lists
+        ]
+        union = [aa for letters in per_pool for aa in letters]
+        pools[site] = [letters or union for letters in per_pool]
+    return pools
+
+
+def constraint_site_positions(constraint, seq_len, rng=random):
+    # Draw positions for the constraint's sites, matching the smilesgen rules:
+    # SS cysteines >= 3 apart, SCNT acid at index >= 3, SCCT partner before the
+    # last three residues, SCSC acid and partner >= 2 apart.
+    if constraint == "SS":
+        i = rng.randrange(seq_len - 3)
+        return i, rng.randrange(i + 3, seq_len)
+    if constraint == "SCNT":
+        return (rng.randrange(3, seq_len),)
+    if constraint == "SCCT":
+        return (rng.randrange(seq_len - 3),)
+    if constraint == "SCSC":
+        while True:
+            i, j = rng.randrange(seq_len), rng.randrange(seq_len)
+            if abs(i - j) >= 2:
+                return i, j
+    return ()
+
+
+def place_constraint_sites(seq, constraint, amino_lists, site_pools, rng=random):
+    # Overwrite the constraint's site positions with compatible residues drawn
+    # from the same pool as the residue they replace.
+    pool_of = {aa: k for k, pool in enumerate(amino_lists) for aa in pool}
+    letters = list(seq)
+    positions = constraint_site_positions(constraint, len(letters), rng)
+    for pos, site in zip(positions, CONSTRAINT_SITES[constraint]):
+        letters[pos] = rng.choice(site_pools[site][pool_of[letters[pos]]])
+    return "".join(letters)
+
+
+# ---------- Composition profiles ----------
+
+
+def load_profile(path):
+    # Read a JSON composition profile:
+    #   {"weights": {"A": 2.0, "K": 0.5, ...},     # per residue, default 1.0
+    #    "positions": [{"C": 1.0}, {"A": 1, "G": 3}, ...]}   # optional PSSM
+    # Weights reweight residues within their pool; a position matrix instead
+    # draws position i of every sequence from row i (unlisted residues: 0).
+    with open(path, "r") as f:
+        profile = json.load(f)
+    if not isinstance(profile, dict) or not set(profile) <= {"weights", "positions"}:
+        raise ValueError("profile must be an object with 'weights' and/or 'positions'")
+    return profile
+
+
+def _check_weights(weights, letters, what):
+    if not isinstance(weights, dict):
+        raise ValueError(f"{what} must map residue letters to weights")
+    unknown = set(weights) - set(letters)
+    if unknown:
+        raise ValueError(f"{what} names unknown residues: {''.join(sorted(unknown))}")
+    if any(not isinstance(w, (int, float)) or w < 0 for w in weights.values()):
+        raise ValueError(f"{what} must be non-negative numbers")
+
+
+def build_profile_samplers(amino_lists, profile, max_length=None):
+    # Turn a profile into alias tables: one per pool (None where the profile
+    # zeroes out a whole pool) and/or one (table, letters, residue indices)
+    # triple per position.
+    if not profile:
+        return None, None
+    all_letters = [aa for pool in amino_lists for aa in pool]
+    pool_tables = position_tables = None
+
+    weights = profile.get("weights")
+    if weights:
+        _check_weights(weights, all_letters, "weights")
+        pool_tables = []
+        for pool in amino_lists:
+            pool_weights = [weights.get(aa, 1.0) for aa in pool]
+            pool_tables.append(AliasTable(pool_weights) if sum(pool_weights) else None)
+
+    positions = profile.get("positions")
+    if positions:
+        if max_length is not None and max_length > len(positions):
+            raise ValueError(
+                f"profile has {len(positions)} positions; max length is {max_length}"
+            )
+        index_of = {aa: i for i, aa in enumerate(all_letters)}
+        position_tables = []
+        for i, row in enumerate(positions, start=1):
+            _check_weights(row, all_letters, f"position {i}")
+            letters = [aa for aa, w in row.items() if w > 0]
+            if not letters:
+                raise ValueError(f"position {i} has no residue with positive weight")
+            position_tables.append(
+                (
+                    AliasTable([row[aa] for aa in letters]),
+                    letters,
+                    [index_of[aa] for aa in letters],
+                )
+            )
+    return pool_tables, position_tables
+
+
+def _pool_table(pool_tables, k):
+    table = pool_tables[k]
+    if table is None:
+        raise ValueError("profile gives zero weight to a residue pool the mix needs")
+    return table
+
+
+# ---------- Property targets ----------
+
+MAX_TARGET_ATTEMPTS = 10000  # redraws per record (scalar) or rounds per batch
+_UNREACHABLE_TARGETS = (
+    f"no sequence fell inside the target windows after {MAX_TARGET_ATTEMPTS} "
+    "attempts; widen the windows or adjust length/composition"
+)
+
+
+def parse_window(text):
+    # "lo:hi" -> (lo, hi); either side may be empty for an open bound
+    lo, sep, hi = text.partition(":")
+    if not sep:
+        raise ValueError(f"window {text!r} must look like 'lo:hi'")
+    return (float(lo) if lo.strip() else None, float(hi) if hi.strip() else None)
+
+
+def within_targets(values, targets):
+    # targets: {"mw": (lo, hi), "logp": ..., "charge": ...}; works elementwise
+    # on arrays. Properties missing from `values` are not checked.
+    ok = True
+    for prop, (lo, hi) in targets.items():
+        if prop not in values:
+            continue
+        if lo is not None:
+            ok = ok & (values[prop] >= lo)
+        if hi is not None:
+            ok = ok & (values[prop] <= hi)
+    return ok
+
 
 def calculate_amino_acid_counts(seq_len, noncanonical_percent, dextro_percent):
     # Calculate counts of each category (canonical/noncanonical, L-/D-form)
@@ -84,23 +304,318 @@ def calculate_amino_acid_counts(seq_len, noncanonical_percent, dextro_percent):
     return ln_c, dn_c, ln_nc, dn_nc
 
 
-def build_sequence(seq_len, noncanonical_percent, dextro_percent, amino_lists):
+def build_sequence(
+    seq_len,
+    noncanonical_percent,
+    dextro_percent,
+    amino_lists,
+    rng=random,
+    pool_tables=None,
+):
     # Build a random sequence of specified length with defined fractions of
-    # canonical/noncanonical and D-/L-form residues.
+    # canonical/noncanonical and D-/L-form residues. `rng` is the random
+    # module or a random.Random stream; `pool_tables` reweights each pool.
     canonical, lower_canon, upper_noncon, lower_noncon = amino_lists
     ln_c, dn_c, ln_nc, dn_nc = calculate_amino_acid_counts(
         seq_len, noncanonical_percent, dextro_percent
     )
-    sequence_parts = (
-        random.choices(canonical, k=ln_c)
-        + random.choices(lower_canon, k=dn_c)
-        + random.choices(upper_noncon, k=ln_nc)
-        + random.choices(lower_noncon, k=dn_nc)
-    )
-    random.shuffle(sequence_parts)
+    if pool_tables is None:
+        sequence_parts = (
+            rng.choices(canonical, k=ln_c)
+            + rng.choices(lower_canon, k=dn_c)
+            + rng.choices(upper_noncon, k=ln_nc)
+            + rng.choices(lower_noncon, k=dn_nc)
+        )
+    else:
+        sequence_parts = []
+        for k, (pool, count) in enumerate(zip(amino_lists, (ln_c, dn_c, ln_nc, dn_nc))):
+            if count:
+                table = _pool_table(pool_tables, k)
+                sequence_parts += [pool[j] for j in table.sample(rng, count)]
+    rng.shuffle(sequence_parts)
     return "".join(sequence_parts)
 
 
+def build_positional_sequence(seq_len, position_tables, rng=random):
+    # Build a sequence whose residue i is drawn from profile position i
+    return "".join(
+        letters[table.sample(rng, 1)[0]]
+        for table, letters, _ in position_tables[:seq_len]
+    )
+
+
+# ---------- Batched (NumPy) engine ----------
+
+BATCH_SIZE = 8192  # sequences per batch (NumPy engine) and per shard
+
+
+def build_code_table(amino_lists):
+    # Flatten the four pools into one uint32 code-point table; each pool is
+    # addressed by (offset, size) so a residue index maps straight to a letter.
+    table = np.array([ord(aa) for pool in amino_lists for aa in pool], dtype=np.uint32)
+    sizes = [len(pool) for pool in amino_lists]
+    offsets = [sum(sizes[:i]) for i in range(len(sizes))]
+    return table, sizes, offsets
+
+
+def build_index_batch(
+    rng,
+    n,
+    seq_len,
+    noncanonical_percent,
+    dextro_percent,
+    code_table,
+    pool_tables=None,
+):
+    # Draw an (n, seq_len) residue index matrix pool by pool and shuffle every
+    # row independently.
+    _, sizes, offsets = code_table
+    counts = calculate_amino_acid_counts(seq_len, noncanonical_percent, dextro_percent)
+    blocks = []
+    for k, (count, size, offset) in enumerate(zip(counts, sizes, offsets)):
+        if not count:
+            continue
+        if pool_tables is None:
+            blocks.append(rng.integers(size, size=(n, count)) + offset)
+        else:
+            blocks.append(_pool_table(pool_tables, k).draw(rng, (n, count)) + offset)
+    if not blocks:
+        return np.empty((n, 0), dtype=np.int64)
+    return rng.permuted(np.concatenate(blocks, axis=1), axis=1)
+
+
+def build_positional_index_batch(rng, n, seq_len, position_tables):
+    # Index matrix whose column i is drawn from profile position i
+    idx = np.empty((n, seq_len), dtype=np.int64)
+    for i, (table, _, indices) in enumerate(position_tables[:seq_len]):
+        idx[:, i] = np.asarray(indices)[table.draw(rng, n)]
+    return idx
+
+
+def decode_index_batch(idx, code_table):
+    # Decode a residue index matrix through the code-point table, viewing each
+    # row as a single fixed-width string.
+    n, seq_len = idx.shape
+    if seq_len == 0:
+        return [""] * n
+    codes = np.ascontiguousarray(code_table[0][idx])
+    return codes.view(f"U{seq_len}").ravel().tolist()
+
+
+def build_sequence_batch(
+    rng, n, seq_len, noncanonical_percent, dextro_percent, code_table
+):
+    # Build n sequences of one length at once
+    if seq_len == 0:
+        return [""] * n
+    idx = build_index_batch(
+        rng, n, seq_len, noncanonical_percent, dextro_percent, code_table
+    )
+    return decode_index_batch(idx, code_table)
+
+
+def build_site_index_table(amino_lists):
+    # get_site_pools as residue indices into the code table
+    index_of = {aa: i for i, aa in enumerate(aa for pool in amino_lists for aa in pool)}
+    return {
+        site: [np.array([index_of[aa] for aa in letters]) for letters in per_pool]
+        for site, per_pool in get_site_pools(amino_lists).items()
+    }
+
+
+def place_constraint_sites_batch(rng, idx, rows, constraint, code_table, site_table):
+    # Vectorised place_constraint_sites over the given rows of an index matrix
+    m, seq_len = len(rows), idx.shape[1]
+    if constraint == "SS":
+        i = rng.integers(0, seq_len - 3, size=m)
+        positions = [i, rng.integers(i + 3, seq_len)]
+    elif constraint == "SCNT":
+        positions = [rng.integers(3, seq_len, size=m)]
+    elif constraint == "SCCT":
+        positions = [rng.integers(0, seq_len - 3, size=m)]
+    elif constraint == "SCSC":
+        # every partner position at distance >= 2 from the acid is equally likely
+        if seq_len == 3:
+            i = 2 * rng.integers(0, 2, size=m)
+        else:
+            i = rng.integers(0, seq_len, size=m)
+        left = np.maximum(i - 1, 0)
+        r = rng.integers(0, left + np.maximum(seq_len - i - 2, 0))
+        positions = [i, np.where(r < left, r, r - left + i + 2)]
+    else:
+        return
+    offsets = np.asarray(code_table[2])
+    for cols, site in zip(positions, CONSTRAINT_SITES[constraint]):
+        pools = np.searchsorted(offsets, idx[rows, cols], side="right") - 1
+        picked = np.empty(m, dtype=idx.dtype)
+        for k, choices in enumerate(site_table[site]):
+            hit = np.flatnonzero(pools == k)
+            if hit.size:
+                picked[hit] = choices[rng.integers(len(choices), size=hit.size)]
+        idx[rows, cols] = picked
+
+
+def iter_sequences_batched(
+    num_sequences,
+    min_length,
+    max_length,
+    noncanonical_percent,
+    dextro_percent,
+    constraints,
+    batch_size=BATCH_SIZE,
+    rng=None,
+    start=0,
+    guaranteed=False,
+    profile=None,
+    targets=None,
+    exact_check=False,
+):
+    # NumPy counterpart of iter_sequences: lengths and constraints are drawn
+    # per batch, sequences are built per distinct length and scattered back.
+    # With `guaranteed`, constraints are drawn among those feasible for each
+    # length and their sites are placed before decoding. With `targets`, rows
+    # outside the windows are redrawn until the whole batch fits.
+    rng = np.random.default_rng() if rng is None else rng
+    amino_lists = get_amino_acid_lists()
+    code_table = build_code_table(amino_lists)
+    pool_tables, position_tables = build_profile_samplers(
+        amino_lists, profile, max_length
+    )
+    site_table = build_site_index_table(amino_lists) if guaranteed else None
+    if targets:
+        arrays = contribution_arrays([aa for pool in amino_lists for aa in pool])
+
+    def draw(n):
+        # One round of n candidates: (sequences, constraints, accepted mask)
+        lengths = rng.integers(min_length, max_length + 1, size=n)
+        seqs = np.empty(n, dtype=object)
+        tags = np.full(n, "", dtype=object)
+        ok = np.ones(n, dtype=bool)
+        if constraints and not guaranteed:
+            tags = np.array(constraints, dtype=object)[
+                rng.integers(len(constraints), size=n)
+            ]
+        for seq_len in np.unique(lengths):
+            rows = np.flatnonzero(lengths == seq_len)
+            if position_tables:
+                idx = build_positional_index_batch(
+                    rng, len(rows), int(seq_len), position_tables
+                )
+            else:
+                idx = build_index_batch(
+                    rng,
+                    len(rows),
+                    int(seq_len),
+                    noncanonical_percent,
+                    dextro_percent,
+                    code_table,
+                    pool_tables,
+                )
+            usable = (
+                feasible_constraints(int(seq_len), constraints) if guaranteed else []
+            )
+            if usable:
+                picks = rng.integers(len(usable), size=len(rows))
+                for k, constraint in enumerate(usable):
+                    sel = np.flatnonzero(picks == k)
+                    place_constraint_sites_batch(
+                        rng, idx, sel, constraint, code_table, site_table
+                    )
+                    tags[rows[sel]] = constraint
+            if targets:
+                ok[rows] = within_targets(
+                    estimate_batch(idx, arrays, tags[rows]), targets
+                )
+            seqs[rows] = decode_index_batch(idx, code_table)
+        if targets and exact_check:
+            for j in np.flatnonzero(ok):
+                ok[j] = within_targets(exact_properties(seqs[j], tags[j]), targets)
+        return seqs, tags, ok
+
+    for offset in range(0, num_sequences, batch_size):
+        n = min(batch_size, num_sequences - offset)
+        seqs, tags, ok = draw(n)
+        rounds = 0
+        while not ok.all():
+            rounds += 1
+            if rounds > MAX_TARGET_ATTEMPTS:
+                raise ValueError(_UNREACHABLE_TARGETS)
+            redo = np.flatnonzero(~ok)
+            seqs[redo], tags[redo], ok[redo] = draw(len(redo))
+        first = start + offset + 1
+        ids = [
+            f"seq_{i}|{tag}" if tag else f"seq_{i}"
+            for i, tag in zip(range(first, first + n), tags)
+        ]
+        yield from zip(ids, seqs.tolist())
+
+
+# ---------- Record streams ----------
+
+
+def iter_sequences(
+    num_sequences,
+    min_length,
+    max_length,
+    noncanonical_percent,
+    dextro_percent,
+    constraints,
+    rng=random,
+    start=0,
+    guaranteed=False,
+    profile=None,
+    targets=None,
+    exact_check=False,
+):
+    # Lazily yield (seq_id, sequence) records; nothing is held beyond one record.
+    # With `guaranteed`, the constraint is drawn among those feasible for the
+    # drawn length and its sites are placed in the sequence. With `targets`,
+    # candidates are redrawn until they fall inside every window.
+    amino_lists = get_amino_acid_lists()
+    pool_tables, position_tables = build_profile_samplers(
+        amino_lists, profile, max_length
+    )
+    site_pools = get_site_pools(amino_lists) if guaranteed else None
+
+    def draw():
+        if guaranteed:
+            seq_len = rng.randint(min_length, max_length)
+            usable = feasible_constraints(seq_len, constraints)
+            constraint = rng.choice(usable) if usable else None
+        else:
+            constraint = rng.choice(constraints) if constraints else None
+            seq_len = rng.randint(min_length, max_length)
+        if position_tables:
+            seq = build_positional_sequence(seq_len, position_tables, rng)
+        else:
+            seq = build_sequence(
+                seq_len,
+                noncanonical_percent,
+                dextro_percent,
+                amino_lists,
+                rng,
+                pool_tables,
+            )
+        if guaranteed and constraint:
+            seq = place_constraint_sites(seq, constraint, amino_lists, site_pools, rng)
+        return constraint, seq
+
+    for i in range(start, start + num_sequences):
+        for _ in range(MAX_TARGET_ATTEMPTS):
+            constraint, seq = draw()
+            if not targets:
+                break
+            if within_targets(estimate_properties(seq, constraint), targets) and (
+                not exact_check
+                or within_targets(exact_properties(seq, constraint), targets)
+            ):
+                break
+        else:
+            raise ValueError(_UNREACHABLE_TARGETS)
+        seq_id = f"seq_{i + 1}|{constraint}" if constraint else f"seq_{i + 1}"
+        yield seq_id, seq
+
+
 def generate_sequences(
     num_sequences,
     min_length,
@@ -110,29 +625,216 @@ def generate_sequences(
     constraints,
 ):
     # Generate a dictionary of random sequences with optional constraints
-    amino_lists = get_amino_acid_lists()
+    # (materialises everything; prefer iter_sequences for large runs)
+    return dict(
+        iter_sequences(
+            num_sequences,
+            min_length,
+            max_length,
+            noncanonical_percent,
+            dextro_percent,
+            constraints,
+        )
+    )
+
+
+def generate_shard(
+    shard_index,
+    root,
+    num_sequences,
+    min_length,
+    max_length,
+    noncanonical_percent,
+    dextro_percent,
+    constraints,
+    engine="numpy",
+    shard_size=BATCH_SIZE,
+    guaranteed=False,
+    profile=None,
+    targets=None,
+    exact_check=False,
+):
+    # Build the records of one shard from the shard's own child stream of root.
+    # Shard boundaries depend only on shard_size, so which process runs a
+    # shard has no influence on its output. num_sequences=None: a full shard.
+    start = shard_index * shard_size
+    n = shard_size if num_sequences is None else min(shard_size, num_sequences - start)
+    stream = child_sequence(root, shard_index)
+    if engine == "numpy":
+        records = iter_sequences_batched(
+            n,
+            min_length,
+            max_length,
+            noncanonical_percent,
+            dextro_percent,
+            constraints,
+            batch_size=shard_size,
+            rng=numpy_rng(stream),
+            start=start,
+            guaranteed=guaranteed,
+            profile=profile,
+            targets=targets,
+            exact_check=exact_check,
+        )
+    else:
+        records = iter_sequences(
+            n,
+            min_length,
+            max_length,
+            noncanonical_percent,
+            dextro_percent,
+            constraints,
+            rng=python_rng(stream),
+            start=start,
+            guaranteed=guaranteed,
+            profile=profile,
+            targets=targets,
+            exact_check=exact_check,
+        )
+    return list(records)
+
+
+def iter_sharded_sequences(
+    num_sequences,
+    min_length,
+    max_length,
+    noncanonical_percent,
+    dextro_percent,
+    constraints,
+    engine="numpy",
+    shard_size=BATCH_SIZE,
+    seed=None,
+    workers=1,
+    guaranteed=False,
+    profile=None,
+    unique=None,
+    targets=None,
+    exact_check=False,
+):
+    # Reproducible record stream: shards are generated in order (optionally
+    # across `workers` processes) and yielded in order. With a `unique` filter
+    # (see make_unique_filter) shards are drawn until num_sequences new
+    # sequences have been kept; kept records are renumbered consecutively.
+    build = partial(
+        generate_shard,
+        root=root_sequence(seed),
+        num_sequences=None if unique is not None else num_sequences,
+        min_length=min_length,
+        max_length=max_length,
+        noncanonical_percent=noncanonical_percent,
+        dextro_percent=dextro_percent,
+        constraints=constraints,
+        engine=engine,
+        shard_size=shard_size,
+        guaranteed=guaranteed,
+        profile=profile,
+        targets=targets,
+        exact_check=exact_check,
+    )
+    if unique is None:
+        for records in _iter_shards(
+            build, range(-(-num_sequences // shard_size)), workers
+        ):
+            yield from records
+        return
+
+    kept = 0
+    shard_stream = _iter_shards(build, itertools.count(), workers)
+    try:
+        while kept < num_sequences:
+            records = next(shard_stream)
+            # Offer the shard in slices no longer than the remaining quota, so
+            # the filter (and its rejected count) only ever sees records up to
+            # the last one written
+            start = 0
+            shard_fresh = False
+            while start < len(records) and kept < num_sequences:
+                batch = records[start : start + num_sequences - kept]
+                start += len(batch)
+                fresh = unique.add_many([seq for _, seq in batch])
+                shard_fresh |= bool(fresh.any())
+                for (seq_id, seq), keep in zip(batch, fresh.tolist()):
+                    if keep:
+                        kept += 1
+                        tag = seq_id.partition("|")[2]
+                        yield (f"seq_{kept}|{tag}" if tag else f"seq_{kept}"), seq
+            if not shard_fresh:
+                print(
+                    f"warning: a whole shard held no new sequence; sequence space "
+                    f"looks exhausted, stopping at {kept} unique sequences",
+                    file=sys.stderr,
+                )
+                return
+    finally:
+        shard_stream.close()
+
+
+def _iter_shards(build, shards, workers):
+    # Yield each shard's record list in shard order
+    if workers > 1:
+        with Pool(processes=workers) as pool:
+            yield from ordered_imap(pool, build, shards, window=2 * workers)
+    else:
+        for shard_index in shards:
+            yield build(shard_index)
+
+
+WRITE_CHUNK_RECORDS = 4096  # FASTA records buffered per write() call
+
+
+def write_fasta(records, handle, chunk_records=WRITE_CHUNK_RECORDS):
+    # Write (seq_id, seq) records to an open handle in buffered chunks
+    buf = []
+    count = 0
+    for seq_id, seq in records:
+        buf.append(f">{seq_id}\n{seq}\n")
+        if len(buf) >= chunk_records:
+            handle.write("".join(buf))
+            count += len(buf)
+            buf.clear()
+    if buf:
+        handle.write("".join(buf))
+        count += len(buf)
+    return count
 
-    def make_sequence(i):
-        seq_id = f"seq_{i + 1}"
-        constraint = random.choice(constraints) if constraints else None
-        if constraint:
-            seq_id += f"|{constraint}"
-        seq_len = random.randint(min_length, max_length)
-        seq = build_sequence(seq_len, noncanonical_percent, dextro_percent, amino_lists)
-        return seq_id, seq
 
-    return dict(make_sequence(i) for i in range(num_sequences))
+def iter_peptide_smiles(records):
+    # (seq_id, seq) records -> (seq, bond_def, smiles), taking the constraint
+    # from the id's "|" tag as fasta2smi.parse_fasta would
+    return records_to_smiles(
+        (seq, seq_id.split("|")[-1] if "|" in seq_id else "") for seq_id, seq in records
+    )
+
+
+def write_smiles(structures, handle, chunk_records=WRITE_CHUNK_RECORDS):
+    # Write (seq, bond_def, smiles) in fasta2smi's text format, in chunks
+    buf = []
+    count = 0
+    for seq, bond_def, smiles in structures:
+        buf.append(f"{''.join(seq)}-{bond_def or 'linear'}: {smiles}\n")
+        if len(buf) >= chunk_records:
+            handle.write("".join(buf))
+            count += len(buf)
+            buf.clear()
+    if buf:
+        handle.write("".join(buf))
+        count += len(buf)
+    return count
 
 
-def output_sequences(sequences, outfile=None):
-    # Print or write sequences in FASTA format to a file if specified
-    lines = [f">{seq_id}\n{seq}" for seq_id, seq in sequences.items()]
-    output = "\n".join(lines)
+def output_sequences(sequences, outfile=None, output_format="fasta"):
+    # Print or write sequences in FASTA format (or as fasta2smi-style SMILES
+    # lines) to a file if specified. Accepts a dict or any iterable of
+    # (seq_id, seq) pairs and streams it.
+    records = sequences.items() if isinstance(sequences, dict) else sequences
+    if output_format == "smiles":
+        records, write = iter_peptide_smiles(records), write_smiles
+    else:
+        write = write_fasta
     if outfile:
         with open(outfile, "w") as f:
-            f.write(output + "\n")
-    else:
-        print(output)
+            return write(records, f)
+    return write(records, sys.stdout)
 
 
 def main():
@@ -153,26 +855,156 @@ def main():
         help="Cyclization types: 'all', 'none', or comma-separated list like 'HT,SCSC'",
     )
     parser.add_argument("-o", "--outfile", type=str, default=None)
+    parser.add_argument(
+        "--engine",
+        choices=["python", "numpy"],
+        default="python",
+        help="Sampling engine: per-sequence pure Python (default) or batched "
+        "NumPy (much faster for large runs; a different random stream).",
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=BATCH_SIZE,
+        help="Records per shard; each shard draws from its own random stream.",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Seed for reproducible output (same seed and batch size, same file).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Processes generating shards in parallel (output is unchanged).",
+    )
+    parser.add_argument(
+        "--guarantee_constraints",
+        action="store_true",
+        help="Place the residues each cyclization needs while sampling, so every "
+        "tagged sequence can cyclize (lengths that allow none stay linear).",
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        default=None,
+        help="JSON composition profile: per-residue 'weights' and/or a "
+        "position-specific 'positions' frequency matrix.",
+    )
+    parser.add_argument(
+        "--unique",
+        nargs="?",
+        const="auto",
+        default=None,
+        choices=["auto", "exact", "bloom"],
+        help="Emit no duplicate sequences: 'exact' hash set, 'bloom' filter, or "
+        "'auto' (exact for small runs, Bloom filter beyond).",
+    )
+    parser.add_argument(
+        "--unique_fp_rate",
+        type=float,
+        default=1e-3,
+        help="Bloom filter false-positive budget (new sequences wrongly dropped).",
+    )
+    for prop, what in (
+        ("mw", "average molecular weight"),
+        ("logp", "Crippen logP"),
+        ("charge", "side-chain charge at neutral pH"),
+    ):
+        parser.add_argument(
+            f"--{prop}_range",
+            type=str,
+            default=None,
+            metavar="LO:HI",
+            help=f"Keep only peptides whose estimated {what} is in LO:HI "
+            "(either side may be left open).",
+        )
+    parser.add_argument(
+        "--exact_check",
+        action="store_true",
+        help="Confirm MW/logP windows with RDKit on candidates that pass the "
+        "residue-additive estimates.",
+    )
+    parser.add_argument(
+        "--output_format",
+        choices=["fasta", "smiles"],
+        default="fasta",
+        help="'smiles' assembles each peptide directly and writes fasta2smi "
+        "output ('SEQ-bond: SMILES'), skipping the intermediate FASTA file.",
+    )
     args = parser.parse_args()
 
+    targets = {}
+    for prop in ("mw", "logp", "charge"):
+        window = getattr(args, f"{prop}_range")
+        if window:
+            try:
+                targets[prop] = parse_window(window)
+            except ValueError as e:
+                parser.error(f"--{prop}_range: {e}")
+
+    profile = None
+    if args.profile:
+        try:
+            profile = load_profile(args.profile)
+            build_profile_samplers(get_amino_acid_lists(), profile, args.max_length)
+        except (OSError, ValueError) as e:
+            parser.error(f"--profile: {e}")
+
     # if constraints is "all", use all supported constraints
     if args.cyclization_constraints == "all":
-        constraints = ["SS", "HT", "SCNT", "SCCT", "SCSC"]
-    elif args.cyclization_constraints is None:
+        constraints = list(CONSTRAINTS)
+    elif args.cyclization_constraints in (None, "none"):
         constraints = []
     else:
-        constraints = [args.cyclization_constraints]
+        constraints = [
+            c.strip().upper() for c in args.cyclization_constraints.split(",")
+        ]
+    if args.guarantee_constraints and not set(constraints) <= set(CONSTRAINTS):
+        parser.error(f"--guarantee_constraints supports only {', '.join(CONSTRAINTS)}")
+    if targets and not set(constraints) <= set(CONSTRAINTS):
+        # the estimators need the cyclisation type, which e.g. "SC" leaves open
+        parser.error(
+            f"--mw_range, --logp_range and --charge_range support only "
+            f"{', '.join(CONSTRAINTS)} constraints"
+        )
+
+    if not 0 < args.unique_fp_rate < 1:
+        parser.error("--unique_fp_rate must be between 0 and 1")
+    if args.batch_size < 1 or args.workers < 1:
+        parser.error("--batch_size and --workers must be at least 1")
+
+    unique = None
+    if args.unique:
+        unique = make_unique_filter(args.unique, args.num, args.unique_fp_rate)
 
-    sequences = generate_sequences(
+    sequences = iter_sharded_sequences(
         args.num,
         args.min_length,
         args.max_length,
         args.noncanonical,
         args.dextro,
         constraints,
+        engine=args.engine,
+        shard_size=args.batch_size,
+        seed=args.seed,
+        workers=args.workers,
+        guaranteed=args.guarantee_constraints,
+        profile=profile,
+        unique=unique,
+        targets=targets or None,
+        exact_check=args.exact_check,
     )
 
-    output_sequences(sequences, args.outfile)
+    written = output_sequences(sequences, args.outfile, args.output_format)
+    if unique is not None:
+        print(
+            f"unique: wrote {written} sequences, rejected {unique.rejected} "
+            f"repeats; {unique.describe()}",
+            file=sys.stderr,
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,272 @@
+"""
+3D shape descriptors from multi-conformer embeddings (smiles-props 3D stage).
+
+Conformers are embedded with ETKDGv3 using the macrocycle settings
+(useMacrocycleTorsions, useMacrocycle14config), in RDKit's own threads
+(numThreads), then relaxed with MMFF94 (UFF where MMFF lacks parameters).
+The lowest-energy conformer gives the radius of gyration, principal
+moments of inertia, normalised PMI ratios and the 3D polar surface area
+(FreeSASA surface of N, O and their hydrogens). The energy spread is over
+all conformers.
+
+Every molecule has a wall-clock budget. ETKDG's own timeout is per
+conformer and not a hard limit (a 40-residue macrocycle can take tens of
+seconds on one attempt), so the work runs in a persistent worker process
+that is killed at the deadline and restarted for the next molecule. The
+worker is a fresh interpreter (see ConformerWorker), never a fork of the
+caller, which may be running RDKit threads of its own. Inside it,
+conformers are embedded a batch (one per thread) at a time and relaxed one
+at a time, with the deadline checked between calls: embedding stops once
+half the budget is used, and conformers not relaxed in time are dropped.
+Whenever the limit cuts the work short, "timed_out" is True; a molecule
+with no relaxed conformer by then gets 0 conformers and no values, so one
+pathological 100-mer cannot stall a run. Embedding is seeded, so results
+are reproducible unless the budget cuts the conformer count.
+"""
+
+import atexit
+import math
+import os
+import pickle
+import queue
+import subprocess
+import sys
+import threading
+import time
+from typing import NamedTuple
+
+from rdkit import Chem
+from rdkit.Chem import rdDistGeom, rdForceFieldHelpers, rdFreeSASA, rdMolDescriptors
+
+CONFORMER_PROPERTIES = (
+    "conformers",
+    "timed_out",
+    "rg",
+    "pmi1",
+    "pmi2",
+    "pmi3",
+    "npr1",
+    "npr2",
+    "psa3d",
+    "energy_range",
+)
+
+
+class ConformerSettings(NamedTuple):
+    count: int = 10  # conformers per molecule (at most)
+    threads: int = 1  # RDKit embedding threads per molecule (0 = all cores)
+    time_limit: float = 10.0  # seconds per molecule
+    seed: int = 42
+    max_iters: int = 200  # force-field iterations per conformer
+
+
+def embed_params(settings: ConformerSettings, timeout: float, seed: int):
+    params = rdDistGeom.ETKDGv3()
+    params.useMacrocycleTorsions = True
+    params.useMacrocycle14config = True
+    params.numThreads = settings.threads
+    params.randomSeed = seed
+    params.pruneRmsThresh = 0.5
+    params.timeout = max(1, math.ceil(timeout))  # whole seconds per conformer
+    return params
+
+
+def _no_conformers(timed_out):
+    return dict.fromkeys(CONFORMER_PROPERTIES, None) | {
+        "conformers": 0,
+        "timed_out": timed_out,
+    }
+
+
+def _force_field(mol, conf_id):
+    # MMFF94 force field of one conformer, UFF where MMFF lacks parameters
+    props = rdForceFieldHelpers.MMFFGetMoleculeProperties(mol)
+    if props is not None:
+        return rdForceFieldHelpers.MMFFGetMoleculeForceField(mol, props, confId=conf_id)
+    return rdForceFieldHelpers.UFFGetMoleculeForceField(mol, confId=conf_id)
+
+
+def _polar_surface(mol, conf_id):
+    # FreeSASA surface (default Lee-Richards) of N, O and H on N/O
+    radii = rdFreeSASA.classifyAtoms(mol)
+    rdFreeSASA.CalcSASA(mol, radii, confIdx=conf_id)
+    return sum(
+        float(atom.GetProp("SASA"))
+        for atom in mol.GetAtoms()
+        if atom.GetAtomicNum() in (7, 8)
+        or (
+            atom.GetAtomicNum() == 1 and atom.GetNeighbors()[0].GetAtomicNum() in (7, 8)
+        )
+    )
+
+
+# Seconds the caller waits past the deadline for the worker's result
+_GRACE = 0.25
+_EXITED = object()  # reply queued when the worker's output closes
+
+
+class ConformerWorker:
+    """
+    One conformer process, started with subprocess (fork and exec, so it
+    shares no threads or RDKit locks with the caller) and fed pickled
+    (mol, settings) requests over its stdin; see serve() for its side.
+    """
+
+    def __init__(self):
+        root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+        path = os.pathsep.join(filter(None, (root, os.environ.get("PYTHONPATH"))))
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", __name__],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env={**os.environ, "PYTHONPATH": path},
+        )
+        self.replies = queue.Queue()
+        threading.Thread(target=self._read, daemon=True).start()
+        # Interpreter start-up and imports are not charged to any molecule
+        if self.replies.get() is _EXITED:
+            raise RuntimeError("the conformer worker failed to start")
+
+    def _read(self):
+        try:
+            while True:
+                self.replies.put(pickle.load(self.proc.stdout))
+        except (EOFError, OSError, pickle.UnpicklingError):
+            self.replies.put(_EXITED)
+
+    def run(self, mol, settings):
+        # Result dict, or None if the time limit passed (the worker is then
+        # killed; the caller starts a new one)
+        pickle.dump((mol, settings), self.proc.stdin)
+        self.proc.stdin.flush()
+        try:
+            reply = self.replies.get(timeout=settings.time_limit + _GRACE)
+        except queue.Empty:
+            self.close()
+            return None
+        if reply is _EXITED:
+            self.close()
+            raise RuntimeError("the conformer worker exited unexpectedly")
+        ok, value = reply
+        if not ok:
+            raise RuntimeError(f"conformer embedding failed: {value}")
+        return value
+
+    def close(self):
+        self.proc.kill()
+        self.proc.wait()
+        for stream in (self.proc.stdin, self.proc.stdout):
+            stream.close()
+
+
+_worker = None
+
+
+def _close_worker():
+    global _worker
+    if _worker is not None:
+        _worker.close()
+        _worker = None
+
+
+def _forget_worker():
+    # A forked child (a --procs pool worker) starts its own worker: the
+    # parent's reader thread did not survive the fork
+    global _worker
+    _worker = None
+
+
+atexit.register(_close_worker)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_worker)
+
+
+def conformer_properties(
+    mol: Chem.Mol, settings: ConformerSettings = ConformerSettings()
+) -> dict:
+    """
+    {"conformers": n, "timed_out", "rg", "pmi1", "pmi2", "pmi3", "npr1",
+    "npr2", "psa3d", "energy_range"} for one molecule (see the module
+    docstring); n is 0 and the rest None if no conformer fits the time
+    limit, or if none could be embedded at all (then timed_out is False).
+    """
+    global _worker
+    if _worker is None:
+        _worker = ConformerWorker()
+    result = _worker.run(mol, settings)
+    if result is None:
+        _worker = None
+        return _no_conformers(timed_out=True)
+    return result
+
+
+def serve():
+    # Worker side: answer (mol, settings) requests from stdin until it closes.
+    # Replies go out on a private copy of stdout; fd 1 itself then points at
+    # stderr so stray library output cannot corrupt them.
+    out = os.fdopen(os.dup(1), "wb")
+    os.dup2(2, 1)
+    requests = sys.stdin.buffer
+    pickle.dump("ready", out)
+    out.flush()
+    while True:
+        try:
+            mol, settings = pickle.load(requests)
+        except EOFError:
+            return
+        deadline = time.monotonic() + settings.time_limit
+        try:
+            reply = True, _conformer_properties(mol, settings, deadline)
+        except Exception as err:
+            reply = False, f"{type(err).__name__}: {err}"
+        pickle.dump(reply, out)
+        out.flush()
+
+
+def _conformer_properties(mol, settings, deadline):
+    start = time.monotonic()
+    mol = Chem.AddHs(mol)
+    batch = settings.threads or os.cpu_count() or 1
+    embed_until = start + settings.time_limit / 2  # the rest is for relaxation
+    seed = settings.seed
+    timed_out = False
+    while mol.GetNumConformers() < settings.count:
+        now = time.monotonic()
+        if now >= deadline or (mol.GetNumConformers() and now >= embed_until):
+            timed_out = True
+            break
+        params = embed_params(settings, deadline - now, seed)
+        params.clearConfs = False
+        n = min(batch, settings.count - mol.GetNumConformers())
+        if not rdDistGeom.EmbedMultipleConfs(mol, n, params):
+            break  # no more (distinct) conformers to be found
+        seed += n
+
+    energies = {}
+    for conf in mol.GetConformers():
+        if time.monotonic() >= deadline:
+            timed_out = True
+            break
+        ff = _force_field(mol, conf.GetId())
+        ff.Minimize(maxIts=settings.max_iters)
+        energies[conf.GetId()] = ff.CalcEnergy()
+    if not energies:
+        return _no_conformers(timed_out)
+
+    best = min(energies, key=energies.get)
+    return {
+        "conformers": len(energies),
+        "timed_out": timed_out,
+        "rg": rdMolDescriptors.CalcRadiusOfGyration(mol, confId=best),
+        "pmi1": rdMolDescriptors.CalcPMI1(mol, confId=best),
+        "pmi2": rdMolDescriptors.CalcPMI2(mol, confId=best),
+        "pmi3": rdMolDescriptors.CalcPMI3(mol, confId=best),
+        "npr1": rdMolDescriptors.CalcNPR1(mol, confId=best),
+        "npr2": rdMolDescriptors.CalcNPR2(mol, confId=best),
+        "psa3d": _polar_surface(mol, best),
+        "energy_range": max(energies.values()) - min(energies.values()),
+    }
+
+
+if __name__ == "__main__":
+    serve()
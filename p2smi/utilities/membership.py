@@ -0,0 +1,184 @@
+"""
+Set-membership filters for duplicate-free streams.
+
+Both filters take items in batches through add_many(), which returns a mask of
+the items that were new (and records them). ExactSet is a plain hash set;
+ScalableBloomFilter keeps memory bounded at about 1.44 * log2(1 / fp_rate)
+bits per item, at the price of occasionally reporting a new item as already
+seen (a false positive; never the other way round).
+"""
+
+import hashlib
+import math
+
+import numpy as np
+
+
+def _first_occurrences(items):
+    # Mask of items not repeated earlier in the same batch
+    seen = set()
+    mask = []
+    for item in items:
+        mask.append(item not in seen)
+        seen.add(item)
+    return np.array(mask, dtype=bool)
+
+
+class ExactSet:
+    def __init__(self):
+        self._items = set()
+        self.rejected = 0
+
+    @property
+    def count(self):
+        return len(self._items)
+
+    @property
+    def false_positive_rate(self):
+        return 0.0
+
+    def add_many(self, items):
+        items = list(items)
+        fresh = _first_occurrences(items)
+        for j, item in enumerate(items):
+            if fresh[j] and item in self._items:
+                fresh[j] = False
+        self._items.update(items)
+        self.rejected += len(items) - int(fresh.sum())
+        return fresh
+
+    def describe(self):
+        return f"exact set of {self.count} items"
+
+
+class BloomFilter:
+    """Fixed-capacity Bloom filter using double hashing over a numpy bit array."""
+
+    def __init__(self, capacity, fp_rate):
+        if capacity < 1 or not 0 < fp_rate < 1:
+            raise ValueError("Bloom filter needs capacity >= 1 and 0 < fp_rate < 1")
+        self.capacity = capacity
+        self.num_bits = max(
+            8, math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2)
+        )
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = np.zeros((self.num_bits + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def _positions(self, hashes):
+        h1, h2 = hashes
+        steps = np.arange(self.num_hashes, dtype=np.uint64)
+        return (h1[:, None] + steps[None, :] * h2[:, None]) % np.uint64(self.num_bits)
+
+    def contains(self, hashes):
+        pos = self._positions(hashes)
+        hit = (
+            self.bits[pos >> np.uint64(3)] >> (pos & np.uint64(7)).astype(np.uint8)
+        ) & 1
+        return hit.all(axis=1)
+
+    def add(self, hashes):
+        pos = self._positions(hashes).ravel()
+        masks = np.left_shift(1, (pos & np.uint64(7)).astype(np.uint8)).astype(np.uint8)
+        np.bitwise_or.at(self.bits, pos >> np.uint64(3), masks)
+        self.count += len(hashes[0])
+
+    @property
+    def false_positive_rate(self):
+        # Expected rate for the current fill level
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** (
+            self.num_hashes
+        )
+
+
+class ScalableBloomFilter:
+    """
+    Chain of Bloom filters (Almeida et al., 2007): when one reaches its
+    capacity a larger one (x growth) with a tighter error (x tightening) is
+    added, so the compound false-positive rate stays below fp_rate however
+    many items arrive.
+    """
+
+    def __init__(self, initial_capacity, fp_rate=1e-3, growth=2, tightening=0.5):
+        self.fp_rate = fp_rate
+        self.growth = growth
+        self.tightening = tightening
+        self.filters = [BloomFilter(initial_capacity, self._filter_fp(0))]
+        self.rejected = 0
+
+    def _filter_fp(self, index):
+        # Error budget of the index-th filter; the budgets sum to fp_rate
+        return self.fp_rate * (1 - self.tightening) * self.tightening**index
+
+    @property
+    def count(self):
+        return sum(f.count for f in self.filters)
+
+    @property
+    def nbytes(self):
+        return sum(f.bits.nbytes for f in self.filters)
+
+    @property
+    def false_positive_rate(self):
+        # Probability that a new item is reported as seen, at the current fill
+        miss = 1.0
+        for f in self.filters:
+            miss *= 1 - f.false_positive_rate
+        return 1 - miss
+
+    @staticmethod
+    def _hash(items):
+        # Two 64-bit hashes per item from one keyless (hence reproducible) digest
+        blake2b = hashlib.blake2b
+        digests = b"".join(
+            blake2b(item.encode(), digest_size=16).digest() for item in items
+        )
+        pairs = np.frombuffer(digests, dtype="<u8").reshape(-1, 2)
+        return pairs[:, 0].copy(), pairs[:, 1] | np.uint64(1)
+
+    def add_many(self, items):
+        items = list(items)
+        fresh = _first_occurrences(items)
+        rows = np.flatnonzero(fresh)
+        if rows.size:
+            h1, h2 = self._hash([items[j] for j in rows])
+            seen = np.zeros(rows.size, dtype=bool)
+            for f in self.filters:
+                seen |= f.contains((h1, h2))
+            fresh[rows[seen]] = False
+            new = np.flatnonzero(~seen)
+            while new.size:
+                current = self.filters[-1]
+                room = current.capacity - current.count
+                if room <= 0:
+                    self.filters.append(
+                        BloomFilter(
+                            current.capacity * self.growth,
+                            self._filter_fp(len(self.filters)),
+                        )
+                    )
+                    continue
+                take, new = new[:room], new[room:]
+                current.add((h1[take], h2[take]))
+        self.rejected += len(items) - int(fresh.sum())
+        return fresh
+
+    def describe(self):
+        return (
+            f"Bloom filter of {self.count} items in {self.nbytes / 2**20:.1f} MiB, "
+            f"estimated false-positive rate {self.false_positive_rate:.2e}"
+        )
+
+
+EXACT_UNIQUE_LIMIT = 1_000_000  # auto mode: exact set up to this many items
+
+
+def make_unique_filter(mode, expected_items, fp_rate=1e-3):
+    # "exact", "bloom", or "auto" (exact for small runs, Bloom beyond that)
+    if mode == "auto":
+        mode = "exact" if expected_items <= EXACT_UNIQUE_LIMIT else "bloom"
+    if mode == "exact":
+        return ExactSet()
+    if mode == "bloom":
+        return ScalableBloomFilter(max(expected_items, 1), fp_rate)
+    raise ValueError(f"unknown uniqueness mode {mode!r}")
@@ -0,0 +1,347 @@
+"""
+Molecule-level modification engine for modify-smiles.
+
+The string engine in chemMods finds sites with regexes over the exact SMILES
+spelling p2smi writes. Here sites are found on the parsed molecule with
+precompiled SMARTS, so canonicalised or third-party SMILES work too:
+- backbone amide N (N-H between a carbonyl and an alpha carbon that carries
+  the next carbonyl) for N-methylation;
+- primary aliphatic amines (Lys-type side chains, free N-terminus) for
+  PEGylation. As in the string engine the PEG chain O(CCO){1..4}C is bonded
+  to the amine N through its first O.
+Each record is parsed once, edited in place through an RWMol, and
+serialised once. enumerate_variants() reuses one site search for every
+combination of N-methylation pattern and PEG attachment of a molecule.
+
+Further modifications are plugins in the MODIFICATIONS registry (see
+register_modification): N-acetylation, C-amidation, palmitoylation and
+biotinylation of Lys ship here. apply_modifications() runs any chain of them
+on a single parse of the record.
+"""
+
+import math
+import random
+from functools import lru_cache
+from itertools import chain, combinations, product
+
+from rdkit import Chem
+
+# Amide N-H whose carbon neighbour is an alpha carbon bearing a carbonyl;
+# excludes side-chain lactam N (Lys epsilon) and primary amides (Asn/Gln).
+BACKBONE_AMIDE_N = "[CX3](=O)[NX3;H1][CX4][CX3]=O"
+_BACKBONE_AMIDE_N = Chem.MolFromSmarts(BACKBONE_AMIDE_N)
+# Primary amine on sp3 carbon, not part of an amide/amidine/thioamide.
+PRIMARY_AMINE = "[NX3;H2;!$(N[#6]=[#7,#8,#16])][CX4]"
+_PRIMARY_AMINE = Chem.MolFromSmarts(PRIMARY_AMINE)
+
+
+def find_sites(mol):
+    # (backbone amide N indices, primary amine N indices), sorted
+    amide_ns = sorted(
+        {match[2] for match in mol.GetSubstructMatches(_BACKBONE_AMIDE_N)}
+    )
+    amines = sorted({match[0] for match in mol.GetSubstructMatches(_PRIMARY_AMINE)})
+    return amide_ns, amines
+
+
+@lru_cache(maxsize=None)
+def fragment(smiles):
+    # Substituent as a Mol; its first atom is the one bonded to the anchor
+    return Chem.MolFromSmiles(smiles)
+
+
+METHYL = "C"
+
+
+def peg_fragment(units):
+    # O(CCO){units}C, attached through the first O
+    return "O" + "CCO" * units + "C"
+
+
+def _attach(rwmol, anchor, substituent):
+    # Bond a substituent (SMILES, first atom first) to `anchor`, taking one H
+    atom = rwmol.GetAtomWithIdx(anchor)
+    if atom.GetNumExplicitHs():
+        atom.SetNumExplicitHs(atom.GetNumExplicitHs() - 1)
+    first = rwmol.GetNumAtoms()
+    rwmol.InsertMol(fragment(substituent))
+    rwmol.AddBond(anchor, first, Chem.BondType.SINGLE)
+
+
+def methylate(rwmol, sites, fraction, rng=random):
+    # N-methylate ceil(fraction * #sites) randomly chosen amide N; returns count
+    if fraction <= 0 or not sites:
+        return 0
+    k = math.ceil(len(sites) * fraction)
+    chosen = rng.sample(sites, min(k, len(sites)))
+    for idx in chosen:
+        _attach(rwmol, idx, METHYL)
+    return len(chosen)
+
+
+def pegylate(rwmol, sites, rng=random):
+    # Attach one PEG chain of 1-4 units at a random amine; returns units or None
+    if not sites:
+        return None
+    anchor = rng.choice(sites)
+    units = rng.randint(1, 4)
+    _attach(rwmol, anchor, peg_fragment(units))
+    return units
+
+
+def modify_smiles(
+    smiles,
+    do_methylate,
+    do_pegylate,
+    nmeth_residues,
+    rng=random,
+    trust_input=False,
+    mol=None,
+):
+    """
+    Apply the chosen modifications to one SMILES.
+
+    Returns (smiles, mods) with the same mod labels as the string engine, or
+    (None, []) if RDKit cannot parse the input. Unedited molecules keep their
+    input spelling; trusted input that is not being modified is not parsed.
+    mol, if given, is the already parsed input.
+    """
+    if trust_input and not (do_methylate or do_pegylate):
+        return smiles, []
+    if mol is None:
+        mol = Chem.MolFromSmiles(smiles)
+    if mol is None:
+        return None, []
+    amide_ns, amines = find_sites(mol)
+    rwmol = Chem.RWMol(mol)
+    mods = []
+    edited = False
+
+    if do_methylate:
+        count = methylate(rwmol, amide_ns, nmeth_residues, rng)
+        mods.append(f"N-methylation({count})")
+        edited = edited or count > 0
+
+    if do_pegylate:
+        units = pegylate(rwmol, amines, rng)
+        mods.append(f"PEGylation({units})" if units else "PEGylation('N/A')")
+        edited = edited or units is not None
+
+    if not edited:
+        return smiles, mods
+    try:
+        Chem.SanitizeMol(rwmol)
+    except Chem.rdchem.MolSanitizeException:
+        return None, []
+    return Chem.MolToSmiles(rwmol), mods
+
+
+PEG_UNITS = (1, 2, 3, 4)
+
+
+def _methylation_patterns(sites, k=None):
+    # All non-empty subsets of sites by increasing size, or only k-subsets
+    if k is None:
+        sizes = range(1, len(sites) + 1)
+    else:
+        sizes = [k] if 0 < k <= len(sites) else []
+    return chain.from_iterable(combinations(sites, size) for size in sizes)
+
+
+def enumerate_variants(smiles, k=None, peg=True, max_variants=None, mol=None):
+    """
+    Yield (mods, smiles) for combinatorial variants of one SMILES.
+
+    Every N-methylation pattern (or only those with exactly k methylated
+    amide N), as well as no methylation, is combined with no PEG and, if peg,
+    with each amine carrying each PEG length O(CCO){1..4}C. The unmodified
+    molecule itself is not emitted. Sites are found once; variants are
+    deduplicated by canonical SMILES (symmetric sites give the same molecule)
+    and at most max_variants are yielded. Yields nothing if RDKit cannot parse
+    the input (mol, if given, is the already parsed input).
+    """
+    if mol is None:
+        mol = Chem.MolFromSmiles(smiles)
+    if mol is None:
+        return
+    amide_ns, amines = find_sites(mol)
+    patterns = chain([()], _methylation_patterns(amide_ns, k))
+    pegs = [None] + list(product(amines, PEG_UNITS)) if peg else [None]
+    seen = set()
+    variants = (
+        (methylated, peg_site)
+        for methylated, peg_site in product(patterns, pegs)
+        if methylated or peg_site
+    )
+    for methylated, peg_site in variants:
+        rwmol = Chem.RWMol(mol)
+        mods = []
+        for idx in methylated:
+            _attach(rwmol, idx, METHYL)
+        if methylated:
+            mods.append(f"N-methylation({len(methylated)})")
+        if peg_site:
+            _attach(rwmol, peg_site[0], peg_fragment(peg_site[1]))
+            mods.append(f"PEGylation({peg_site[1]})")
+        try:
+            Chem.SanitizeMol(rwmol)
+        except Chem.rdchem.MolSanitizeException:
+            continue
+        variant = Chem.MolToSmiles(rwmol)
+        if variant in seen:
+            continue
+        seen.add(variant)
+        yield mods, variant
+        if max_variants is not None and len(seen) >= max_variants:
+            return
+
+
+# --- Modification plugins ---
+
+
+class Modification:
+    """
+    A registered modification: `pattern` (SMARTS) finds its sites, atom
+    `site` of each match is the anchor, and `attach(rwmol, anchor, rng)`
+    edits one anchor, optionally returning a detail for the label (e.g. PEG
+    length). `rate` is the default per-record probability; `fraction` the
+    default share of sites modified (None: a single site).
+    """
+
+    def __init__(self, name, label, pattern, site, attach, rate, fraction):
+        self.name = name
+        self.label = label
+        self.pattern = pattern
+        self.site = site
+        self.attach = attach
+        self.rate = rate
+        self.fraction = fraction
+
+    def sites(self, mol):
+        matches = mol.GetSubstructMatches(self.pattern)
+        return sorted({match[self.site] for match in matches})
+
+
+MODIFICATIONS = {}
+
+
+def register_modification(name, smarts, label, site=0, rate=0.2, fraction=None):
+    # Decorator adding attach(rwmol, anchor, rng) to MODIFICATIONS as `name`
+    def register(attach):
+        MODIFICATIONS[name] = Modification(
+            name, label, Chem.MolFromSmarts(smarts), site, attach, rate, fraction
+        )
+        return attach
+
+    return register
+
+
+# N-terminal primary amine: NH2 on an alpha carbon bearing a carbonyl
+_N_TERMINUS = "[NX3;H2][CX4][CX3]=O"
+# C-terminal acid: COOH on an alpha carbon bearing an N
+_C_TERMINUS = "[NX3][CX4][CX3](=O)[OX2H1]"
+# Lys epsilon amine
+_LYS_AMINE = "[NX3;H2][CH2][CH2][CH2][CH2][CX4][NX3]"
+
+
+@register_modification("nmeth", BACKBONE_AMIDE_N, "N-methylation", site=2, fraction=0.2)
+def _n_methylate(rwmol, anchor, rng):
+    _attach(rwmol, anchor, METHYL)
+
+
+@register_modification("peg", PRIMARY_AMINE, "PEGylation")
+def _pegylate(rwmol, anchor, rng):
+    units = rng.randint(1, 4)
+    _attach(rwmol, anchor, peg_fragment(units))
+    return units
+
+
+@register_modification("acetyl", _N_TERMINUS, "N-acetylation")
+def _acetylate(rwmol, anchor, rng):
+    _attach(rwmol, anchor, "C(C)=O")
+
+
+@register_modification("amide", _C_TERMINUS, "C-amidation", site=4)
+def _amidate(rwmol, anchor, rng):
+    # the acid OH becomes NH2
+    atom = rwmol.GetAtomWithIdx(anchor)
+    atom.SetAtomicNum(7)
+    atom.SetNumExplicitHs(0)
+    atom.SetNoImplicit(False)
+
+
+@register_modification("palmitoyl", _LYS_AMINE, "Palmitoylation")
+def _palmitoylate(rwmol, anchor, rng):
+    _attach(rwmol, anchor, "C(=O)CCCCCCCCCCCCCCC")
+
+
+@register_modification("biotin", _LYS_AMINE, "Biotinylation")
+def _biotinylate(rwmol, anchor, rng):
+    _attach(rwmol, anchor, "C(=O)CCCC[C@@H]1SC[C@@H]2NC(=O)N[C@H]12")
+
+
+def parse_mod_spec(spec):
+    """
+    Parse 'name[:rate=R][,fraction=F]' into a (name, rate, fraction) plan
+    step; unset values fall back to the plugin's defaults.
+    """
+    name, _, options = spec.partition(":")
+    if name not in MODIFICATIONS:
+        raise ValueError(
+            f"unknown modification {name!r}; choose from {', '.join(MODIFICATIONS)}"
+        )
+    mod = MODIFICATIONS[name]
+    values = {"rate": mod.rate, "fraction": mod.fraction}
+    for option in filter(None, options.split(",")):
+        key, _, value = option.partition("=")
+        if key not in values:
+            raise ValueError(f"unknown option {key!r} in {spec!r}")
+        values[key] = float(value)
+        if not 0 <= values[key] <= 1:
+            raise ValueError(f"{key} must be within [0, 1] in {spec!r}")
+    return name, values["rate"], values["fraction"]
+
+
+def apply_modifications(smiles, plan, rng=random, trust_input=False, mol=None):
+    """
+    Run a chain of (name, rate, fraction) steps on one SMILES.
+
+    Each step fires with probability `rate`, then modifies ceil(fraction *
+    #sites) of its free sites (one site if fraction is None). Sites come from
+    the single parse of the input; an anchor edited by one step is not
+    offered to later ones. Returns (smiles, mods), or (None, []) if RDKit
+    rejects the input or the result. mol, if given, is the already parsed
+    input.
+    """
+    steps = [
+        (MODIFICATIONS[name], fraction)
+        for name, rate, fraction in plan
+        if rng.random() < rate
+    ]
+    if trust_input and not steps:
+        return smiles, []
+    if mol is None:
+        mol = Chem.MolFromSmiles(smiles)
+    if mol is None:
+        return None, []
+    rwmol = Chem.RWMol(mol)
+    used = set()
+    mods = []
+    for mod, fraction in steps:
+        free = [idx for idx in mod.sites(mol) if idx not in used]
+        if not free:
+            mods.append(f"{mod.label}('N/A')")
+            continue
+        k = 1 if fraction is None else math.ceil(len(free) * fraction)
+        chosen = sorted(rng.sample(free, min(k, len(free))))
+        details = [mod.attach(rwmol, anchor, rng) for anchor in chosen]
+        used.update(chosen)
+        details = [str(detail) for detail in details if detail is not None]
+        mods.append(f"{mod.label}({','.join(details) or len(chosen)})")
+    if not used:
+        return smiles, mods
+    try:
+        Chem.SanitizeMol(rwmol)
+    except Chem.rdchem.MolSanitizeException:
+        return None, []
+    return Chem.MolToSmiles(rwmol), mods
@@ -0,0 +1,34 @@
+"""Small multiprocessing helpers shared by the p2smi CLIs."""
+
+from collections import deque
+from itertools import islice
+
+
+def iter_chunks(items, size):
+    # (start index, list of up to `size` items) chunks of an iterable, so a
+    # worker can number its records without seeing the rest of the input
+    items = iter(items)
+    start = 0
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield start, chunk
+        start += len(chunk)
+
+
+def ordered_imap(pool, func, iterable, window):
+    """
+    Like Pool.imap, but keeps at most `window` tasks in flight.
+
+    Results come back in input order; the deque of pending AsyncResults is the
+    (bounded) reorder buffer, so neither the input nor finished results can pile
+    up in memory when the consumer is slower than the workers.
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
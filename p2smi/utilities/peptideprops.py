@@ -0,0 +1,280 @@
+"""
+Sequence-level peptide descriptors, evaluated in NumPy batches.
+
+- "net_charge": Henderson-Hasselbalch charge at a given pH, summed over
+  the free termini and ionisable side chains (EMBOSS pKa set);
+- "pi": isoelectric point, the pH of zero net charge, found by bisection
+  for the whole batch at once;
+- "gravy": mean Kyte-Doolittle hydropathy;
+- "hmoment": Eisenberg hydrophobic moment per residue for an ideal helix
+  (100 degrees per residue), over the whole sequence;
+- "aliphatic": Ikai aliphatic index.
+
+Every residue letter in all_aminos gets a row in each parameter table.
+Ionisable groups are found by SMARTS in peptide context, as
+groups(G-X-G) - groups(G-G), so backbone amides never count. The
+hydropathy and consensus scales are defined for the 20 canonical residues
+(D-forms share them). Other residues are placed on each scale by a linear
+fit of the canonical values against residue Crippen logP contributions
+(residueprops.residue_contributions). Aliphatic weights for other
+residues follow the side-chain carbon count of acyclic, all-carbon side
+chains, interpolated between the Ala (1), Val (2.9) and Leu/Ile (3.9)
+weights. Cross-links remove the termini and side-chain groups they
+consume (see _consumed_groups).
+"""
+
+from functools import lru_cache
+
+import numpy as np
+from rdkit import Chem
+
+from p2smi.utilities import smilesgen
+from p2smi.utilities.aminoacids import all_aminos
+from p2smi.utilities.residueprops import residue_contributions
+
+PEPTIDE_PROPERTIES = ("net_charge", "pi", "gravy", "hmoment", "aliphatic")
+
+# (group, pKa, charge when ionised, SMARTS); a group's first SMARTS atom is
+# claimed by the first matching entry, so the order resolves overlaps
+# (Asp-like before other carboxyls, guanidines before amidines)
+_GROUPS = [
+    ("nterm", 8.6, 1, None),
+    ("cterm", 3.6, -1, None),
+    ("sulfonic", -1.0, -1, "[SX4](=O)(=O)[OX2H1]"),
+    ("phosphonic", 2.0, -1, "[PX4](=O)[OX2H1]"),
+    ("beta_carboxyl", 3.9, -1, "[CX3](=O)([OX2H1])[CX4][CX4][NX3]"),
+    ("carboxyl", 4.1, -1, "[CX3](=O)[OX2H1]"),
+    ("thiol", 8.5, -1, "[SX2H1]"),
+    ("phenol", 10.1, -1, "[OX2H1]c"),
+    ("imidazole", 6.5, 1, "[#6]1:[#7]:[#6]:[#7]:[#6]:1"),
+    ("guanidine", 12.5, 1, "[CX3](=[NX2])([NX3])[NX3]"),
+    ("amidine", 11.6, 1, "[CX3](=[NX2;!$(N-[!#6])])[NX3]"),
+    ("amine", 10.8, 1, "[NX3;!$(N[#6]=[#7,#8,#16]);!$(N-a);!$(N-[!#6])]"),
+]
+GROUP_NAMES = tuple(name for name, *_ in _GROUPS)
+_PKA = np.array([pka for _, pka, _, _ in _GROUPS])
+_SIGN = np.array([sign for _, _, sign, _ in _GROUPS])
+_PATTERNS = [
+    (GROUP_NAMES.index(name), Chem.MolFromSmarts(smarts))
+    for name, _, _, smarts in _GROUPS
+    if smarts
+]
+
+# Side-chain groups a cross-link code can consume, in order of preference:
+# Z (acid to N-terminus), N (amine to C-terminus), E (ester), C (disulphide)
+_LINKED_GROUPS = {
+    "Z": ("beta_carboxyl", "carboxyl"),
+    "N": ("amine", "guanidine", "amidine", "imidazole"),
+    "E": ("phenol",),
+    "C": ("thiol",),
+}
+
+# fmt: off
+KYTE_DOOLITTLE = {
+    "A": 1.8, "R": -4.5, "N": -3.5, "D": -3.5, "C": 2.5,
+    "Q": -3.5, "E": -3.5, "G": -0.4, "H": -3.2, "I": 4.5,
+    "L": 3.8, "K": -3.9, "M": 1.9, "F": 2.8, "P": -1.6,
+    "S": -0.8, "T": -0.7, "W": -0.9, "Y": -1.3, "V": 4.2,
+}
+
+EISENBERG = {
+    "A": 0.62, "R": -2.53, "N": -0.78, "D": -0.90, "C": 0.29,
+    "Q": -0.85, "E": -0.74, "G": 0.48, "H": -0.40, "I": 1.38,
+    "L": 1.06, "K": -1.50, "M": 0.64, "F": 1.19, "P": 0.12,
+    "S": -0.18, "T": -0.05, "W": 0.81, "Y": 0.26, "V": 1.08,
+}
+# fmt: on
+
+IKAI = {"A": 1.0, "V": 2.9, "I": 3.9, "L": 3.9}
+
+HELIX_ANGLE = np.deg2rad(100.0)
+
+
+def _group_counts(letters):
+    # Ionisable group counts of a linear peptide (termini columns left 0)
+    mol = Chem.MolFromSmiles(smilesgen.linear_peptide_smiles(list(letters)))
+    counts = np.zeros(len(GROUP_NAMES))
+    claimed = set()
+    for column, pattern in _PATTERNS:
+        for match in mol.GetSubstructMatches(pattern):
+            if match[0] not in claimed:
+                claimed.add(match[0])
+                counts[column] += 1
+    return counts
+
+
+def _aliphatic_weight(smiles):
+    # Ikai-style weight of a free amino acid with an acyclic, saturated,
+    # all-carbon side chain (0 for anything else)
+    mol = Chem.MolFromSmiles(smiles)
+    symbols = [atom.GetSymbol() for atom in mol.GetAtoms()]
+    double_bonds = sum(b.GetBondTypeAsDouble() > 1 for b in mol.GetBonds())
+    if (
+        mol.GetRingInfo().NumRings()
+        or double_bonds != 1  # the carboxyl C=O
+        or sorted(set(symbols)) != ["C", "N", "O"]
+        or symbols.count("N") != 1
+        or symbols.count("O") != 2
+    ):
+        return 0.0
+    side_carbons = symbols.count("C") - 2
+    return float(np.interp(side_carbons, [0, 1, 3, 4], [0.0, 1.0, 2.9, 3.9]))
+
+
+def _fitted_scale(scale, letters, logp):
+    # Canonical values where defined (D-forms share them); a least-squares
+    # line through (logP contribution, value) of the canonical residues
+    # places every other residue
+    slope, intercept = np.polyfit([logp[aa] for aa in scale], list(scale.values()), 1)
+    return np.array(
+        [
+            (
+                scale[aa.upper()]
+                if aa.isascii() and aa.upper() in scale
+                else slope * logp[aa] + intercept
+            )
+            for aa in letters
+        ]
+    )
+
+
+@lru_cache(maxsize=None)
+def residue_tables():
+    """
+    ({letter: row}, tables) with per-residue arrays "groups" (ionisable
+    group counts, columns as GROUP_NAMES), "gravy" (Kyte-Doolittle),
+    "hmoment" (Eisenberg consensus) and "aliphatic" (Ikai weights).
+    """
+    letters = [props["Letter"] for props in all_aminos.values()]
+    smiles_list = [props["SMILES"] for props in all_aminos.values()]
+    logp = {aa: values["logp"] for aa, values in residue_contributions().items()}
+    base = _group_counts("GG")
+    aliphatic = [
+        IKAI.get(aa.upper(), 0.0) if aa.isascii() else _aliphatic_weight(smiles)
+        for aa, smiles in zip(letters, smiles_list)
+    ]
+    tables = {
+        "groups": np.array([_group_counts("G" + aa + "G") - base for aa in letters]),
+        "gravy": _fitted_scale(KYTE_DOOLITTLE, letters, logp),
+        "hmoment": _fitted_scale(EISENBERG, letters, logp),
+        "aliphatic": np.array(aliphatic),
+    }
+    return {aa: row for row, aa in enumerate(letters)}, tables
+
+
+def parse_peptide_id(rec_id):
+    """
+    (sequence, bond_def) from a p2smi record ID "SEQUENCE-bond_def" (as
+    written by fasta2smi and generate-peptides), or None if the ID is not
+    one: no "-", unknown residue letters or an invalid bond_def.
+    """
+    seq, sep, bond_def = (rec_id or "").partition("-")
+    index, _ = residue_tables()
+    if not sep or not seq or any(aa not in index for aa in seq):
+        return None
+    bond_def = "" if bond_def == "linear" else bond_def
+    try:
+        smilesgen.get_constraint_type(bond_def)
+    except smilesgen.BondSpecError:
+        return None
+    if bond_def[2:] and len(bond_def) - 2 != len(seq):
+        return None
+    return seq, bond_def
+
+
+@lru_cache(maxsize=None)
+def _linked_group(letter, code):
+    # Column of the side-chain group a cross-link consumes on `letter`
+    index, tables = residue_tables()
+    counts = tables["groups"][index[letter]]
+    for name in _LINKED_GROUPS.get(code, ()):
+        if counts[GROUP_NAMES.index(name)] > 0:
+            return GROUP_NAMES.index(name)
+    return None
+
+
+def _consumed_groups(seq, bond_def):
+    # Termini present (+1 each) minus the side-chain groups cross-links use
+    kind = smilesgen.get_constraint_type(bond_def or "")
+    delta = np.zeros(len(GROUP_NAMES))
+    delta[GROUP_NAMES.index("nterm")] = kind not in ("HT", "SCNT")
+    delta[GROUP_NAMES.index("cterm")] = kind not in ("HT", "SCCT")
+    for aa, code in zip(seq, bond_def[2:]):
+        column = _linked_group(aa, code) if code != "X" else None
+        if column is not None:
+            delta[column] -= 1
+    return delta
+
+
+def net_charge(groups, ph):
+    # Net charge of (n, groups) count rows at a scalar pH or one pH per row;
+    # a group is ionised in proportion 1 / (1 + 10^(sign * (pH - pKa)))
+    ph = np.asarray(ph, dtype=float)[..., None]
+    ionised = 1 / (1 + 10 ** (_SIGN * (ph - _PKA)))
+    return (groups * _SIGN * ionised).sum(axis=-1)
+
+
+def isoelectric_point(groups, iterations=40):
+    # Bisection on [0, 14] for every row at once; NaN where the charge has
+    # no zero in that range (e.g. no ionisable groups at all)
+    lo = np.zeros(len(groups))
+    hi = np.full(len(groups), 14.0)
+    for _ in range(iterations):
+        mid = (lo + hi) / 2
+        positive = net_charge(groups, mid) > 0
+        lo = np.where(positive, mid, lo)
+        hi = np.where(positive, hi, mid)
+    defined = (net_charge(groups, 0.0) > 0) & (net_charge(groups, 14.0) < 0)
+    return np.where(defined, (lo + hi) / 2, np.nan)
+
+
+def peptide_batch(records, ph=7.0):
+    """
+    Descriptors of PEPTIDE_PROPERTIES for an iterable of (sequence,
+    bond_def) tuples (see parse_peptide_id), as NumPy arrays aligned with
+    the input. Sequences are encoded once as a flat residue index array
+    and every descriptor is a bincount or array expression over it.
+    """
+    records = list(records)
+    index, tables = residue_tables()
+    seqs = [seq for seq, _ in records]
+    lengths = np.fromiter(map(len, seqs), dtype=np.intp, count=len(seqs))
+    try:
+        codes = np.fromiter(
+            (index[aa] for seq in seqs for aa in seq),
+            dtype=np.intp,
+            count=lengths.sum(),
+        )
+    except KeyError as err:
+        raise smilesgen.UndefinedAminoError(f"{err.args[0]} is not a residue letter")
+    rows = np.repeat(np.arange(len(seqs)), lengths)
+    positions = np.arange(len(codes)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+    groups = np.zeros((len(seqs), len(GROUP_NAMES)))
+    np.add.at(groups, rows, tables["groups"][codes])
+    groups += np.array([_consumed_groups(*record) for record in records]).reshape(
+        groups.shape
+    )
+
+    def per_row(weights):
+        return np.bincount(rows, weights=weights, minlength=len(seqs))
+
+    moment = tables["hmoment"][codes]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {
+            "net_charge": net_charge(groups, ph),
+            "pi": isoelectric_point(groups),
+            "gravy": per_row(tables["gravy"][codes]) / lengths,
+            "hmoment": np.hypot(
+                per_row(moment * np.sin(HELIX_ANGLE * positions)),
+                per_row(moment * np.cos(HELIX_ANGLE * positions)),
+            )
+            / lengths,
+            "aliphatic": 100 * per_row(tables["aliphatic"][codes]) / lengths,
+        }
+
+
+def peptide_properties(seq, bond_def="", ph=7.0):
+    # peptide_batch for a single sequence, as plain Python floats
+    batch = peptide_batch([(seq, bond_def)], ph)
+    return {prop: values[0].item() for prop, values in batch.items()}
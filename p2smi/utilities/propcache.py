@@ -0,0 +1,131 @@
+"""
+Persistent on-disk cache of smiles-props results.
+
+Entries live in one SQLite table keyed by (molecule key, field set), where
+the molecule key is the canonical SMILES or the InChIKey, so the same
+molecule spelled differently still hits. Values are the JSON-encoded
+descriptor fields. Worker processes only read (through per-process
+read-only connections, see lookup()); the parent process owns the single
+writer, which records hits, inserts new results and evicts the least
+recently used entries beyond max_entries. The database runs in WAL mode so
+readers never block on the writer.
+"""
+
+import sqlite3
+import time
+
+from rdkit import Chem
+
+CACHE_KEYS = ("canonical", "inchikey")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS props (
+    key TEXT NOT NULL,
+    fields TEXT NOT NULL,
+    value TEXT NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (key, fields)
+)
+"""
+
+_LOOKUP_BATCH = 500  # keys per SELECT (stays under SQLite's variable limit)
+
+_readers = {}  # path -> read-only connection, one per process
+
+
+def molecule_key(mol, mode="canonical"):
+    # Identity of a molecule, independent of how its SMILES was written
+    if mode == "inchikey":
+        return Chem.MolToInchiKey(mol) or None
+    return Chem.MolToSmiles(mol)
+
+
+def lookup(path, keys, fields):
+    # {key: JSON value} for the cached keys among `keys` (read-only)
+    conn = _readers.get(path)
+    if conn is None:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        _readers[path] = conn
+    keys = list(dict.fromkeys(keys))
+    found = {}
+    for i in range(0, len(keys), _LOOKUP_BATCH):
+        batch = keys[i : i + _LOOKUP_BATCH]
+        marks = ",".join("?" * len(batch))
+        found.update(
+            conn.execute(
+                f"SELECT key, value FROM props WHERE fields = ? AND key IN ({marks})",
+                [fields, *batch],
+            )
+        )
+    return found
+
+
+class PropertyCache:
+    """Writer side of the cache, plus hit/miss/eviction counters."""
+
+    def __init__(self, path, max_entries=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(_SCHEMA)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS props_lru ON props (last_used)")
+        self.conn.commit()
+        # row count kept current by update(), so eviction never scans the table
+        self.entries = self.conn.execute("SELECT COUNT(*) FROM props").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def update(self, fields, hit_keys, new_entries, misses):
+        # Apply one chunk's report: touch hits, store new results, evict
+        now = time.time()
+        self.hits += len(hit_keys)
+        self.misses += misses
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE props SET last_used = ? WHERE key = ? AND fields = ?",
+                [(now, key, fields) for key in hit_keys],
+            )
+            rows = [(key, fields, value, now) for key, value in new_entries]
+            inserted = self.conn.executemany(
+                "INSERT OR IGNORE INTO props VALUES (?, ?, ?, ?)", rows
+            ).rowcount
+            if inserted < len(rows):
+                # some keys were already stored (e.g. by an earlier chunk)
+                self.conn.executemany(
+                    "UPDATE props SET value = ?, last_used = ? "
+                    "WHERE key = ? AND fields = ?",
+                    [(value, now, key, fields) for key, value in new_entries],
+                )
+            self.entries += inserted
+            if self.max_entries is not None:
+                self._evict()
+
+    def _evict(self):
+        excess = self.entries - self.max_entries
+        if excess > 0:
+            deleted = self.conn.execute(
+                "DELETE FROM props WHERE rowid IN "
+                "(SELECT rowid FROM props ORDER BY last_used LIMIT ?)",
+                (excess,),
+            ).rowcount
+            self.entries -= deleted
+            self.evictions += deleted
+
+    def __len__(self):
+        return self.entries
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def describe(self):
+        return (
+            f"cache: {self.hits} hits, {self.misses} misses "
+            f"(hit rate {self.hit_rate():.1%}), {self.evictions} evicted, "
+            f"{len(self)} entries"
+        )
+
+    def close(self):
+        self.conn.close()
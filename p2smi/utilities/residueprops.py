@@ -0,0 +1,369 @@
+"""
+Per-residue contribution tables for sequence-level property estimates.
+
+Peptide properties are approximated as
+    offset + sum(per-residue contribution) + per-constraint adjustment
+with tables derived once from all_aminos:
+- "mw": average molecular weight of each residue's formula, minus one water
+  per peptide bond (exact for the structures smilesgen builds). Formulas are
+  taken from the residue SMILES, which is what smilesgen assembles; a few
+  Formula entries in all_aminos (e.g. Lys, Ser) disagree with their SMILES;
+- "logp": Crippen logP, each residue's contribution measured in peptide
+  context as logP(G-X-G) - logP(G-G);
+- "charge": side-chain charge at neutral pH from ionisable groups found by
+  SMARTS (carboxylic/sulfonic/phosphonic acids, aliphatic amines, amidines
+  and guanidines). Termini cancel and are not counted.
+
+additive_batch() is exact rather than estimated: formula, MW, heavy atoms,
+H-bond donors and acceptors of the structure smilesgen would build for a
+(sequence, bond_def) pair. Each residue contributes a vector of element
+counts plus donor/acceptor counts, measured in peptide context as
+v(G-X-G) - v(G-G) (its free formula minus one water). Everything the
+residue vectors cannot see (termini, cross-link atoms, the water or H2 lost
+on cyclisation, e.g. a Pro N-terminus or an ester vs an amide link) sits in
+the residues at the termini and cross-link sites. Per cyclisation type it
+is read off once from RDKit, against a seven-residue Gly reference, into
+finite tables: a constant row, an N-terminal and a C-terminal row per
+residue, and a row per (link code, residue). Batches are then NumPy sums
+over residue index arrays, with no RDKit work per record.
+"""
+
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+from rdkit import Chem
+from rdkit.Chem import Crippen, Descriptors, Lipinski
+
+from p2smi.utilities import smilesgen
+from p2smi.utilities.aminoacids import all_aminos
+
+ESTIMATED_PROPERTIES = ("mw", "logp", "charge")
+ADDITIVE_PROPERTIES = ("formula", "mw", "heavy", "hbd", "hba")
+
+_PT = Chem.GetPeriodicTable()
+WATER_MW = 2 * _PT.GetAtomicWeight("H") + _PT.GetAtomicWeight("O")
+H2_MW = 2 * _PT.GetAtomicWeight("H")
+
+# (SMARTS, charge) for side-chain ionisable groups; backbone groups are
+# removed by subtracting one acid and one amine per residue.
+_IONISABLE_GROUPS = [
+    (Chem.MolFromSmarts("[CX3](=O)[OX2H1]"), -1),
+    (Chem.MolFromSmarts("[SX4](=O)(=O)[OX2H1]"), -1),
+    (Chem.MolFromSmarts("[PX4](=O)[OX2H1]"), -1),
+    (Chem.MolFromSmarts("[NX3;!$(N[#6]=[#7,#8,#16]);!$(N-a);!$(N-[!#6])]"), 1),
+    (Chem.MolFromSmarts("[CX3](=[NX2;!$(N-[!#6])])[NX3]"), 1),
+]
+
+
+def _side_chain_charge(mol):
+    # one count per group (keyed by its first atom), backbone acid and amine
+    # cancel each other out
+    return sum(
+        sign * len({match[0] for match in mol.GetSubstructMatches(pattern)})
+        for pattern, sign in _IONISABLE_GROUPS
+    )
+
+
+def _peptide_logp(letters):
+    smiles = smilesgen.linear_peptide_smiles(list(letters))
+    return Crippen.MolLogP(Chem.MolFromSmiles(smiles))
+
+
+@lru_cache(maxsize=None)
+def residue_contributions():
+    # letter -> {"mw", "logp", "charge"} per-residue contributions
+    base = _peptide_logp("GG")
+    table = {}
+    for props in all_aminos.values():
+        letter = props["Letter"]
+        mol = Chem.MolFromSmiles(props["SMILES"])
+        table[letter] = {
+            "mw": Descriptors.MolWt(mol) - WATER_MW,
+            "logp": _peptide_logp("G" + letter + "G") - base,
+            "charge": _side_chain_charge(mol),
+        }
+    return table
+
+
+@lru_cache(maxsize=None)
+def linear_offsets():
+    # Constant terms for a linear peptide (termini)
+    glycine = residue_contributions()["G"]
+    return {
+        "mw": WATER_MW,
+        "logp": _peptide_logp("GG") - 2 * glycine["logp"],
+        "charge": 0.0,
+    }
+
+
+# Reference peptides used to calibrate the logP change of each cyclisation
+_CYCLISATION_REFERENCES = {
+    "SS": ("CAAAC", "SSCXXXC"),
+    "HT": ("AAAAA", "HT"),
+    "SCNT": ("AAAEA", "SCXXXZX"),
+    "SCCT": ("KAAAA", "SCNXXXX"),
+    "SCSC": ("KAAEA", "SCNXXZX"),
+}
+
+
+@lru_cache(maxsize=None)
+def constraint_adjustments():
+    # constraint -> {"mw", "logp", "charge"} change on cyclisation
+    adjustments = {"": {"mw": 0.0, "logp": 0.0, "charge": 0.0}}
+    for constraint, (ref, pattern) in _CYCLISATION_REFERENCES.items():
+        _, _, smiles = smilesgen.constrained_peptide_smiles(list(ref), pattern)
+        adjustments[constraint] = {
+            "mw": -(H2_MW if constraint == "SS" else WATER_MW),
+            "logp": Crippen.MolLogP(Chem.MolFromSmiles(smiles)) - _peptide_logp(ref),
+            "charge": 0.0,
+        }
+    return adjustments
+
+
+def estimate_properties(seq, constraint=""):
+    # Residue-additive estimates for one sequence (constraint "" = linear)
+    table = residue_contributions()
+    offsets = linear_offsets()
+    adjust = constraint_adjustments()[constraint or ""]
+    return {
+        prop: offsets[prop] + adjust[prop] + sum(table[aa][prop] for aa in seq)
+        for prop in ESTIMATED_PROPERTIES
+    }
+
+
+def contribution_arrays(letters):
+    # {"mw": array, ...} aligned with `letters`, for NumPy batch estimates
+    table = residue_contributions()
+    return {
+        prop: np.array([table[aa][prop] for aa in letters])
+        for prop in ESTIMATED_PROPERTIES
+    }
+
+
+def exact_properties(seq, constraint=""):
+    # RDKit values for the structure fasta2smi would build ("charge": formal)
+    pattern = ""
+    if constraint:
+        resolved = {
+            "SS": smilesgen.can_ssbond,
+            "HT": smilesgen.can_htbond,
+            "SCNT": smilesgen.can_scntbond,
+            "SCCT": smilesgen.can_scctbond,
+            "SCSC": smilesgen.can_scscbond,
+        }[constraint](seq)
+        pattern = resolved[1] if resolved else ""
+    _, _, smiles = smilesgen.constrained_peptide_smiles(list(seq), pattern)
+    mol = Chem.MolFromSmiles(smiles)
+    if mol is None:
+        return None
+    return {"mw": Descriptors.MolWt(mol), "logp": Crippen.MolLogP(mol)}
+
+
+def estimate_batch(idx, arrays, constraints):
+    # Vectorised estimate_properties: idx is an (n, length) residue index
+    # matrix into the letters `arrays` was built for (contribution_arrays),
+    # constraints holds one constraint ("" = linear) per row.
+    offsets = linear_offsets()
+    adjust = constraint_adjustments()
+    return {
+        prop: offsets[prop]
+        + arrays[prop][idx].sum(axis=1)
+        + np.array([adjust[c or ""][prop] for c in constraints])
+        for prop in ESTIMATED_PROPERTIES
+    }
+
+
+# ---------- Exact additive engine ----------
+
+
+@lru_cache(maxsize=None)
+def _elements():
+    # Every element in the residue table, in Hill order (C, H, alphabetical)
+    found = set()
+    for props in all_aminos.values():
+        mol = Chem.AddHs(Chem.MolFromSmiles(props["SMILES"]))
+        found.update(atom.GetSymbol() for atom in mol.GetAtoms())
+    return ("C", "H", *sorted(found - {"C", "H"}))
+
+
+def _count_vector(letters, pattern=""):
+    # [element counts..., net charge, donors, acceptors] of the peptide
+    # smilesgen builds
+    _, _, smiles = smilesgen.constrained_peptide_smiles(list(letters), pattern)
+    mol = Chem.MolFromSmiles(smiles)
+    counts = Counter(atom.GetSymbol() for atom in mol.GetAtoms())
+    counts["H"] += sum(atom.GetTotalNumHs() for atom in mol.GetAtoms())
+    return np.array(
+        [counts[element] for element in _elements()]
+        + [
+            Chem.GetFormalCharge(mol),
+            Lipinski.NumHDonors(mol),
+            Lipinski.NumHAcceptors(mol),
+        ],
+        dtype=np.int64,
+    )
+
+
+@lru_cache(maxsize=None)
+def residue_vectors():
+    # ({letter: row}, matrix) of per-residue count vectors in peptide context
+    base = _count_vector("GG")
+    letters = [props["Letter"] for props in all_aminos.values()]
+    matrix = np.array([_count_vector("G" + aa + "G") - base for aa in letters])
+    return {aa: row for row, aa in enumerate(letters)}, matrix
+
+
+# Reference peptide per cyclisation type ("" = linear) and the position
+# each link code takes in it; E (ester) shares the N (amide) partner site
+_LINK_TEMPLATES = {
+    "": ("GGGGGGG", "", {}),
+    "HT": ("GGGGGGG", "HT", {}),
+    "SS": ("GGCGGCG", "SSXXCXXCX", {"C": 2}),
+    "SCNT": ("GGGGDGG", "SCXXXXZXX", {"Z": 4}),
+    "SCCT": ("GKGGGGG", "SCXNXXXXX", {"N": 1, "E": 1}),
+    "SCSC": ("GDGGKGG", "SCXZXXNXX", {"Z": 1, "N": 4, "E": 4}),
+}
+
+# Link code -> the residue property (constrained SMILES) it uses
+_LINK_PROPERTIES = {"C": "disulphide", "Z": "cterm", "N": "nterm", "E": "ester"}
+
+
+def _correction(letters, pattern=""):
+    # What the residue vectors miss for one peptide: its RDKit count vector
+    # minus the sum of its residues' vectors
+    index, matrix = residue_vectors()
+    return _count_vector(letters, pattern) - matrix[[index[aa] for aa in letters]].sum(
+        axis=0
+    )
+
+
+@lru_cache(maxsize=None)
+def link_tables(kind):
+    """
+    Correction tables of one cyclisation type ("" = linear): (constant row,
+    N-terminal rows, C-terminal rows, {code: (rows, allowed)}), the residue
+    tables aligned with residue_vectors(). `allowed` marks the residues that
+    can carry the link code.
+    """
+    letters, pattern, sites = _LINK_TEMPLATES[kind]
+    index, matrix = residue_vectors()
+    residues = list(index)
+    base = _correction(letters, pattern)
+
+    def variant(site, letter, code=None):
+        # the reference with `letter` (carrying `code`) at `site`, minus base
+        seq = letters[:site] + letter + letters[site + 1 :]
+        codes = pattern
+        if code:
+            codes = pattern[: site + 2] + code + pattern[site + 3 :]
+        return _correction(seq, codes) - base
+
+    nterm = np.array([variant(0, aa) for aa in residues])
+    cterm = np.array([variant(len(letters) - 1, aa) for aa in residues])
+    links = {}
+    for code, site in sites.items():
+        rows = np.zeros_like(matrix)
+        allowed = np.zeros(len(residues), dtype=bool)
+        for props in all_aminos.values():
+            if not props.get(_LINK_PROPERTIES[code]):
+                continue
+            aa = props["Letter"]
+            rows[index[aa]] = variant(site, aa, code)
+            allowed[index[aa]] = True
+        links[code] = (rows, allowed)
+    return base, nterm, cterm, links
+
+
+def _constraint_kind(seq, bond_def):
+    # Cyclisation type of a (sequence, bond_def) record; its link codes are
+    # checked against the sequence
+    bond_def = "" if bond_def in (None, "linear") else bond_def
+    kind = smilesgen.get_constraint_type(bond_def)  # raises BondSpecError
+    codes = bond_def[2:]
+    if codes and len(codes) != len(seq):
+        raise smilesgen.BondSpecError(f"{bond_def} does not match {seq}")
+    return "" if kind == "linear" else kind, codes or "X" * len(seq)
+
+
+def _hill_formula(counts, charge):
+    # Same spelling as CalcMolFormula, e.g. "C5H12N2O2+" or "C4H6O4-2"
+    formula = "".join(
+        element + (str(n) if n > 1 else "")
+        for element, n in zip(_elements(), counts)
+        if n
+    )
+    if charge:
+        formula += ("+" if charge > 0 else "-") + (
+            str(abs(charge)) if abs(charge) > 1 else ""
+        )
+    return formula
+
+
+def additive_batch(records):
+    """
+    Exact "formula", "mw", "heavy", "hbd" and "hba" for an iterable of
+    (sequence, bond_def) tuples (bond_def "" or "linear" for linear
+    peptides), as a list of formulas and NumPy arrays aligned with the input.
+    Values match RDKit (CalcMolFormula, MolWt, GetNumHeavyAtoms,
+    Lipinski.NumHDonors/NumHAcceptors) on the SMILES fasta2smi writes.
+    """
+    records = list(records)
+    seqs, bond_defs = zip(*records) if records else ((), ())
+    index, matrix = residue_vectors()
+    lengths = np.fromiter(map(len, seqs), dtype=np.intp, count=len(seqs))
+    try:
+        codes = np.fromiter(
+            (index[aa] for seq in seqs for aa in seq),
+            dtype=np.intp,
+            count=lengths.sum(),
+        )
+    except KeyError as err:
+        raise smilesgen.UndefinedAminoError(f"{err.args[0]} is not a residue letter")
+    totals = np.zeros((len(seqs), matrix.shape[1]), dtype=np.int64)
+    rows = np.repeat(np.arange(len(seqs)), lengths)
+    np.add.at(totals, rows, matrix[codes])
+
+    kinds, links = zip(*map(_constraint_kind, seqs, bond_defs)) if seqs else ((), ())
+    kinds = np.array(kinds, dtype=object)
+    ends = np.cumsum(lengths)
+    links = np.frombuffer("".join(links).encode("ascii"), dtype="S1")
+    for kind in sorted(set(kinds.tolist())):
+        base, nterm, cterm, sites = link_tables(kind)
+        selected = np.flatnonzero(kinds == kind)
+        totals[selected] += (
+            base
+            + nterm[codes[ends[selected] - lengths[selected]]]
+            + cterm[codes[ends[selected] - 1]]
+        )
+        for code, (table, allowed) in sites.items():
+            at = np.flatnonzero(links == code.encode())
+            at = at[kinds[rows[at]] == kind]
+            if not allowed[codes[at]].all():
+                raise smilesgen.BondSpecError(
+                    f"{code} link on a residue that cannot carry it"
+                )
+            np.add.at(totals, rows[at], table[codes[at]])
+
+    n_elements = len(_elements())
+    elements = totals[:, :n_elements]
+    weights = np.array([_PT.GetAtomicWeight(e) for e in _elements()])
+    return {
+        "formula": [
+            _hill_formula(counts, charge)
+            for counts, charge in zip(elements.tolist(), totals[:, n_elements].tolist())
+        ],
+        "mw": elements @ weights,
+        "heavy": elements.sum(axis=1) - elements[:, 1],
+        "hbd": totals[:, n_elements + 1],
+        "hba": totals[:, n_elements + 2],
+    }
+
+
+def additive_properties(seq, bond_def=""):
+    # additive_batch for a single sequence, as plain Python values
+    batch = additive_batch([(seq, bond_def)])
+    return {
+        prop: values[0] if prop == "formula" else values[0].item()
+        for prop, values in batch.items()
+    }
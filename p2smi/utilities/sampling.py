@@ -0,0 +1,56 @@
+"""
+Alias-method sampling for p2smi.
+
+An AliasTable is built once per discrete distribution (Vose's method, O(n))
+and then gives O(1) draws per sample, either one at a time from a
+random.Random-style stream or as whole NumPy arrays from a numpy Generator.
+"""
+
+import numpy as np
+
+
+class AliasTable:
+    def __init__(self, weights):
+        w = np.asarray(weights, dtype=float)
+        if w.ndim != 1 or not len(w):
+            raise ValueError("alias table needs a non-empty 1-D weight vector")
+        if (w < 0).any() or not np.isfinite(w).all():
+            raise ValueError("alias table weights must be finite and non-negative")
+        total = w.sum()
+        if total <= 0:
+            raise ValueError("alias table weights sum to zero")
+
+        n = len(w)
+        scaled = w * (n / total)
+        prob = np.ones(n)
+        alias = np.arange(n)
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+        while small and large:
+            s, g = small.pop(), large.pop()
+            prob[s] = scaled[s]
+            alias[s] = g
+            scaled[g] += scaled[s] - 1.0
+            (small if scaled[g] < 1.0 else large).append(g)
+        # leftovers are 1 up to rounding error
+
+        self.n = n
+        self.prob = prob
+        self.alias = alias
+        self._prob = prob.tolist()
+        self._alias = alias.tolist()
+
+    def sample(self, rng, k):
+        # k indices from a random-module style stream (one uniform per draw)
+        n, prob, alias, rand = self.n, self._prob, self._alias, rng.random
+        out = []
+        for _ in range(k):
+            u = rand() * n
+            i = min(int(u), n - 1)
+            out.append(i if u - i < prob[i] else alias[i])
+        return out
+
+    def draw(self, rng, size):
+        # Index array of the given shape from a numpy Generator
+        i = rng.integers(self.n, size=size)
+        return np.where(rng.random(size) < self.prob[i], i, self.alias[i])
@@ -0,0 +1,38 @@
+"""
+Deterministic random streams for p2smi.
+
+Every run has one root numpy.random.SeedSequence (from --seed, or fresh OS
+entropy when no seed is given). Independent child streams are derived from it
+per shard or per record, following SeedSequence.spawn, so results depend only
+on the seed and the record/shard index, never on how work is split between
+processes.
+"""
+
+import random
+
+import numpy as np
+
+
+def root_sequence(seed=None):
+    # Root SeedSequence for a run; None draws fresh entropy from the OS
+    return np.random.SeedSequence(seed)
+
+
+def child_sequence(root, index):
+    # The index-th child of root, identical to root.spawn(index + 1)[index]
+    # but addressable directly, without spawning (or counting) its siblings.
+    return np.random.SeedSequence(
+        root.entropy,
+        spawn_key=tuple(root.spawn_key) + (index,),
+        pool_size=root.pool_size,
+    )
+
+
+def numpy_rng(seed_seq):
+    # numpy Generator for a stream
+    return np.random.Generator(np.random.PCG64(seed_seq))
+
+
+def python_rng(seed_seq):
+    # random.Random for a stream (for code written against the random module API)
+    return random.Random(int.from_bytes(seed_seq.generate_state(4).tobytes(), "little"))
@@ -0,0 +1,125 @@
+"""
+Record selection for property runs (smiles-props --where / --top_k).
+
+A --where filter is a Python-style boolean expression over descriptor field
+names, e.g. "mw < 1500 and tpsa <= 250 and lipinski". It is parsed with
+ast and checked node by node: field names, constants, comparisons (chains
+included), and/or/not and arithmetic are accepted; calls, attributes and
+subscripts are not, so nothing else can be evaluated. The checked
+expression is compiled once per process and evaluated against each record
+inside the workers.
+
+Top-k selection keeps bounded heaps: each chunk keeps only its best n
+records (heapq.nlargest/nsmallest), and the parent folds the per-chunk
+winners through one more bounded heap. Ties go to the earlier record.
+"""
+
+import ast
+import heapq
+import math
+from functools import lru_cache
+
+_NODES = (
+    ast.Expression,
+    ast.BoolOp,
+    ast.And,
+    ast.Or,
+    ast.UnaryOp,
+    ast.Not,
+    ast.USub,
+    ast.UAdd,
+    ast.BinOp,
+    ast.Add,
+    ast.Sub,
+    ast.Mult,
+    ast.Div,
+    ast.Compare,
+    ast.Eq,
+    ast.NotEq,
+    ast.Lt,
+    ast.LtE,
+    ast.Gt,
+    ast.GtE,
+    ast.Name,
+    ast.Load,
+    ast.Constant,
+)
+
+
+class SelectionError(ValueError):
+    pass
+
+
+def _parse(expr):
+    try:
+        return ast.parse(expr, mode="eval")
+    except SyntaxError as err:
+        raise SelectionError(f"invalid --where expression {expr!r}: {err.msg}")
+
+
+def where_fields(expr, names):
+    """
+    Check a --where expression and return the field names it uses, in
+    order of appearance. Raises SelectionError for unknown names or any
+    construct outside the allowed subset.
+    """
+    used = []
+    for node in ast.walk(_parse(expr)):
+        if not isinstance(node, _NODES):
+            raise SelectionError(
+                f"--where does not allow {type(node).__name__} ({expr!r})"
+            )
+        if isinstance(node, ast.Constant) and not isinstance(
+            node.value, (bool, int, float, str)
+        ):
+            raise SelectionError(f"--where does not allow {node.value!r}")
+        if isinstance(node, ast.Name):
+            if node.id not in names:
+                raise SelectionError(
+                    f"unknown field {node.id!r} in --where; "
+                    f"choose from: {', '.join(names)}"
+                )
+            if node.id not in used:
+                used.append(node.id)
+    return tuple(used)
+
+
+@lru_cache(maxsize=None)
+def record_filter(expr, keys):
+    """
+    Predicate for record dicts. `keys` is a tuple of (field name, record
+    key) pairs for the names used in `expr`. Records with an "error", or
+    whose values cannot be compared (a missing descriptor), are rejected.
+    """
+    code = compile(_parse(expr), "<where>", "eval")
+    keys = dict(keys)
+
+    def keep(rec):
+        if "error" in rec:
+            return False
+        values = {name: rec.get(key) for name, key in keys.items()}
+        try:
+            return bool(eval(code, {"__builtins__": {}}, values))
+        except (TypeError, ZeroDivisionError):
+            return False
+
+    return keep
+
+
+def _ranked(records, key, ascending):
+    # (sort key, record) for records with a usable score; ties rank the
+    # lower Index first in either direction
+    for rec in records:
+        score = rec.get(key)
+        if "error" in rec or score is None or math.isnan(score):
+            continue
+        if ascending:
+            yield (score, rec["Index"]), rec
+        else:
+            yield (score, -rec["Index"]), rec
+
+
+def top_records(records, key, n, ascending=False):
+    # The best n records by rec[key], best first; streaming, O(n) memory
+    pick = heapq.nsmallest if ascending else heapq.nlargest
+    return [rec for _, rec in pick(n, _ranked(records, key, ascending), lambda p: p[0])]
@@ -0,0 +1,69 @@
+"""
+Shared-memory column buffers for moving worker results to the parent.
+
+The parent allocates a small ring of multiprocessing.shared_memory blocks
+before starting its pool, one per chunk that can be in flight. Each block
+holds the numeric columns of one chunk, column after column (8-byte
+aligned, sized for `capacity` rows). Workers attach to every block once, in
+the pool initializer, write a chunk's values in place and return only what
+does not fit a fixed-width buffer; the parent copies the columns out and
+reuses the block for a later chunk. Numeric results never go through the
+pipe or pickle, and no block is created or attached per chunk.
+"""
+
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+_ALIGN = 8
+
+_attached = {}  # name -> SharedMemory, per worker process
+
+
+def _layout(schema, capacity):
+    # [(name, dtype, byte offset)] and the total block size
+    layout, offset = [], 0
+    for name, dtype in schema:
+        dtype = np.dtype(dtype)
+        layout.append((name, dtype, offset))
+        offset += -(-dtype.itemsize * capacity // _ALIGN) * _ALIGN
+    return layout, offset
+
+
+def allocate_blocks(schema, capacity, count):
+    # `count` new blocks, each big enough for `capacity` rows of schema
+    _, size = _layout(schema, capacity)
+    return [SharedMemory(create=True, size=max(size, 1)) for _ in range(count)]
+
+
+def release_blocks(blocks):
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+
+def attach_blocks(names):
+    # Pool initializer: map the parent's blocks into this worker
+    for name in names:
+        _attached[name] = SharedMemory(name=name)
+
+
+def _view(block, dtype, offset, rows):
+    # Views must be gone before the block is closed, so none are kept around
+    return np.ndarray(rows, dtype=dtype, buffer=block.buf, offset=offset)
+
+
+def fill_columns(name, columns, schema, capacity):
+    # Worker side: copy {column: array} into the attached block `name`
+    block = _attached[name]
+    rows = len(columns[schema[0][0]]) if schema else 0
+    for column, dtype, offset in _layout(schema, capacity)[0]:
+        _view(block, dtype, offset, rows)[:] = columns[column]
+
+
+def read_columns(block, schema, capacity, rows):
+    # Parent side: copy the first `rows` values of each column out
+    return {
+        column: _view(block, dtype, offset, rows).copy()
+        for column, dtype, offset in _layout(schema, capacity)[0]
+    }
@@ -0,0 +1,184 @@
+"""
+Mergeable streaming statistics for property runs (smiles-props --summary).
+
+Each numeric descriptor gets a FieldStats. It keeps the count, the mean
+and the sum of squared deviations (combined batch-wise with Chan's
+pairwise update of Welford's moments), min/max, and a sparse fixed-width
+histogram. Flags such as the Lipinski pass keep true/false counts.
+Partial summaries from different chunks, workers or shard files merge
+without revisiting any records: counts and histograms add exactly and the
+moments combine up to floating-point rounding. Quantiles are
+read off the histogram: exact for integer descriptors (width-1 bins) and
+interpolated within one bin for real-valued ones.
+"""
+
+import math
+
+import numpy as np
+
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+class FieldStats:
+    """Moments, range and histogram of one numeric descriptor."""
+
+    def __init__(self, width=1.0, integer=False):
+        self.width = width
+        self.integer = integer
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.bins = {}  # bin index (value // width) -> count
+
+    def add_values(self, values):
+        # Fold a batch in: its moments and histogram, then a pairwise merge
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if not values.size:
+            return self
+        batch = FieldStats(self.width, self.integer)
+        batch.count = int(values.size)
+        batch.mean = float(values.mean())
+        batch.m2 = float(((values - batch.mean) ** 2).sum())
+        batch.min, batch.max = float(values.min()), float(values.max())
+        index, counts = np.unique(
+            np.floor(values / self.width).astype(np.int64), return_counts=True
+        )
+        batch.bins = dict(zip(index.tolist(), counts.tolist()))
+        return self.merge(batch)
+
+    def merge(self, other):
+        if other.width != self.width:
+            raise ValueError(
+                f"cannot merge histograms of width {self.width} and {other.width}"
+            )
+        if not other.count:
+            return self
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta**2 * self.count * other.count / total
+        self.count = total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        return self
+
+    def variance(self):
+        # Sample variance
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.bins):
+            count = self.bins[index]
+            if seen + count >= rank:
+                value = index * self.width
+                if not self.integer:
+                    value += self.width * (rank - seen) / count
+                return min(max(value, self.min), self.max)
+            seen += count
+        return self.max
+
+    def to_dict(self):
+        empty = not self.count
+        return {
+            "count": self.count,
+            "mean": None if empty else self.mean,
+            "std": None if empty else math.sqrt(self.variance()),
+            "min": None if empty else self.min,
+            "max": None if empty else self.max,
+            "quantiles": {f"p{round(q * 100)}": self.quantile(q) for q in QUANTILES},
+            "histogram": {
+                "width": self.width,
+                "bins": {str(index): self.bins[index] for index in sorted(self.bins)},
+            },
+            "m2": self.m2,
+            "integer": self.integer,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls(data["histogram"]["width"], data["integer"])
+        stats.count = data["count"]
+        if stats.count:
+            stats.mean, stats.m2 = data["mean"], data["m2"]
+            stats.min, stats.max = data["min"], data["max"]
+        stats.bins = {int(k): v for k, v in data["histogram"]["bins"].items()}
+        return stats
+
+
+class PropertySummary:
+    """
+    Statistics over a stream of property records: FieldStats per numeric
+    key, true/false counts per flag key, and record and error counts.
+    """
+
+    def __init__(self, numeric=(), flags=()):
+        # numeric: [(key, bin width, integer?)]; flags: [key]
+        self.records = 0
+        self.errors = 0
+        self.fields = {
+            key: FieldStats(width, integer) for key, width, integer in numeric
+        }
+        self.flags = {key: [0, 0] for key in flags}  # [true, false]
+
+    def add_records(self, records):
+        records = list(records)
+        valid = [rec for rec in records if "error" not in rec]
+        self.records += len(records)
+        self.errors += len(records) - len(valid)
+        for key, stats in self.fields.items():
+            stats.add_values([rec[key] for rec in valid if key in rec])
+        for key, counts in self.flags.items():
+            passed = sum(1 for rec in valid if rec.get(key) is True)
+            counts[0] += passed
+            counts[1] += sum(1 for rec in valid if key in rec) - passed
+        return self
+
+    def merge(self, other):
+        self.records += other.records
+        self.errors += other.errors
+        for key, stats in other.fields.items():
+            self.fields.setdefault(key, FieldStats(stats.width, stats.integer))
+            self.fields[key].merge(stats)
+        for key, (passed, failed) in other.flags.items():
+            counts = self.flags.setdefault(key, [0, 0])
+            counts[0] += passed
+            counts[1] += failed
+        return self
+
+    def to_dict(self):
+        return {
+            "records": self.records,
+            "errors": self.errors,
+            "fields": {key: stats.to_dict() for key, stats in self.fields.items()},
+            "flags": {
+                key: {
+                    "true": passed,
+                    "false": failed,
+                    "rate": passed / (passed + failed) if passed + failed else None,
+                }
+                for key, (passed, failed) in self.flags.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        summary = cls()
+        summary.records = data["records"]
+        summary.errors = data["errors"]
+        summary.fields = {
+            key: FieldStats.from_dict(stats) for key, stats in data["fields"].items()
+        }
+        summary.flags = {
+            key: [counts["true"], counts["false"]]
+            for key, counts in data["flags"].items()
+        }
+        return summary
@@ -0,0 +1,105 @@
+"""
+Threaded SMILES parsing through RDKit's MultithreadedSmilesMolSupplier.
+
+Records are spooled in bounded segments (threads x chunk_records lines) to
+a tab-separated temporary file, one "SMILES<TAB>id" line each (the id
+lands in the supplier's name column), and RDKit parses each segment in
+native threads: no GIL, no pickling and no worker processes holding copies
+of the input. Disk use stays at one segment, and the first molecules come
+back once one segment has been read, not the whole input. Within a segment
+molecules arrive slightly out of order; GetLastRecordId() gives each one's
+line number and a small reorder buffer hands them out in input order.
+"""
+
+import os
+import tempfile
+from itertools import islice
+
+from rdkit import Chem
+
+
+def require_threaded_supplier():
+    # RDKit builds without thread support lack the multithreaded suppliers
+    if not hasattr(Chem, "MultithreadedSmilesMolSupplier"):
+        raise ImportError(
+            "threaded parsing needs an RDKit build with "
+            "MultithreadedSmilesMolSupplier (RDK_BUILD_THREADSAFE_SSS)"
+        )
+
+
+def _split_item(text):
+    # "SMILES\tid" supplier line -> (id, SMILES or None); the id is taken
+    # from the text, so ids containing tabs survive intact
+    smiles, _, rec_id = text.rstrip("\n").partition("\t")
+    return rec_id, smiles or None
+
+
+SEGMENT_RECORDS = 1024  # records per thread in one spooled segment
+
+
+def iter_threaded_mols(records, threads=2, segment_records=None):
+    """
+    Parse (id, SMILES) records in `threads` RDKit threads and yield
+    (id, SMILES, Mol or None) in input order, None where RDKit rejects the
+    SMILES. Records whose SMILES is None (malformed lines) pass through
+    unparsed. Input is spooled and parsed `segment_records` records at a
+    time (default threads x SEGMENT_RECORDS).
+    """
+    require_threaded_supplier()
+    segment_records = segment_records or threads * SEGMENT_RECORDS
+    records = iter(records)
+    fd, path = tempfile.mkstemp(suffix=".smi", text=True)
+    os.close(fd)
+    try:
+        while True:
+            count = 0
+            with open(path, "w") as handle:
+                for count, (rec_id, smiles) in enumerate(
+                    islice(records, segment_records), 1
+                ):
+                    handle.write(f"{smiles or ''}\t{rec_id}\n")
+            if not count:
+                return  # input exhausted (the supplier refuses empty files)
+            yield from _parse_segment(path, count, threads)
+    finally:
+        os.remove(path)
+
+
+def _parse_segment(path, count, threads):
+    # The `count` records spooled at `path`, in order. The segment is done
+    # once every record number 1..count has been seen, so the supplier's
+    # end-of-input behaviour does not matter; items outside that range or
+    # seen twice are ignored, and records it never reports are parsed here.
+    supplier = Chem.MultithreadedSmilesMolSupplier(
+        path,
+        delimiter="\t",
+        smilesColumn=0,
+        nameColumn=1,
+        titleLine=False,
+        numWriterThreads=threads,
+    )
+    pending, next_record = {}, 1
+    try:
+        for mol in supplier:
+            record = supplier.GetLastRecordId()
+            text = supplier.GetLastItemText()
+            if text and next_record <= record <= count and record not in pending:
+                rec_id, smiles = _split_item(text)
+                pending[record] = (rec_id, smiles, mol if smiles else None)
+                while next_record in pending:
+                    yield pending.pop(next_record)
+                    next_record += 1
+            if next_record > count:
+                return
+    finally:
+        del supplier  # joins the parser threads before the file is reused
+
+    with open(path) as handle:
+        for record, text in enumerate(handle, 1):
+            if record < next_record:
+                continue
+            if record not in pending:
+                rec_id, smiles = _split_item(text)
+                mol = Chem.MolFromSmiles(smiles) if smiles else None
+                pending[record] = (rec_id, smiles, mol)
+            yield pending.pop(record)
@@ -0,0 +1,160 @@
+"""
+Columnar writers for batch property output.
+
+Records are turned into typed column batches (dict of column name -> numpy
+array, following a [(name, dtype), ...] schema) once per chunk, and each
+writer consumes whole batches: CSV/TSV rows go out through csv.writer,
+.npy/.npz hold one structured array / one array per column, and Parquet
+(when pyarrow is installed) is written one row group per batch.
+A "valid" column in the schema marks the rows of records that did not fail
+(carry no "error"). Descriptor columns (the `masked` ones) of the other rows
+are real nulls in Parquet and empty cells in CSV/TSV; .npy/.npz keep the
+"valid" array as their mask, and hold NaN, 0, False or "" under it. Values
+a record lacks are NaN in float columns; non-string values in string
+columns are stored as JSON.
+"""
+
+import csv
+import json
+
+import numpy as np
+
+COLUMNAR_FORMATS = ("csv", "tsv", "npy", "npz", "parquet")
+
+VALID_COLUMN = "valid"
+
+# Fill values of absent entries; only meaningful together with VALID_COLUMN
+_MISSING = {"f": np.nan, "i": 0, "b": False, "U": ""}
+
+
+def records_to_columns(records, schema):
+    # List of record dicts -> {name: typed array} for one batch
+    columns = {}
+    for name, dtype in schema:
+        kind = np.dtype(dtype).kind
+        if name == VALID_COLUMN:
+            values = ["error" not in rec for rec in records]
+        else:
+            values = [rec.get(name, _MISSING[kind]) for rec in records]
+        if kind == "U":
+            values = [v if isinstance(v, str) else json.dumps(v) for v in values]
+        columns[name] = np.array(values, dtype=dtype)
+    return columns
+
+
+def _empty_columns(schema):
+    return {name: np.array([], dtype=dtype) for name, dtype in schema}
+
+
+def _concat(batches, schema):
+    # Join batches column by column (string widths grow to the widest value)
+    batches = list(batches)
+    if not batches:
+        return _empty_columns(schema)
+    return {name: np.concatenate([b[name] for b in batches]) for name, _ in schema}
+
+
+def _invalid_rows(batch, name, masked):
+    # Rows of column `name` to leave out (None: keep every row)
+    if name not in masked or VALID_COLUMN not in batch:
+        return None
+    return ~batch[VALID_COLUMN]
+
+
+def _cells(batch, name, masked):
+    values = batch[name].tolist()
+    invalid = _invalid_rows(batch, name, masked)
+    if invalid is None:
+        return values
+    return ["" if skip else v for v, skip in zip(values, invalid.tolist())]
+
+
+def write_delimited(batches, handle, schema, delimiter=",", masked=()):
+    # CSV/TSV with a header row; returns the number of rows written
+    writer = csv.writer(handle, delimiter=delimiter, lineterminator="\n")
+    writer.writerow([name for name, _ in schema])
+    rows = 0
+    for batch in batches:
+        columns = [_cells(batch, name, masked) for name, _ in schema]
+        writer.writerows(zip(*columns))
+        rows += len(columns[0])
+    return rows
+
+
+def write_npy(batches, path, schema):
+    # One structured array (all rows in memory before saving)
+    columns = _concat(batches, schema)
+    table = np.empty(
+        len(columns[schema[0][0]]),
+        dtype=[(name, columns[name].dtype) for name, _ in schema],
+    )
+    for name, _ in schema:
+        table[name] = columns[name]
+    np.save(path, table)
+    return len(table)
+
+
+def write_npz(batches, path, schema):
+    # One array per column in an .npz archive
+    columns = _concat(batches, schema)
+    np.savez(path, **columns)
+    return len(columns[schema[0][0]])
+
+
+def require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError as err:
+        raise ImportError(
+            "parquet output needs pyarrow; install it with 'pip install pyarrow'"
+        ) from err
+
+
+def _arrow_column(pa, batch, name, masked):
+    # Numpy column -> Arrow array with nulls on invalid rows (and NaNs)
+    values = batch[name]
+    invalid = _invalid_rows(batch, name, masked)
+    if invalid is None:
+        return values
+    if values.dtype.kind == "f":
+        invalid = invalid | np.isnan(values)
+    return pa.array(values, mask=invalid)
+
+
+def write_parquet(batches, path, schema, masked=()):
+    # Streamed: one row group per batch
+    require_pyarrow()
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    arrow_schema = pa.schema(
+        [(name, pa.from_numpy_dtype(np.dtype(dtype))) for name, dtype in schema]
+    )
+    rows = 0
+    with pq.ParquetWriter(path, arrow_schema) as writer:
+        for batch in batches:
+            columns = {
+                name: _arrow_column(pa, batch, name, masked) for name, _ in schema
+            }
+            writer.write_table(pa.table(columns, schema=arrow_schema))
+            rows += len(batch[schema[0][0]])
+    return rows
+
+
+def write_columns(batches, fmt, target, schema, masked=()):
+    """
+    Write column batches in `fmt` to `target` (an open text handle for
+    csv/tsv, a path for the binary formats); returns the row count.
+    `masked` names the columns that are null/empty where "valid" is False.
+    """
+    if fmt in ("csv", "tsv"):
+        delimiter = "," if fmt == "csv" else "\t"
+        return write_delimited(batches, target, schema, delimiter, masked)
+    if fmt == "npy":
+        return write_npy(batches, target, schema)
+    if fmt == "npz":
+        return write_npz(batches, target, schema)
+    if fmt == "parquet":
+        return write_parquet(batches, target, schema, masked)
+    raise ValueError(f"unknown columnar format {fmt!r}")
@@ -1,3 +1,5 @@
+import pytest
+
 from p2smi.chemMods import (
     add_n_methylation,
     add_pegylation,
@@ -5,6 +7,7 @@ from p2smi.chemMods import (
     modify_sequence,
     parse_input_lines,
     process_sequences,
+    smiles_syntax_ok,
 )
 
 
@@ -60,3 +63,158 @@ def test_process_sequences_runs_and_marks_modifications():
     assert any("pep1" in r and "N-methylation" in r for r in results)
     assert any("pep2" in r and "PEGylation" in r for r in results)
     assert any("Skipped malformed line" in r for r in results)
+
+
+def test_process_sequences_seed_is_reproducible():
+    smiles = "N[C@@H](CCCCN)C(=O)N[C@@H](C)C(=O)N[C@@H](C)C(=O)O"
+    input_lines = [f"pep{i}: {smiles}" for i in range(20)]
+
+    def run():
+        return list(process_sequences(input_lines, 0.5, 0.5, 0.5, seed=7))
+
+    first = run()
+    assert first == run()
+    assert any("[" in line for line in first)
+
+
+def test_process_sequences_procs_preserves_order_and_output():
+    smiles = "N[C@@H](CCCCN)C(=O)N[C@@H](C)C(=O)N[C@@H](C)C(=O)O"
+    input_lines = [f"pep{i}: {smiles}" for i in range(30)]
+    input_lines[5] = "malformed"
+    input_lines.insert(9, "   ")
+    serial = list(process_sequences(input_lines, 0.5, 0.5, 0.5, seed=3))
+    parallel = list(
+        process_sequences(input_lines, 0.5, 0.5, 0.5, seed=3, procs=2, chunk_records=4)
+    )
+    assert parallel == serial
+    assert len(serial) == 30
+    assert serial[0].startswith("pep0") and serial[-1].startswith("pep29")
+
+
+def test_process_sequences_threads_match_serial():
+    smiles = "N[C@@H](CCCCN)C(=O)N[C@@H](C)C(=O)N[C@@H](C)C(=O)O"
+    input_lines = [f"pep{i}: {smiles}" for i in range(30)]
+    input_lines[4] = "malformed"
+    input_lines[8] = "pep8: CC(C)(C)(C)C"  # passes the pre-check, RDKit rejects it
+    for engine in ("regex", "mol"):
+        serial = list(process_sequences(input_lines, 0.5, 0.5, 0.5, 3, engine=engine))
+        threaded = process_sequences(
+            input_lines, 0.5, 0.5, 0.5, 3, engine=engine, threads=2
+        )
+        assert list(threaded) == serial
+        assert serial[8] == "pep8 [Invalid SMILES skipped]"
+
+
+def test_smiles_syntax_ok_precheck():
+    assert smiles_syntax_ok("N[C@@H](CCCCN)C(=O)O")
+    assert smiles_syntax_ok("C%10CC%10.[Na+]")
+    assert not smiles_syntax_ok("C1CC")  # unpaired ring closure
+    assert not smiles_syntax_ok("CC(=O")  # unbalanced branch
+    assert not smiles_syntax_ok("[NH3+CC")  # unterminated bracket atom
+    assert not smiles_syntax_ok("not a smiles")
+
+
+def test_trust_input_passes_unmodified_records_through(monkeypatch):
+    import p2smi.chemMods as chemMods
+
+    parsed = []
+    monkeypatch.setattr(
+        chemMods, "is_valid_smiles", lambda smi: parsed.append(smi) or True
+    )
+    lines = ["pep1: N[C@@H](CCCCN)C(=O)O", "C1CC"]
+    results = list(process_sequences(lines, 0.0, 0.0, 0.0, trust_input=True))
+    assert results == [
+        "pep1: N[C@@H](CCCCN)C(=O)O",
+        "[Malformed line] [Skipped malformed line]",
+    ]
+    assert parsed == []
+    list(process_sequences(lines, 0.0, 0.0, 0.0))
+    assert parsed == ["N[C@@H](CCCCN)C(=O)O"]
+
+
+def test_mol_engine_finds_sites_in_any_spelling():
+    from rdkit import Chem
+    from rdkit.Chem.rdMolDescriptors import CalcMolFormula
+
+    from p2smi.utilities.molmods import find_sites, modify_smiles
+
+    p2smi_smiles = "N[C@@H](CCCCN)C(=O)N[C@@H](C)C(=O)N[C@@H](C)C(=O)O"
+    canonical = Chem.MolToSmiles(Chem.MolFromSmiles(p2smi_smiles))
+    assert add_n_methylation(canonical, 1.0)[1] == 0  # regex misses these
+    amide_ns, amines = find_sites(Chem.MolFromSmiles(canonical))
+    assert len(amide_ns) == 2 and len(amines) == 2  # Lys side chain + N-terminus
+
+    mod_smiles, mods = modify_smiles(canonical, True, True, 1.0)
+    assert mods[0] == "N-methylation(2)"
+    units = int(mods[1][len("PEGylation(") : -1])
+    formula = CalcMolFormula(Chem.MolFromSmiles(mod_smiles))
+    # K-A-A is C12H24N4O4; +2 CH2 for the methyls, +O(C2H4O)nCH2 for the PEG
+    assert formula == f"C{15 + 2 * units}H{30 + 4 * units}N4O{5 + units}"
+    assert modify_smiles("C1CC(", True, False, 1.0) == (None, [])
+
+
+def test_enumerate_variants_counts_dedup_and_cap():
+    from p2smi.utilities.molmods import enumerate_variants
+
+    smiles = "N[C@@H](CCCCN)C(=O)N[C@@H](C)C(=O)NCC(=O)O"  # 2 amide N, 2 amines
+    variants = list(enumerate_variants(smiles))
+    assert len(variants) == 4 * (1 + 2 * 4) - 1
+    assert len({smi for _, smi in variants}) == len(variants)
+    assert all(mods for mods, _ in variants)
+    single = list(enumerate_variants(smiles, k=1, peg=False))
+    assert [mods for mods, _ in single] == [["N-methylation(1)"]] * 2
+    assert len(list(enumerate_variants(smiles, max_variants=5))) == 5
+    # symmetric sites collapse: both amines of cadaverine give one molecule
+    assert len(list(enumerate_variants("NCCCCCN"))) == 4
+
+
+def test_process_sequences_enumerate_mode():
+    lines = ["pep: N[C@@H](C)C(=O)N[C@@H](C)C(=O)O", "bad"]
+    results = list(
+        process_sequences(lines, 0, 0, 0, enumerate_all=True, max_variants=3)
+    )
+    assert len(results) == 4
+    assert all(r.startswith("pep[") for r in results[:3])
+    assert results[3].endswith("[Skipped malformed line]")
+
+
+def test_modification_plugins_single_parse_chain():
+    from rdkit import Chem
+    from rdkit.Chem.rdMolDescriptors import CalcMolFormula
+
+    from p2smi.utilities.molmods import (
+        MODIFICATIONS,
+        apply_modifications,
+        parse_mod_spec,
+    )
+
+    assert {"nmeth", "peg", "acetyl", "amide", "palmitoyl", "biotin"} <= set(
+        MODIFICATIONS
+    )
+    smiles = "N[C@@H](CCCCN)C(=O)N[C@@H](C)C(=O)O"  # Lys-Ala, C9H19N3O3
+    plan = [parse_mod_spec(f"{name}:rate=1") for name in ("acetyl", "amide", "biotin")]
+    mod_smiles, mods = apply_modifications(smiles, plan)
+    assert mods == ["N-acetylation(1)", "C-amidation(1)", "Biotinylation(1)"]
+    # +C2H2O acetyl, O -> NH, +C10H14N2O2S biotinyl
+    assert CalcMolFormula(Chem.MolFromSmiles(mod_smiles)) == "C21H36N6O5S"
+
+    # the Lys amine is taken by the first plugin and not offered to the second
+    plan = [parse_mod_spec("palmitoyl:rate=1"), parse_mod_spec("biotin:rate=1")]
+    assert apply_modifications(smiles, plan)[1][1] == "Biotinylation('N/A')"
+    assert apply_modifications(smiles, [("biotin", 0.0, None)]) == (smiles, [])
+    with pytest.raises(ValueError):
+        parse_mod_spec("nmeth:rate=2")
+
+
+def test_enumerate_rejects_mod_and_engine(monkeypatch, capsys):
+    # --enumerate finds its own sites; --mod/--engine must not be dropped silently
+    import sys
+
+    from p2smi.chemMods import main
+
+    for extra in (["--mod", "acetyl"], ["--engine", "mol"], ["--engine", "regex"]):
+        argv = ["modify-smiles", "-i", "in.p2smi", "--enumerate", *extra]
+        monkeypatch.setattr(sys, "argv", argv)
+        with pytest.raises(SystemExit):
+            main()
+        assert "not allowed with argument" in capsys.readouterr().err
@@ -1,11 +1,54 @@
+import csv
+import json
+import random
+import time
+
+import numpy as np
 import pytest
+from rdkit import Chem
+from rdkit.Chem import Descriptors, Lipinski
+from rdkit.Chem.rdMolDescriptors import CalcMolFormula
 
 from p2smi.chemProps import (
+    CONFORMER_FIELDS,
+    DEFAULT_FIELDS,
+    FIELDS,
     SmilesError,
+    column_schema,
+    descriptor_columns,
+    iter_column_batches,
+    iter_results,
+    parse_fields,
+    parse_smiles_record,
+    select_records,
+    summarise_lines,
     lipinski_trial_mol,
     molecule_summary,
+    molecule_summary_from_mol,
     make_mol,
+    parse_profile,
+)
+from p2smi.utilities.conformers import ConformerSettings, conformer_properties
+from p2smi.utilities.residueprops import (
+    additive_batch,
+    additive_properties,
+    residue_vectors,
+)
+from p2smi.utilities.smilesgen import (
+    _CONSTRAINT_LETTER_SETS,
+    constrained_peptide_smiles,
+)
+from p2smi.utilities.peptideprops import (
+    KYTE_DOOLITTLE,
+    net_charge,
+    peptide_batch,
+    peptide_properties,
 )
+from p2smi.utilities.propcache import PropertyCache
+from p2smi.utilities.selection import SelectionError, where_fields
+from p2smi.utilities.summary import PropertySummary
+from p2smi.utilities.suppliers import iter_threaded_mols
+from p2smi.utilities.writers import write_columns
 
 
 def test_log_partition_coefficient_valid():
@@ -73,3 +116,337 @@ def test_molecule_summary_keys():
 def test_molecule_summary_invalid_smiles():
     with pytest.raises(SmilesError):
         molecule_summary("INVALID_SMILES")
+
+
+def test_parse_smiles_record_keeps_id():
+    assert parse_smiles_record("pep1: CCO\n") == ("pep1", "CCO")
+    assert parse_smiles_record("CCO") == ("", "CCO")
+    assert parse_smiles_record("  \n") is None
+
+
+def test_iter_results_parallel_keeps_order_and_ids():
+    lines = [f"mol{i}: {'C' * (i + 1)}O" for i in range(40)]
+    lines[7] = "bad: not_a_smiles"
+    lines.insert(3, "\n")
+    serial = list(iter_results(lines))
+    parallel = list(iter_results(lines, procs=2, chunk_records=6))
+    assert parallel == serial
+    records = [json.loads(out) for out in serial]
+    assert [r["Index"] for r in records] == list(range(40))
+    assert records[0]["ID"] == "mol0" and records[-1]["ID"] == "mol39"
+    assert "error" in records[7] and records[7]["ID"] == "bad"
+
+
+def test_threaded_reader_matches_serial():
+    lines = [f"mol{i}: {'C' * (i + 1)}O" for i in range(40)]
+    lines[5] = "bad: C1CC"
+    lines[9] = "c1ccccc1"
+    lines[12] = "tab\tid: CCN"
+    serial = list(iter_results(lines))
+    assert list(iter_results(lines, threads=3, chunk_records=7)) == serial
+    assert json.loads(serial[12])["ID"] == "tab\tid"
+    threaded = iter_column_batches(lines, threads=2, fields=("mw",))
+    assert [len(batch["Index"]) for batch in threaded] == [40]
+
+    # input is spooled a segment at a time: the first molecule comes back
+    # after one segment has been read, not the whole input
+    read = []
+    records = ((read.append(i) or f"m{i}", "CCO") for i in range(10**6))
+    first = next(iter_threaded_mols(records, threads=2, segment_records=8))
+    assert first[0] == "m0" and first[2] is not None and len(read) == 8
+
+
+def test_fields_select_minimal_descriptors():
+    summary = molecule_summary("CCO", parse_fields("mw, TPSA"))
+    assert list(summary) == ["SMILES", "Molecular weight", "TPSA"]
+    assert parse_fields(None) == DEFAULT_FIELDS
+    details = molecule_summary("C" * 36, ("lipinski", "lipinski_details"))
+    assert details["Lipinski pass"] is False
+    assert any("logP over 5" in f for f in details["Lipinski details"]["failed"])
+    with pytest.raises(ValueError):
+        parse_fields("mw,volume")
+
+
+def test_lipinski_field_matches_trial():
+    for smiles in ("CCO", "C" * 36, "OC(=O)" * 6 + "C"):
+        passed, failed = lipinski_trial_mol(make_mol(smiles))
+        assert molecule_summary(smiles)["Lipinski pass"] is (not failed)
+
+
+def test_columnar_outputs_round_trip(tmp_path):
+    lines = ["a: CCO", "b: not_a_smiles", "c1ccccc1"]
+    fields = ("mw", "hbd", "lipinski")
+    schema = column_schema(fields)
+    batches = list(iter_column_batches(lines, chunk_records=2, fields=fields))
+    assert len(batches) == 2 and batches[0]["H-bond donors"].dtype == np.int32
+
+    path = tmp_path / "props.npz"
+    assert write_columns(batches, "npz", str(path), schema) == 3
+    table = np.load(path)
+    assert list(table["ID"]) == ["a", "b", ""]
+    assert np.isnan(table["Molecular weight"][1]) and table["error"][1]
+    assert table["Lipinski pass"].tolist() == [True, False, True]
+
+    with open(tmp_path / "props.csv", "w", newline="") as handle:
+        write_columns(batches, "csv", handle, schema)
+    with open(tmp_path / "props.csv") as handle:
+        rows = list(csv.DictReader(handle))
+    expected = json.loads(next(iter_results(lines[:1], fields=fields)))
+    assert float(rows[0]["Molecular weight"]) == expected["Molecular weight"]
+
+    structured = tmp_path / "props.npy"
+    write_columns(batches, "npy", str(structured), schema)
+    assert np.load(structured)["Index"].tolist() == [0, 1, 2]
+
+
+def test_failed_rows_are_masked_not_sentinels(tmp_path):
+    # A charge of -1 / a failed Lipinski check must not look like a bad SMILES
+    lines = ["acetate: CC(=O)[O-]", "bad: not_a_smiles", "big: " + "C" * 36]
+    fields = ("charge", "lipinski")
+    schema, masked = column_schema(fields), descriptor_columns(fields)
+    batches = list(iter_column_batches(lines, fields=fields))
+    path = tmp_path / "props.npz"
+    write_columns(batches, "npz", str(path), schema, masked)
+    table = np.load(path)
+    assert table["valid"].tolist() == [True, False, True]
+    assert table["Formal charge"][0] == -1
+    assert table["Lipinski pass"][[0, 2]].tolist() == [True, False]
+
+    with open(tmp_path / "props.csv", "w", newline="") as handle:
+        write_columns(batches, "csv", handle, schema, masked)
+    with open(tmp_path / "props.csv") as handle:
+        rows = list(csv.DictReader(handle))
+    assert [row["Formal charge"] for row in rows] == ["-1", "", "0"]
+
+    pq = pytest.importorskip("pyarrow.parquet")
+    write_columns(batches, "parquet", str(tmp_path / "props.parquet"), schema, masked)
+    columns = pq.read_table(tmp_path / "props.parquet").to_pydict()
+    assert columns["Formal charge"] == [-1, None, 0]
+    assert columns["Lipinski pass"] == [True, None, False]
+    assert columns["ID"] == ["acetate", "bad", "big"]
+
+
+def test_shared_memory_transport_matches_pipe():
+    lines = [f"mol{i}: {'C' * (i + 1)}O" for i in range(30)] + ["bad: C1CC"]
+    fields = ("formula", "mw", "heavy", "lipinski", "lipinski_details")
+    pipe = list(iter_column_batches(lines, 2, chunk_records=4, fields=fields))
+    shared = list(iter_column_batches(lines, 2, 4, fields=fields, transport="shm"))
+    assert len(shared) == len(pipe) == 8
+    for got, expected in zip(shared, pipe):
+        assert list(got) == list(expected)
+        for name in expected:
+            assert got[name].dtype == expected[name].dtype
+            np.testing.assert_array_equal(got[name], expected[name])
+
+
+def test_summary_merges_exactly_across_chunks_and_shards():
+    lines = [f"mol{i}: {'C' * (i % 7 + 1)}O{'N' * (i % 3)}" for i in range(40)]
+    lines.append("bad: C1CC")
+    whole = summarise_lines(lines, chunk_records=5).to_dict()
+    assert summarise_lines(lines, procs=2, chunk_records=5).to_dict() == whole
+    assert (whole["records"], whole["errors"]) == (41, 1)
+
+    records = [json.loads(out) for out in iter_results(lines[:-1])]
+    heavy = np.array([rec["Heavy atoms"] for rec in records])
+    stats = whole["fields"]["Heavy atoms"]
+    assert stats["mean"] == pytest.approx(heavy.mean())
+    assert stats["std"] == pytest.approx(heavy.std(ddof=1))
+    assert stats["quantiles"]["p50"] == np.percentile(heavy, 50, method="inverted_cdf")
+    mw = np.array([rec["Molecular weight"] for rec in records])
+    assert whole["fields"]["Molecular weight"]["std"] == pytest.approx(mw.std(ddof=1))
+    assert whole["flags"]["Lipinski pass"]["true"] == 40
+
+    shards = [summarise_lines(lines[:17]), summarise_lines(lines[17:])]
+    merged = PropertySummary()
+    for shard in shards:
+        merged.merge(PropertySummary.from_dict(json.loads(json.dumps(shard.to_dict()))))
+    merged_stats = merged.to_dict()["fields"]["Heavy atoms"]
+    assert merged_stats["histogram"] == stats["histogram"]
+    assert merged_stats["quantiles"] == stats["quantiles"]
+    assert merged_stats["std"] == pytest.approx(stats["std"])
+    assert merged.to_dict()["flags"] == whole["flags"]
+
+
+def test_where_and_top_k_select_inside_workers():
+    lines = [f"mol{i}: {'C' * (i % 9 + 1)}O{'N' * (i % 4)}" for i in range(30)]
+    lines.append("bad: C1CC")
+    every = [json.loads(out) for out in iter_results(lines)]
+    where = "heavy >= 4 and not tpsa > 60 and lipinski"
+    expected = [
+        json.dumps(rec)
+        for rec in every
+        if "error" not in rec and rec["Heavy atoms"] >= 4 and rec["TPSA"] <= 60
+    ]
+    assert list(iter_results(lines, procs=2, chunk_records=4, where=where)) == expected
+    assert len(select_records(every, where)) == len(expected)
+
+    ranked = sorted(every[:-1], key=lambda rec: (-rec["logP"], rec["Index"]))
+    top = [json.loads(out) for out in iter_results(lines, 2, 4, top=("logp", 5, False))]
+    assert top == ranked[:5]
+    (batch,) = iter_column_batches(lines, chunk_records=4, top=("logp", 3, True))
+    lowest = sorted(every[:-1], key=lambda rec: (rec["logP"], rec["Index"]))[:3]
+    assert batch["Index"].tolist() == [rec["Index"] for rec in lowest]
+
+    pipe = list(iter_column_batches(lines, 2, 4, fields=("mw", "tpsa"), where=where))
+    shared = list(
+        iter_column_batches(
+            lines, 2, 4, fields=("mw", "tpsa"), where=where, transport="shm"
+        )
+    )
+    for got, want in zip(shared, pipe):
+        for name in want:
+            np.testing.assert_array_equal(got[name], want[name])
+
+    assert where_fields("200 < mw < 900 or charge != 0", FIELDS) == ("mw", "charge")
+    for bad in ("__import__('os')", "mw.real > 1", "size > 3", "mw <"):
+        with pytest.raises(SelectionError):
+            where_fields(bad, FIELDS)
+
+
+def test_peptide_descriptors_from_record_ids():
+    seq = "GLFDIIKKIAESF"
+    props = peptide_properties(seq)
+    assert props["gravy"] == pytest.approx(
+        sum(KYTE_DOOLITTLE[aa] for aa in seq) / len(seq)
+    )
+    assert props["aliphatic"] == pytest.approx(100 * (1 + 3.9 * 4) / len(seq))
+    # termini 8.6 / 3.6, Asp 3.9, Glu 4.1, two Lys 10.8 (EMBOSS pKa)
+    expected = sum(
+        sign / (1 + 10 ** (sign * (7.4 - pka)))
+        for pka, sign in [(8.6, 1), (3.6, -1), (3.9, -1), (4.1, -1)] + [(10.8, 1)] * 2
+    )
+    assert peptide_properties(seq, ph=7.4)["net_charge"] == pytest.approx(expected)
+    assert abs(peptide_properties(seq, ph=props["pi"])["net_charge"]) < 1e-6
+    assert peptide_properties("kdk") == peptide_properties("KDK")
+    # cross-links consume groups: head-to-tail leaves only the Lys amine,
+    # SCNT (Glu side chain to N-terminus) only the C-terminus
+    assert peptide_properties("AKAAA", "HT")["net_charge"] == pytest.approx(1, abs=0.01)
+    batch = peptide_batch([("AAAEA", "SCXXXZX"), ("AAAEA", "")])
+    assert batch["net_charge"][0] == pytest.approx(-1, abs=0.01)
+    assert batch["net_charge"][1] < -1.01
+    assert np.isnan(peptide_properties("GGGG", "HT")["pi"])
+    assert net_charge(np.zeros((2, 12)), 7.0).tolist() == [0.0, 0.0]
+
+    lines = [f"{seq}-linear: CC", "AKAAA-HT: CCO", "plain: CCN"]
+    fields = ("net_charge", "pi", "gravy", "hmoment", "aliphatic")
+    serial = [json.loads(out) for out in iter_results(lines, fields=fields)]
+    assert serial[0]["GRAVY"] == round(props["gravy"], 2)
+    assert serial[1]["Net charge"] == round(
+        peptide_properties("AKAAA", "HT")["net_charge"], 2
+    )
+    assert serial[2]["Isoelectric point"] is None
+    assert [json.loads(out) for out in iter_results(lines, 2, 1, fields)] == serial
+
+
+def _cross_linked(seq, rng):
+    # Random SS/SC bond_def for seq, placing suitable residues by hand
+    # (independent of the can_* checks)
+    seq, codes = list(seq), ["X"] * len(seq)
+    kind = rng.choice(["SS", "SCNT", "SCCT", "SCSC"])
+    sites = rng.sample(range(len(seq)), 2)
+    roles = {"SS": "CC", "SCNT": "Z", "SCCT": "N", "SCSC": "ZE"}[kind]
+    letter_sets = {"C": "disulphide", "Z": "cterm", "N": "nterm", "E": "ester"}
+    for site, code in zip(sites, roles):
+        seq[site] = rng.choice(sorted(_CONSTRAINT_LETTER_SETS[letter_sets[code]]))
+        codes[site] = code
+    return "".join(seq), kind[:2] + "".join(codes)
+
+
+def test_additive_engine_matches_rdkit():
+    rng = random.Random(5)
+    letters = sorted(residue_vectors()[0])
+    library = ["".join(rng.choices(letters, k=rng.randint(2, 12))) for _ in range(60)]
+    records = [(seq, "") for seq in library[:20]]
+    records += [(seq, "HT") for seq in library[20:35]]
+    records += [_cross_linked(seq, rng) for seq in library[35:]]
+    batch = additive_batch(iter(records))  # any iterable, generators included
+    for row, (seq, bond_def) in enumerate(records):
+        mol = Chem.MolFromSmiles(constrained_peptide_smiles(list(seq), bond_def)[2])
+        assert batch["formula"][row] == CalcMolFormula(mol)
+        assert batch["mw"][row] == pytest.approx(Descriptors.MolWt(mol), abs=1e-6)
+        assert batch["heavy"][row] == mol.GetNumHeavyAtoms()
+        assert batch["hbd"][row] == Lipinski.NumHDonors(mol)
+        assert batch["hba"][row] == Lipinski.NumHAcceptors(mol)
+    assert additive_properties("PG", "linear")["formula"] == "C7H12N2O3"
+    empty = additive_batch(record for record in ())
+    assert empty["formula"] == [] and len(empty["mw"]) == 0
+
+
+def test_conformer_descriptors_are_opt_in_and_time_bounded():
+    assert not set(CONFORMER_FIELDS) & set(parse_fields("all"))
+    fields = parse_fields("mw,3d")
+    assert fields == ("mw",) + CONFORMER_FIELDS
+
+    lines = ["eth: CCO", "asp: CC(=O)Oc1ccccc1C(=O)O", "bad: C1CC"]
+    settings = ConformerSettings(count=4, time_limit=30)
+    serial = [
+        json.loads(out)
+        for out in iter_results(lines, fields=fields, conformers=settings)
+    ]
+    eth, asp, bad = serial
+    assert eth["Conformers"] == 1 and eth["Conformer energy range"] == 0
+    assert eth["Conformer timeout"] is False
+    assert 1 <= asp["Conformers"] <= 4
+    assert asp["Radius of gyration"] > eth["Radius of gyration"] > 0
+    assert 0 < asp["NPR1"] <= asp["NPR2"] <= 1
+    assert asp["3D PSA"] > eth["3D PSA"] > 0
+    assert "error" in bad
+    parallel = iter_results(lines, 2, 1, fields, conformers=settings)
+    assert [json.loads(out) for out in parallel] == serial
+    # the worker is a fresh process, so RDKit parse threads cannot wedge it
+    threaded = iter_results(lines, fields=fields, threads=2, conformers=settings)
+    assert [json.loads(out) for out in threaded] == serial
+
+    # a budget too small for even one conformer gives 0 and no values, and
+    # says so, unlike a molecule with no conformers to find
+    out = conformer_properties(make_mol("CCO"), ConformerSettings(time_limit=1e-9))
+    assert out["conformers"] == 0 and out["rg"] is None and out["timed_out"]
+
+
+def test_conformer_time_limit_bounds_large_macrocycles():
+    # ETKDG alone can spend tens of seconds on one 40-residue macrocycle
+    _, _, smiles = constrained_peptide_smiles("ACDEFGHIKLMNPQRSTVWY" * 2, "HT")
+    started = time.monotonic()
+    out = conformer_properties(make_mol(smiles), ConformerSettings(time_limit=2))
+    assert time.monotonic() - started < 3
+    assert (out["conformers"] == 0) == (out["rg"] is None)
+    assert out["timed_out"]
+    # the worker killed at the deadline is replaced for the next molecule
+    assert conformer_properties(make_mol("CCO"))["conformers"] == 1
+
+
+def test_light_fields_skip_full_sanitisation():
+    light = ("formula", "mw", "heavy", "charge", "net_charge")
+    assert parse_profile(light) != Chem.SanitizeFlags.SANITIZE_ALL
+    assert parse_profile(light + ("logp",)) == Chem.SanitizeFlags.SANITIZE_ALL
+    assert parse_profile(DEFAULT_FIELDS) == Chem.SanitizeFlags.SANITIZE_ALL
+
+    smiles = ["C1=CC=CC=C1", "c1ccc2[nH]ccc2c1", "CN(=O)=O", "[H]OC", "C[NH3+]"]
+    for smi in smiles:
+        full = molecule_summary_from_mol(smi, make_mol(smi), light)
+        assert molecule_summary(smi, light) == full
+    # valence and kekulisation errors fail the light parse too
+    lines = ["a: C(C)(C)(C)(C)C", "b: n1cccc1", "c: c1cccc1", "d: CCO"]
+    records = [json.loads(out) for out in iter_results(lines, fields=light)]
+    assert ["error" in rec for rec in records] == [True, True, True, False]
+    assert records[3]["Formula"] == "C2H6O"
+
+
+def test_property_cache_hits_by_canonical_identity(tmp_path):
+    path = str(tmp_path / "props.db")
+    lines = ["a: OCC", "b: CCO", "c: c1ccccc1", "d: bad(("]
+    cache = PropertyCache(path)
+    first = list(iter_results(lines, cache=cache))
+    assert (cache.hits, cache.misses, len(cache)) == (0, 3, 2)
+
+    cache = PropertyCache(path, max_entries=1)
+    second = list(iter_results(lines, cache=cache, procs=2))
+    assert second == first == list(iter_results(lines))
+    assert (cache.hits, cache.misses) == (3, 0)
+    assert len(cache) == 1 and cache.evictions == 1
+    assert "hit rate 100.0%" in cache.describe()
+    # the row count is tracked, not re-counted; a stored key is replaced
+    (kept,) = cache.conn.execute("SELECT key FROM props").fetchone()
+    cache.update(",".join(DEFAULT_FIELDS), [], [(kept, "{}"), ("CCN", "{}")], 2)
+    (rows,) = cache.conn.execute("SELECT COUNT(*) FROM props").fetchone()
+    assert len(cache) == rows == 1 and cache.evictions == 2
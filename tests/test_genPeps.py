@@ -1,10 +1,32 @@
+import json
+
+import numpy as np
+import pytest
+from rdkit import Chem
+
 from p2smi.genPeps import (
     CONSTRAINTS,
+    build_code_table,
     build_sequence,
+    build_sequence_batch,
+    constraint_feasible,
     calculate_amino_acid_counts,
     generate_sequences,
     get_amino_acid_lists,
+    get_site_pools,
+    iter_sequences,
+    iter_sequences_batched,
+    iter_sharded_sequences,
+    load_profile,
+    parse_window,
+    output_sequences,
+    iter_peptide_smiles,
+    place_constraint_sites,
 )
+from p2smi.utilities.residueprops import estimate_properties, exact_properties
+from p2smi.utilities.membership import ScalableBloomFilter, make_unique_filter
+from p2smi.utilities.sampling import AliasTable
+from p2smi.utilities.smilesgen import _CONSTRAINT_LETTER_SETS
 
 
 def test_calculate_amino_acid_counts_sum():
@@ -40,3 +62,251 @@ def test_CONSTRAINTS():
         isinstance(constraint, str) for constraint in CONSTRAINTS
     )  # Check if all constraints are strings
     assert len(CONSTRAINTS) > 0  # Ensure there are some constraints defined
+
+
+def test_iter_sequences_is_lazy():
+    records = iter_sequences(3, 5, 5, 0.0, 0.0, constraints=["HT"])
+    assert not isinstance(records, dict)
+    seq_id, seq = next(records)
+    assert seq_id == "seq_1|HT"
+    assert len(seq) == 5
+    assert len(list(records)) == 2
+
+
+def test_output_sequences_streams_fasta(tmp_path):
+    out = tmp_path / "peptides.fasta"
+    count = output_sequences(iter_sequences(5000, 4, 6, 0.1, 0.1, []), str(out))
+    lines = out.read_text().splitlines()
+    assert count == 5000
+    assert len(lines) == 10000
+    assert lines[0] == ">seq_1"
+    assert lines[-2] == ">seq_5000"
+
+
+def test_build_sequence_batch_respects_pools():
+    amino_lists = get_amino_acid_lists()
+    rng = np.random.default_rng(0)
+    seqs = build_sequence_batch(rng, 50, 12, 0.0, 1.0, build_code_table(amino_lists))
+    assert len(seqs) == 50
+    assert all(len(seq) == 12 for seq in seqs)
+    assert all(aa in amino_lists[1] for seq in seqs for aa in seq)
+
+
+def test_iter_sequences_batched_ids_and_lengths():
+    records = list(
+        iter_sequences_batched(
+            25,
+            8,
+            14,
+            0.3,
+            0.3,
+            ["SS", "HT"],
+            batch_size=10,
+            rng=np.random.default_rng(1),
+        )
+    )
+    assert [seq_id.split("|")[0] for seq_id, _ in records] == [
+        f"seq_{i}" for i in range(1, 26)
+    ]
+    assert all(seq_id.split("|")[1] in {"SS", "HT"} for seq_id, _ in records)
+    assert all(8 <= len(seq) <= 14 for _, seq in records)
+
+
+def test_iter_sharded_sequences_seed_is_worker_independent():
+    def run(engine, workers):
+        return list(
+            iter_sharded_sequences(
+                30,
+                5,
+                9,
+                0.2,
+                0.2,
+                CONSTRAINTS,
+                engine=engine,
+                shard_size=7,
+                seed=123,
+                workers=workers,
+            )
+        )
+
+    for engine in ("numpy", "python"):
+        serial = run(engine, 1)
+        assert len(serial) == 30
+        assert serial[-1][0].startswith("seq_30|")
+        assert run(engine, 3) == serial
+    assert run("numpy", 1) != list(
+        iter_sharded_sequences(30, 5, 9, 0.2, 0.2, CONSTRAINTS, shard_size=7, seed=124)
+    )
+
+
+def _cyclizes(seq, constraint):
+    # Independent restatement of the smilesgen.can_* site rules
+    sites = _CONSTRAINT_LETTER_SETS
+    partner = sites["nterm"] | sites["ester"]
+    dis = [i for i, aa in enumerate(seq) if aa in sites["disulphide"]]
+    acid = [i for i, aa in enumerate(seq) if aa in sites["cterm"]]
+    base = [i for i, aa in enumerate(seq) if aa in partner]
+    return {
+        "SS": len(dis) > 1 and dis[-1] - dis[0] >= 3,
+        "HT": len(seq) >= 5 or len(seq) == 2,
+        "SCNT": any(i >= 3 for i in acid),
+        "SCCT": any(i < len(seq) - 3 for i in base),
+        "SCSC": any(abs(i - j) >= 2 for i in acid for j in base),
+    }[constraint]
+
+
+def test_guaranteed_constraints_always_cyclize():
+    for engine in ("numpy", "python"):
+        records = iter_sharded_sequences(
+            500, 2, 9, 0.3, 0.3, CONSTRAINTS, engine=engine, seed=5, guaranteed=True
+        )
+        for seq_id, seq in records:
+            if "|" in seq_id:
+                assert _cyclizes(seq, seq_id.split("|")[1])
+            else:
+                assert not any(constraint_feasible(c, len(seq)) for c in CONSTRAINTS)
+
+
+def test_place_constraint_sites_keeps_pools():
+    amino_lists = get_amino_acid_lists()
+    seq = build_sequence(12, 0.0, 1.0, amino_lists)
+    placed = place_constraint_sites(seq, "SS", amino_lists, get_site_pools(amino_lists))
+    assert _cyclizes(placed, "SS")
+    assert all(aa in amino_lists[1] for aa in placed)
+
+
+def test_alias_table_matches_weights():
+    table = AliasTable([1, 0, 3])
+    draws = table.draw(np.random.default_rng(0), 40000)
+    freqs = np.bincount(draws, minlength=3) / len(draws)
+    assert freqs[1] == 0
+    assert abs(freqs[2] - 0.75) < 0.02
+    assert set(table.sample(np.random.default_rng(1), 100)) <= {0, 2}
+
+
+def test_profile_weights_and_positions(tmp_path):
+    path = tmp_path / "profile.json"
+    path.write_text(json.dumps({"weights": {"A": 1, "G": 0}}))
+    profile = load_profile(str(path))
+    for engine in ("numpy", "python"):
+        records = iter_sharded_sequences(
+            50, 8, 8, 0.0, 0.0, [], engine=engine, seed=2, profile=profile
+        )
+        assert all("G" not in seq for _, seq in records)
+
+    matrix = {"positions": [{"C": 1}, {"K": 1, "R": 1}, {"W": 1}]}
+    for engine in ("numpy", "python"):
+        records = iter_sharded_sequences(
+            20, 3, 3, 0.5, 0.5, [], engine=engine, seed=2, profile=matrix
+        )
+        assert all(
+            seq[0] == "C" and seq[1] in "KR" and seq[2] == "W" for _, seq in records
+        )
+    with pytest.raises(ValueError):
+        list(iter_sequences(1, 4, 4, 0, 0, [], profile=matrix))
+
+
+def test_unique_mode_emits_no_duplicates():
+    for mode in ("exact", "bloom"):
+        unique = make_unique_filter(mode, 300)
+        records = list(
+            iter_sharded_sequences(
+                300, 3, 3, 0.0, 0.0, ["HT"], shard_size=64, seed=4, unique=unique
+            )
+        )
+        seqs = [seq for _, seq in records]
+        assert len(seqs) == 300
+        assert len(set(seqs)) == 300
+        assert [seq_id for seq_id, _ in records][-1] == "seq_300|HT"
+
+
+def test_unique_mode_stops_when_space_is_exhausted():
+    records = list(
+        iter_sharded_sequences(
+            1000, 1, 1, 0.0, 0.0, [], seed=4, unique=make_unique_filter("auto", 1000)
+        )
+    )
+    assert sorted(seq for _, seq in records) == get_amino_acid_lists()[0]
+
+
+def test_unique_filter_only_sees_written_records():
+    # The filter must stop at the last written record, not absorb whole shards
+    stream = iter_sharded_sequences(4096, 1, 1, 0.0, 0.0, [], seed=4)
+    seen = set()
+    for offered, (_, seq) in enumerate(stream, 1):
+        seen.add(seq)
+        if len(seen) == 15:
+            break
+    for mode in ("exact", "bloom"):
+        unique = make_unique_filter(mode, 15)
+        records = list(
+            iter_sharded_sequences(15, 1, 1, 0.0, 0.0, [], seed=4, unique=unique)
+        )
+        assert len(records) == 15
+        assert unique.count == 15
+        assert unique.rejected == offered - 15
+        assert " of 15 items" in unique.describe()
+    assert len(unique.filters) == 1
+
+
+def test_scalable_bloom_filter_grows_within_error_budget():
+    bloom = ScalableBloomFilter(100, fp_rate=0.01)
+    fresh = bloom.add_many([str(i) for i in range(1000)] + ["0", "1"])
+    assert len(bloom.filters) > 1
+    assert fresh[:1000].sum() > 990
+    assert not fresh[1000:].any()
+    assert bloom.false_positive_rate < 0.01
+
+
+def test_parse_window():
+    assert parse_window("500:1500") == (500.0, 1500.0)
+    assert parse_window(":-1") == (None, -1.0)
+    with pytest.raises(ValueError):
+        parse_window("500")
+
+
+def test_property_targets_are_enforced_while_sampling():
+    targets = {"mw": (900, 1100), "charge": (1, None)}
+    for engine in ("numpy", "python"):
+        records = iter_sharded_sequences(
+            40, 6, 14, 0.2, 0.2, [], engine=engine, seed=9, targets=targets
+        )
+        for _, seq in records:
+            estimate = estimate_properties(seq)
+            assert 900 <= estimate["mw"] <= 1100
+            assert estimate["charge"] >= 1
+            assert abs(exact_properties(seq)["mw"] - estimate["mw"]) < 1e-6
+
+
+def test_property_targets_exact_check():
+    targets = {"logp": (None, -3.0)}
+    records = iter_sharded_sequences(
+        20, 8, 12, 0.3, 0.0, [], seed=9, targets=targets, exact_check=True
+    )
+    assert all(exact_properties(seq)["logp"] <= -3.0 for _, seq in records)
+
+
+def test_output_sequences_writes_smiles_directly(tmp_path):
+    out = tmp_path / "peptides.p2smi"
+    records = list(iter_sharded_sequences(50, 5, 9, 0.2, 0.2, [], seed=4))
+    count = output_sequences(iter(records), str(out), output_format="smiles")
+    lines = out.read_text().splitlines()
+    assert count == len(lines) == 50
+    for (_, seq), line in zip(records, lines):
+        name, smiles = line.split(": ")
+        assert name == f"{seq}-linear"
+        assert Chem.MolFromSmiles(smiles) is not None
+    seq, bond_def, smiles = next(iter_peptide_smiles(records))
+    assert (seq, bond_def) == (records[0][1], "")
+
+
+def test_cli_rejects_empty_shards_and_workers(monkeypatch, capsys):
+    import sys
+
+    from p2smi.genPeps import main
+
+    for option in ("--batch_size", "--workers"):
+        monkeypatch.setattr(sys, "argv", ["generate-peptides", option, "0"])
+        with pytest.raises(SystemExit):
+            main()
+        assert "must be at least 1" in capsys.readouterr().err